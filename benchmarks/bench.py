@@ -0,0 +1,142 @@
+"""Benchmark ``quote_play`` end to end against the local FakeYou stand-in.
+
+Runs batches of unique quotes at each concurrency level and reports
+end-to-end latency percentiles, status polls per job and throughput. The
+audio cache is off and audio goes to the ``null`` backend, so the numbers
+cover the FakeYou round trips and the download only::
+
+    python benchmarks/bench.py --concurrency 1,4,16 --requests 32
+    python benchmarks/bench.py --queue-delay 2 --poll-429-rate 0.1 --json
+
+Pass ``--api-url`` to benchmark a stand-in (or API) that is already running.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "src"))
+
+from fakeyou_stub import FakeYouStub, StubConfig  # noqa: E402
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Return the ``pct`` percentile of ``values`` by linear interpolation."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def fetch_stats(api_url: str) -> dict:
+    with urllib.request.urlopen(f"{api_url}/__stats") as response:
+        return json.loads(response.read())
+
+
+async def run_level(concurrency: int, requests: int, api_url: str, run: int) -> dict:
+    """Run ``requests`` quote_play calls, ``concurrency`` at a time."""
+    from fakeyou import close_http_client
+    from tools.quote_play import quote_play
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    errors = 0
+
+    async def one(index: int) -> None:
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            result = await quote_play(f"Benchmark quote {run}-{index}, this is.")
+            latencies.append(time.perf_counter() - started)
+            errors += bool(result.get("isError"))
+
+    before = fetch_stats(api_url)
+    started = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(requests)))
+    wall_time = time.perf_counter() - started
+    after = fetch_stats(api_url)
+    await close_http_client()
+
+    jobs = after["jobs"] - before["jobs"]
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "p50": round(percentile(latencies, 50), 3),
+        "p95": round(percentile(latencies, 95), 3),
+        "p99": round(percentile(latencies, 99), 3),
+        "max": round(max(latencies), 3),
+        "polls_per_job": round((after["polls"] - before["polls"]) / max(jobs, 1), 2),
+        "rate_limited": after["rate_limited"] - before["rate_limited"],
+        "throughput": round(requests / wall_time, 2),
+        "wall_time": round(wall_time, 3),
+    }
+
+
+def print_table(results: list[dict]) -> None:
+    columns = list(results[0])
+    print("  ".join(f"{column:>13}" for column in columns))
+    for row in results:
+        print("  ".join(f"{row[column]:>13}" for column in columns))
+
+
+def main(argv: list[str] | None = None) -> list[dict]:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--concurrency",
+        default="1,4,16",
+        help="Comma-separated concurrency levels",
+    )
+    parser.add_argument(
+        "--requests", type=int, default=32, help="Calls per concurrency level"
+    )
+    parser.add_argument("--api-url", help="Use a stand-in that is already running")
+    parser.add_argument("--json", action="store_true", help="Print JSON results")
+    defaults = StubConfig()
+    for name in ("queue_delay", "synth_delay", "jitter", "fail_rate"):
+        parser.add_argument("--" + name.replace("_", "-"), type=float)
+    for name in ("post_429_rate", "poll_429_rate", "retry_after", "clip_seconds"):
+        parser.add_argument("--" + name.replace("_", "-"), type=float)
+    args = parser.parse_args(argv)
+
+    overrides = {
+        name: getattr(args, name)
+        for name in vars(defaults)
+        if getattr(args, name, None) is not None
+    }
+    stub = None
+    api_url = args.api_url
+    if api_url is None:
+        stub = FakeYouStub(StubConfig(**overrides)).start()
+        api_url = stub.url
+
+    os.environ["YODA_FAKEYOU_API_URL"] = api_url
+    os.environ.setdefault("YODA_CACHE_ENABLED", "0")
+    os.environ.setdefault("YODA_AUDIO_BACKEND", "null")
+    try:
+        results = [
+            asyncio.run(run_level(int(level), args.requests, api_url, run))
+            for run, level in enumerate(args.concurrency.split(","))
+        ]
+    finally:
+        if stub is not None:
+            stub.stop()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+"""A local stand-in for the FakeYou API, for offline benchmarks and tests.
+
+It emulates the three endpoints the server uses:
+
+* ``POST /tts/inference`` queues a job and returns its token;
+* ``GET /v1/model_inference/job_status/<token>`` walks the job through
+  ``pending`` -> ``started`` -> ``complete_success`` (or ``failed``) as time
+  passes;
+* ``GET /cdn/<token>.wav`` serves the finished clip, a generated sine tone.
+
+Queue and synthesis delays, failure and 429 rates are configurable, and
+``GET /__stats`` returns request counters. Point the server at it with
+``YODA_FAKEYOU_API_URL``::
+
+    python benchmarks/fakeyou_stub.py --port 8765 --queue-delay 2
+    YODA_FAKEYOU_API_URL=http://127.0.0.1:8765 python src/server.py
+"""
+
+import argparse
+import io
+import json
+import math
+import random
+import re
+import struct
+import threading
+import time
+import uuid
+import wave
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+POST_PATH = "/tts/inference"
+STATUS_PATH = "/v1/model_inference/job_status/"
+CDN_PATH = "/cdn/"
+
+
+@dataclass
+class StubConfig:
+    """How the stand-in behaves; delays are in seconds."""
+
+    # Time a job sits in "pending" before it is picked up
+    queue_delay: float = 0.5
+    # Time a job spends "started" before it completes
+    synth_delay: float = 0.3
+    # Random +/- fraction applied to both delays
+    jitter: float = 0.2
+    # Fraction of jobs that end "failed"
+    fail_rate: float = 0.0
+    # Fraction of POSTs and of status polls answered with a 429
+    post_429_rate: float = 0.0
+    poll_429_rate: float = 0.0
+    retry_after: float = 1.0
+    # Length and sample rate of the generated clip
+    clip_seconds: float = 1.0
+    sample_rate: int = 22050
+    seed: int | None = None
+
+
+@dataclass
+class StubJob:
+    token: str
+    text: str
+    model_token: str
+    submitted_at: float
+    queue_delay: float
+    synth_delay: float
+    fails: bool
+    # Counted in the stats once it reached a final status
+    counted: bool = False
+
+
+@dataclass
+class StubStats:
+    posts: int = 0
+    polls: int = 0
+    downloads: int = 0
+    rate_limited: int = 0
+    completed: int = 0
+    failed: int = 0
+    # Job tokens in submission order
+    jobs: list[str] = field(default_factory=list)
+
+
+def make_clip(seconds: float, sample_rate: int) -> bytes:
+    """Return a mono 16-bit wav of a 220 Hz tone."""
+    frames = int(seconds * sample_rate)
+    samples = (
+        int(8000 * math.sin(2 * math.pi * 220 * i / sample_rate)) for i in range(frames)
+    )
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(struct.pack(f"<{frames}h", *samples))
+    return buffer.getvalue()
+
+
+class FakeYouStub:
+    """Serve the stand-in API on a background thread."""
+
+    def __init__(
+        self, config: StubConfig | None = None, host: str = "127.0.0.1", port: int = 0
+    ):
+        self.config = config or StubConfig()
+        self.stats = StubStats()
+        self.jobs: dict[str, StubJob] = {}
+        self._rng = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self._clip = make_clip(self.config.clip_seconds, self.config.sample_rate)
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        """Base URL to use as ``YODA_FAKEYOU_API_URL``."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeYouStub":
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="fakeyou-stub", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeYouStub":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def _chance(self, rate: float) -> bool:
+        with self._lock:
+            return self._rng.random() < rate
+
+    def _jittered(self, delay: float) -> float:
+        with self._lock:
+            spread = self.config.jitter * (2 * self._rng.random() - 1)
+        return max(0.0, delay * (1 + spread))
+
+    def submit(self, body: dict) -> StubJob:
+        job = StubJob(
+            token=f"jinf_{uuid.uuid4().hex}",
+            text=body.get("inference_text", ""),
+            model_token=body.get("tts_model_token", ""),
+            submitted_at=time.monotonic(),
+            queue_delay=self._jittered(self.config.queue_delay),
+            synth_delay=self._jittered(self.config.synth_delay),
+            fails=self._chance(self.config.fail_rate),
+        )
+        with self._lock:
+            self.jobs[job.token] = job
+            self.stats.posts += 1
+            self.stats.jobs.append(job.token)
+        return job
+
+    def job_state(self, job: StubJob) -> dict:
+        """Return the ``state`` object FakeYou would report for ``job`` now."""
+        elapsed = time.monotonic() - job.submitted_at
+        if elapsed < job.queue_delay:
+            status, attempt_count, result = "pending", 0, None
+        elif elapsed < job.queue_delay + job.synth_delay:
+            status, attempt_count, result = "started", 1, None
+        elif job.fails:
+            status, attempt_count, result = "failed", 1, None
+        else:
+            status, attempt_count = "complete_success", 1
+            result = {
+                "media_links": {"cdn_url": f"{self.url}{CDN_PATH}{job.token}.wav"}
+            }
+        state = {
+            "job_token": job.token,
+            "status": {"status": status, "attempt_count": attempt_count},
+            "maybe_result": result,
+        }
+        if status == "failed":
+            state["error"] = "Synthesis failed in the stand-in"
+        return state
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, code, body: bytes, content_type: str, headers=None):
+                self.send_response(code)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _json(self, code, payload, headers=None):
+                body = json.dumps(payload).encode("utf-8")
+                self._send(code, body, "application/json", headers)
+
+            def _rate_limited(self, rate: float) -> bool:
+                if not stub._chance(rate):
+                    return False
+                with stub._lock:
+                    stub.stats.rate_limited += 1
+                self._json(
+                    429,
+                    {"success": False, "error_reason": "Too many requests"},
+                    {"Retry-After": f"{stub.config.retry_after:g}"},
+                )
+                return True
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if self.path != POST_PATH:
+                    self._json(404, {"success": False})
+                elif not self._rate_limited(stub.config.post_429_rate):
+                    job = stub.submit(body)
+                    self._json(200, {"success": True, "inference_job_token": job.token})
+
+            def do_GET(self):
+                if self.path.startswith(STATUS_PATH):
+                    token = self.path[len(STATUS_PATH) :]
+                    job = stub.jobs.get(token)
+                    if job is None:
+                        self._json(404, {"success": False})
+                        return
+                    if self._rate_limited(stub.config.poll_429_rate):
+                        return
+                    state = stub.job_state(job)
+                    with stub._lock:
+                        stub.stats.polls += 1
+                        status = state["status"]["status"]
+                        if status in ("complete_success", "failed"):
+                            # Count each job once, on its first terminal poll
+                            if not job.counted:
+                                job.counted = True
+                                if status == "failed":
+                                    stub.stats.failed += 1
+                                else:
+                                    stub.stats.completed += 1
+                    self._json(200, {"success": True, "state": state})
+                elif match := re.fullmatch(rf"{CDN_PATH}(\w+)\.wav", self.path):
+                    if match.group(1) not in stub.jobs:
+                        self._send(404, b"<html>Not found</html>", "text/html")
+                        return
+                    with stub._lock:
+                        stub.stats.downloads += 1
+                    self._send(200, stub._clip, "audio/wav")
+                elif self.path == "/__stats":
+                    with stub._lock:
+                        stats = {**vars(stub.stats), "jobs": len(stub.stats.jobs)}
+                    self._json(200, stats)
+                else:
+                    self._json(404, {"success": False})
+
+        return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    defaults = StubConfig()
+    for name, value in vars(defaults).items():
+        flag = "--" + name.replace("_", "-")
+        kind = int if name in ("sample_rate", "seed") else float
+        parser.add_argument(flag, type=kind, default=value)
+    args = parser.parse_args()
+    config = StubConfig(**{name: getattr(args, name) for name in vars(defaults)})
+    stub = FakeYouStub(config, args.host, args.port)
+    print(f"FakeYou stand-in listening on {stub.url}")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,646 @@
+"""Local audio output: the available backends and the manager that picks one.
+
+Rather than trying pygame, simpleaudio and several system players on every
+clip, :class:`AudioBackends` probes the candidates once, on first use, and
+keeps playing through the first one that works. A backend that fails
+``YODA_AUDIO_MAX_FAILURES`` clips in a row is demoted behind the others until
+the next probe. Backends stay warm between clips: the pygame mixer stays open
+and the Linux raw-PCM players keep their process running while the format
+does not change.
+
+``YODA_AUDIO_BACKEND`` picks the backends to use, in order, e.g. ``aplay`` or
+``pygame,simpleaudio``. ``null`` discards audio and ``file`` writes every clip
+to ``YODA_AUDIO_SINK_DIR``, for headless servers.
+"""
+
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from dataclasses import asdict, dataclass
+
+from audio_stream import AudioStream, WavFormat, wav_header
+from config import data_dir, env_int, env_str
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_FAILURES = 3
+
+# Seconds of audio handed to a player at a time when streaming
+STREAM_CHUNK_SECONDS = 0.25
+
+# Extra time allowed for a piped player to drain its device buffer
+PIPE_DRAIN_SECONDS = 0.2
+
+
+class AudioBackend:
+    """One way of getting sound out of the speakers.
+
+    Subclasses raise on failure; :class:`AudioBackends` turns that into a
+    fallback to the next backend.
+    """
+
+    name = ""
+
+    def __init__(self):
+        self._stopping = threading.Event()
+        self._started_at: float | None = None
+
+    def probe(self) -> None:
+        """Check the backend can be used here and warm it up.
+
+        Raises:
+            Exception: if the backend is unavailable.
+        """
+
+    def play(self, source: str | AudioStream) -> None:
+        """Play a wav file or stream to the end, or until :meth:`stop`."""
+        self._stopping.clear()
+        self._started_at = None
+        if isinstance(source, AudioStream):
+            self.play_stream(source)
+        else:
+            self.play_file(source)
+
+    def play_file(self, path: str) -> None:
+        with open(path, "rb") as f:
+            self.play_stream(AudioStream(f.read()))
+
+    def play_stream(self, stream: AudioStream) -> None:
+        raise NotImplementedError
+
+    def stop(self) -> None:
+        """Interrupt the clip being played."""
+        self._stopping.set()
+        self._interrupt()
+
+    def _interrupt(self) -> None:
+        pass
+
+    def close(self) -> None:
+        """Release the mixer or player process kept warm between clips."""
+
+    @property
+    def started_at(self) -> float | None:
+        """When the clip being played reached the device (monotonic), if yet."""
+        return self._started_at
+
+    def _mark_started(self) -> None:
+        """Record that the first audio was handed to the device."""
+        if self._started_at is None:
+            self._started_at = time.monotonic()
+
+    def _wait(self, busy, interval: float = 0.05) -> None:
+        """Sleep while ``busy()`` holds and no stop was requested."""
+        while busy() and not self._stopping.is_set():
+            time.sleep(interval)
+
+
+def _to_16_bit(fmt: WavFormat, pcm: bytes) -> bytes:
+    """Convert 24/32-bit samples to 16-bit for players that cannot take them."""
+    if fmt.sample_width in (1, 2):
+        return pcm
+    with warnings.catch_warnings():
+        # Deprecated, but in the standard library for every Python we support
+        warnings.simplefilter("ignore", DeprecationWarning)
+        import audioop
+
+    return audioop.lin2lin(pcm, fmt.sample_width, 2)
+
+
+class PygameBackend(AudioBackend):
+    """Play through the pygame mixer, which stays open between clips."""
+
+    name = "pygame"
+
+    def __init__(self):
+        super().__init__()
+        self._mixer = None
+
+    def probe(self) -> None:
+        # pygame prints a banner on import, which would corrupt stdio transport
+        os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+        import pygame
+
+        if not pygame.mixer.get_init():
+            pygame.mixer.init()
+        self._mixer = pygame.mixer
+
+    def play_file(self, path: str) -> None:
+        music = self._mixer.music
+        music.load(path)
+        music.play()
+        self._mark_started()
+        self._wait(music.get_busy, 0.1)
+        music.stop()
+
+    def play_stream(self, stream: AudioStream) -> None:
+        """Queue PCM on a mixer channel in short buffers as it arrives."""
+        fmt = stream.format()
+        self._ensure_mixer(fmt)
+        channel = self._mixer.find_channel(True)
+        chunk = int(fmt.frame_rate * STREAM_CHUNK_SECONDS) * fmt.frame_size
+        for pcm in stream.iter_pcm(chunk):
+            sound = self._mixer.Sound(buffer=_to_16_bit(fmt, pcm))
+            self._wait(lambda: channel.get_queue() is not None, 0.01)
+            if self._stopping.is_set():
+                break
+            if channel.get_busy():
+                channel.queue(sound)
+            else:
+                channel.play(sound)
+                self._mark_started()
+        self._wait(channel.get_busy)
+        channel.stop()
+
+    def _ensure_mixer(self, fmt: WavFormat) -> None:
+        """Re-open the mixer only when the clip's format differs from the last."""
+        size = 8 if fmt.sample_width == 1 else -16
+        if self._mixer.get_init() != (fmt.frame_rate, size, fmt.channels):
+            self._mixer.quit()
+            self._mixer.init(frequency=fmt.frame_rate, size=size, channels=fmt.channels)
+
+    def _interrupt(self) -> None:
+        self._mixer.stop()
+        self._mixer.music.stop()
+
+    def close(self) -> None:
+        if self._mixer is not None:
+            self._mixer.quit()
+
+
+class SimpleaudioBackend(AudioBackend):
+    """Play whole clips from memory with simpleaudio."""
+
+    name = "simpleaudio"
+
+    def __init__(self):
+        super().__init__()
+        self._sa = None
+
+    def probe(self) -> None:
+        import simpleaudio
+
+        self._sa = simpleaudio
+
+    def play_file(self, path: str) -> None:
+        play_obj = self._sa.WaveObject.from_wave_file(path).play()
+        self._mark_started()
+        play_obj.wait_done()
+
+    def play_stream(self, stream: AudioStream) -> None:
+        fmt = stream.format()
+        play_obj = self._sa.play_buffer(
+            stream.pcm(), fmt.channels, fmt.sample_width, fmt.frame_rate
+        )
+        self._mark_started()
+        play_obj.wait_done()
+
+    def _interrupt(self) -> None:
+        self._sa.stop_all()
+
+
+class PcmPipeBackend(AudioBackend):
+    """Feed raw PCM to a long-running system player such as ``aplay``.
+
+    The player process is kept running between clips of the same format, so
+    only the first clip pays for the process start.
+    """
+
+    def __init__(self, name: str, command, formats: dict[int, str]):
+        """
+        Args:
+            name: Backend name, also the executable that must be on PATH.
+            command: Builds the argv from ``(sample_format, channels, rate)``.
+            formats: The player's sample format name per sample width.
+        """
+        super().__init__()
+        self.name = name
+        self._command = command
+        self._formats = formats
+        self._process: subprocess.Popen | None = None
+        self._process_format: tuple | None = None
+        self._lock = threading.Lock()
+
+    def probe(self) -> None:
+        if shutil.which(self.name) is None:
+            raise FileNotFoundError(f"{self.name} is not installed")
+
+    def play_stream(self, stream: AudioStream) -> None:
+        fmt = stream.format()
+        process = self._process_for(fmt)
+        chunk = int(fmt.frame_rate * STREAM_CHUNK_SECONDS) * fmt.frame_size
+        frames = 0
+        try:
+            for pcm in stream.iter_pcm(chunk):
+                if self._stopping.is_set():
+                    return
+                self._mark_started()
+                process.stdin.write(pcm)
+                process.stdin.flush()
+                frames += len(pcm) // fmt.frame_size
+        except (BrokenPipeError, ValueError) as e:
+            self._kill()
+            if self._stopping.is_set():
+                return
+            raise OSError(f"{self.name} exited: {e}") from e
+        if frames == 0:
+            return
+        # The pipe only blocks once the device buffer is full, so wait out the
+        # rest of the clip before the next one is written behind it
+        end = self._started_at + frames / fmt.frame_rate + PIPE_DRAIN_SECONDS
+        self._wait(lambda: time.monotonic() < end)
+        if process.poll() is not None and not self._stopping.is_set():
+            self._kill()
+            raise OSError(f"{self.name} exited with status {process.returncode}")
+
+    def _process_for(self, fmt: WavFormat) -> subprocess.Popen:
+        """Return the warm player process for ``fmt``, starting one if needed."""
+        key = (fmt.sample_width, fmt.channels, fmt.frame_rate)
+        with self._lock:
+            process = self._process
+            if process is not None and (
+                process.poll() is not None or self._process_format != key
+            ):
+                self._kill_locked()
+                process = None
+            if process is None:
+                sample_format = self._formats[fmt.sample_width]
+                process = subprocess.Popen(
+                    self._command(sample_format, fmt.channels, fmt.frame_rate),
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                )
+                self._process, self._process_format = process, key
+            return process
+
+    def _interrupt(self) -> None:
+        # Killing the player also drops the audio still in its buffer
+        self._kill()
+
+    def _kill(self) -> None:
+        with self._lock:
+            self._kill_locked()
+
+    def _kill_locked(self) -> None:
+        process, self._process = self._process, None
+        if process is None:
+            return
+        process.kill()
+        try:
+            process.stdin.close()
+        except OSError:
+            pass
+        process.wait()
+
+    def close(self) -> None:
+        self._kill()
+
+
+class CommandBackend(AudioBackend):
+    """Play each clip with a one-shot system command that reads a wav file."""
+
+    def __init__(self, name: str, command):
+        """
+        Args:
+            name: Backend name, also the executable that must be on PATH.
+            command: Builds the argv for a wav file path.
+        """
+        super().__init__()
+        self.name = name
+        self._command = command
+        self._process: subprocess.Popen | None = None
+
+    def probe(self) -> None:
+        if shutil.which(self.name) is None:
+            raise FileNotFoundError(f"{self.name} is not installed")
+
+    def play_file(self, path: str) -> None:
+        process = subprocess.Popen(
+            self._command(path), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        self._process = process
+        self._mark_started()
+        try:
+            returncode = process.wait()
+        finally:
+            self._process = None
+        if returncode != 0 and not self._stopping.is_set():
+            raise OSError(f"{self.name} exited with status {returncode}")
+
+    def play_stream(self, stream: AudioStream) -> None:
+        # These players only read files, so this is the one playback disk write
+        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp_file:
+            try:
+                fmt = stream.format()
+            except ValueError:
+                # Not a wav the player can be helped with; hand it over as is
+                fmt = None
+            if fmt is not None and fmt.data_size is None:
+                # Joined streams are open-ended; give file players real sizes
+                pcm = stream.pcm()
+                tmp_file.write(
+                    wav_header(fmt.channels, fmt.sample_width, fmt.frame_rate, len(pcm))
+                )
+                tmp_file.write(pcm)
+            else:
+                tmp_file.write(stream.getvalue())
+        try:
+            self.play_file(tmp_file.name)
+        finally:
+            os.unlink(tmp_file.name)
+
+    def _interrupt(self) -> None:
+        process = self._process
+        if process is not None:
+            process.terminate()
+
+
+class NullBackend(AudioBackend):
+    """Discard audio, for servers with no sound device."""
+
+    name = "null"
+
+    def play_file(self, path: str) -> None:
+        self._mark_started()
+
+    def play_stream(self, stream: AudioStream) -> None:
+        self._mark_started()
+        for _ in stream.iter_bytes():
+            pass
+
+
+class FileSinkBackend(AudioBackend):
+    """Write every played clip to a directory instead of the speakers."""
+
+    name = "file"
+
+    def __init__(self, directory: str):
+        super().__init__()
+        self.directory = directory
+
+    def probe(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+
+    def play_file(self, path: str) -> None:
+        self._mark_started()
+        shutil.copyfile(path, self._next_path())
+
+    def play_stream(self, stream: AudioStream) -> None:
+        self._mark_started()
+        with open(self._next_path(), "wb") as f:
+            for chunk in stream.iter_bytes():
+                f.write(chunk)
+
+    def _next_path(self) -> str:
+        return os.path.join(self.directory, f"played-{time.time_ns()}.wav")
+
+
+def _aplay_command(sample_format: str, channels: int, rate: int) -> list[str]:
+    return ["aplay", "-q", "-t", "raw", "-f", sample_format, "-c", f"{channels}", "-r", f"{rate}"]  # fmt: skip
+
+
+def _paplay_command(sample_format: str, channels: int, rate: int) -> list[str]:
+    return ["paplay", "--raw", f"--format={sample_format}", f"--channels={channels}", f"--rate={rate}"]  # fmt: skip
+
+
+def make_backend(name: str) -> AudioBackend:
+    """Build the backend called ``name``.
+
+    Raises:
+        ValueError: if there is no such backend.
+    """
+    if name == "pygame":
+        return PygameBackend()
+    if name == "simpleaudio":
+        return SimpleaudioBackend()
+    if name == "aplay":
+        return PcmPipeBackend(
+            "aplay", _aplay_command, {1: "U8", 2: "S16_LE", 3: "S24_3LE", 4: "S32_LE"}
+        )
+    if name == "paplay":
+        return PcmPipeBackend(
+            "paplay", _paplay_command, {1: "u8", 2: "s16le", 3: "s24le", 4: "s32le"}
+        )
+    if name == "ffplay":
+        return CommandBackend(
+            "ffplay",
+            lambda path: ["ffplay", "-nodisp", "-autoexit", "-loglevel", "quiet", path],
+        )
+    if name == "afplay":
+        return CommandBackend("afplay", lambda path: ["afplay", path])
+    if name == "powershell":
+        return CommandBackend(
+            "powershell",
+            lambda path: [
+                "powershell",
+                "-c",
+                f"(New-Object Media.SoundPlayer '{path}').PlaySync()",
+            ],
+        )
+    if name == "null":
+        return NullBackend()
+    if name == "file":
+        return FileSinkBackend(env_str("YODA_AUDIO_SINK_DIR") or data_dir("played"))
+    raise ValueError(f"Unknown audio backend: {name}")
+
+
+def default_backend_names() -> list[str]:
+    """Return the backends worth probing on this platform, best first."""
+    names = ["pygame", "simpleaudio"]
+    if sys.platform == "linux":
+        names += ["aplay", "paplay", "ffplay"]
+    elif sys.platform == "darwin":
+        names.append("afplay")
+    elif sys.platform == "win32":
+        names.append("powershell")
+    return names
+
+
+@dataclass
+class BackendStats:
+    """Probe outcome and playback history of one backend."""
+
+    name: str
+    # None until probed
+    available: bool | None = None
+    probe_error: str | None = None
+    probe_seconds: float | None = None
+    plays: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    demoted: bool = False
+    last_error: str | None = None
+    # Seconds from the start of a play call until audio reached the device
+    last_start_latency: float | None = None
+    max_start_latency: float | None = None
+    total_start_latency: float = 0.0
+
+    def describe(self) -> dict:
+        """Return a JSON-friendly summary with the mean start latency."""
+        info = asdict(self)
+        total = info.pop("total_start_latency")
+        info["mean_start_latency"] = (
+            round(total / self.plays, 4) if self.plays else None
+        )
+        return info
+
+
+class AudioBackends:
+    """Probe audio backends once and play through the best working one."""
+
+    def __init__(
+        self, backends: list[AudioBackend], max_failures: int = DEFAULT_MAX_FAILURES
+    ):
+        """
+        Args:
+            backends: Candidates in order of preference.
+            max_failures: Consecutive failures after which a backend is demoted.
+        """
+        self.backends = backends
+        self.max_failures = max(1, max_failures)
+        self.stats = {backend.name: BackendStats(backend.name) for backend in backends}
+        self._probed = False
+        self._current: AudioBackend | None = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "AudioBackends":
+        """Build the manager from ``YODA_AUDIO_BACKEND``/``YODA_AUDIO_MAX_FAILURES``."""
+        names = env_str("YODA_AUDIO_BACKEND")
+        if names is None:
+            backends = [make_backend(name) for name in default_backend_names()]
+        else:
+            backends = []
+            for name in names.split(","):
+                try:
+                    backends.append(make_backend(name.strip().lower()))
+                except ValueError as e:
+                    logger.warning(f"Ignoring YODA_AUDIO_BACKEND entry: {e}")
+        return cls(backends, env_int("YODA_AUDIO_MAX_FAILURES", DEFAULT_MAX_FAILURES))
+
+    def probe(self, force: bool = False) -> None:
+        """Probe every backend, once unless ``force``; forcing clears demotions."""
+        with self._lock:
+            if self._probed and not force:
+                return
+            for backend in self.backends:
+                stats = self.stats[backend.name]
+                started = time.monotonic()
+                try:
+                    backend.probe()
+                    stats.available, stats.probe_error = True, None
+                except Exception as e:
+                    stats.available, stats.probe_error = False, str(e)
+                stats.probe_seconds = round(time.monotonic() - started, 4)
+                stats.demoted = False
+                stats.consecutive_failures = 0
+            self._probed = True
+        usable = [name for name, stats in self.stats.items() if stats.available]
+        logger.info(f"Audio backends available: {usable or 'none'}")
+
+    def candidates(self) -> list[AudioBackend]:
+        """Return the available backends: healthy ones first, demoted ones last."""
+        self.probe()
+        available = [b for b in self.backends if self.stats[b.name].available]
+        return [b for b in available if not self.stats[b.name].demoted] + [
+            b for b in available if self.stats[b.name].demoted
+        ]
+
+    def play(self, source: str | AudioStream) -> bool:
+        """Play a wav file or stream, falling back across backends; report success."""
+        if isinstance(source, AudioStream):
+            try:
+                # A broken download is not the backend's fault
+                source.format()
+            except (IOError, ValueError) as e:
+                logger.error(f"Cannot play audio stream: {e}")
+                return False
+
+        for backend in self.candidates():
+            stats = self.stats[backend.name]
+            self._current = backend
+            started = time.monotonic()
+            try:
+                backend.play(source)
+            except Exception as e:
+                stats.failures += 1
+                stats.consecutive_failures += 1
+                stats.last_error = str(e)
+                logger.warning(f"Audio backend {backend.name} failed: {e}")
+                if (
+                    not stats.demoted
+                    and stats.consecutive_failures >= self.max_failures
+                ):
+                    stats.demoted = True
+                    logger.warning(f"Demoting audio backend {backend.name}")
+                continue
+            finally:
+                self._current = None
+            stats.plays += 1
+            stats.consecutive_failures = 0
+            stats.demoted = False
+            if backend.started_at is not None:
+                latency = round(backend.started_at - started, 4)
+                stats.last_start_latency = latency
+                stats.max_start_latency = max(stats.max_start_latency or 0.0, latency)
+                stats.total_start_latency += latency
+            return True
+
+        logger.error("All audio playback methods failed")
+        return False
+
+    def stop(self) -> None:
+        """Interrupt the clip that is playing, if any."""
+        backend = self._current
+        if backend is not None:
+            try:
+                backend.stop()
+            except Exception as e:
+                logger.warning(f"Could not stop {backend.name} playback: {e}")
+
+    def diagnostics(self) -> dict:
+        """Return probe results and per-backend playback counters and latency."""
+        active = next(iter(self.candidates()), None) if self._probed else None
+        return {
+            "probed": self._probed,
+            "active": active.name if active else None,
+            "max_failures": self.max_failures,
+            "backends": [self.stats[b.name].describe() for b in self.backends],
+        }
+
+    def close(self) -> None:
+        """Release every backend's warm mixer or player process."""
+        for backend in self.backends:
+            try:
+                backend.close()
+            except Exception as e:
+                logger.warning(f"Could not close {backend.name}: {e}")
+
+
+_default_backends: AudioBackends | None = None
+_default_backends_lock = threading.Lock()
+
+
+def get_audio_backends() -> AudioBackends:
+    """Return the process-wide backend manager; backends are probed on first play."""
+    global _default_backends
+    with _default_backends_lock:
+        if _default_backends is None:
+            _default_backends = AudioBackends.from_env()
+        return _default_backends
+
+
+def reset_audio_backends() -> None:
+    """Close and forget the process-wide manager."""
+    global _default_backends
+    with _default_backends_lock:
+        backends, _default_backends = _default_backends, None
+    if backends is not None:
+        backends.close()
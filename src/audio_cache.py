@@ -0,0 +1,381 @@
+"""Persistent, content-addressed cache of synthesized Yoda audio.
+
+Clips are keyed on the normalized quote text plus the FakeYou model token, so a
+quote that has already been spoken by a model never goes back to the API.
+Each entry is a ``<key>.wav`` file with a ``<key>.json`` sidecar holding the
+text, model and original CDN URL. The cache is bounded by total size and by
+entry age; when it grows past its size limit the least recently used clips are
+evicted first.
+
+Several processes can share one cache directory: a key missing from this
+process's index is looked for on disk before it counts as a miss. The size
+limit applies to the directory as a whole, since the index is brought up to
+date with the directory before evicting, and scratch files are only cleaned
+up once they are too old to be another process's download in progress.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import unicodedata
+from dataclasses import dataclass
+from typing import BinaryIO
+
+from config import data_dir, env_bool, env_float, env_str
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_AGE = 30 * 24 * 60 * 60
+# Seconds after its last write that a scratch file counts as abandoned
+STALE_TEMP_AGE = 60 * 60
+
+
+def normalize_text(text: str) -> str:
+    """Normalize a quote so trivially different spellings share a cache entry."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(text: str, model_token: str) -> str:
+    """Return the content address for ``text`` spoken by ``model_token``."""
+    payload = f"{model_token}\n{normalize_text(text)}".encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+@dataclass
+class CacheEntry:
+    """Metadata for one cached clip."""
+
+    key: str
+    path: str
+    text: str
+    model_token: str
+    model_name: str
+    audio_url: str
+    created_at: float
+    size: int
+
+
+class AudioCache:
+    """On-disk LRU cache of wav clips with size and age limits."""
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        max_age: float = DEFAULT_MAX_AGE,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # key -> [size, last_access, created_at]
+        self._index: dict[str, list[float]] = {}
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _wav_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.wav")
+
+    def _meta_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _load_index(self) -> None:
+        now = time.time()
+        for name in os.listdir(self.directory):
+            if name.endswith(".tmp"):
+                # Left behind by a write interrupted mid-way, unless another
+                # process sharing the directory is still writing it
+                path = os.path.join(self.directory, name)
+                try:
+                    if now - os.path.getmtime(path) > STALE_TEMP_AGE:
+                        os.unlink(path)
+                except OSError:
+                    pass
+                continue
+            if not name.endswith(".wav"):
+                continue
+            key = name[:-4]
+            try:
+                with open(self._meta_path(key), encoding="utf-8") as f:
+                    meta = json.load(f)
+                stat = os.stat(self._wav_path(key))
+            except (OSError, ValueError):
+                try:
+                    fresh = (
+                        now - os.path.getmtime(self._wav_path(key)) <= STALE_TEMP_AGE
+                    )
+                except OSError:
+                    fresh = False
+                if fresh:
+                    # Another process may be between writing the clip and
+                    # its metadata; a later rescan adopts it
+                    continue
+                logger.warning(f"Dropping unreadable cache entry: {key}")
+                self._remove(key)
+                continue
+            self._index[key] = [stat.st_size, stat.st_mtime, meta["created_at"]]
+
+    def _remove(self, key: str) -> None:
+        self._index.pop(key, None)
+        for path in (self._wav_path(key), self._meta_path(key)):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Could not delete cache file {path}: {e}")
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.max_age > 0 and now - created_at > self.max_age
+
+    def _read_entry(self, key: str) -> CacheEntry | None:
+        try:
+            with open(self._meta_path(key), encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return CacheEntry(key=key, path=self._wav_path(key), **meta)
+
+    def _adopt(self, key: str) -> list[float] | None:
+        """Index a clip another process put in the cache directory."""
+        entry = self._read_entry(key)
+        if entry is None:
+            return None
+        try:
+            size = os.path.getsize(entry.path)
+        except OSError:
+            return None
+        record = self._index[key] = [size, time.time(), entry.created_at]
+        return record
+
+    def get(self, text: str, model_token: str) -> CacheEntry | None:
+        """Return the cached clip for ``text``/``model_token`` without counting stats."""
+        key = cache_key(text, model_token)
+        with self._lock:
+            record = self._index.get(key) or self._adopt(key)
+            if record is None:
+                return None
+            now = time.time()
+            if self._expired(record[2], now):
+                self._remove(key)
+                return None
+            entry = self._read_entry(key)
+            if entry is None or not os.path.exists(entry.path):
+                self._remove(key)
+                return None
+            record[1] = now
+            try:
+                os.utime(entry.path, (now, now))
+            except OSError:
+                pass
+            return entry
+
+    def lookup(self, text: str, models: list[tuple[str, str]]) -> CacheEntry | None:
+        """Return the first cached clip for ``text`` across ``models`` in order.
+
+        Counts exactly one hit or miss per call, however many models are checked.
+        """
+        for model_token, _ in models:
+            entry = self.get(text, model_token)
+            if entry is not None:
+                self.hits += 1
+                return entry
+        self.misses += 1
+        return None
+
+    def put(
+        self,
+        text: str,
+        model_token: str,
+        audio: bytes,
+        *,
+        model_name: str,
+        audio_url: str,
+    ) -> CacheEntry:
+        """Store ``audio`` for ``text``/``model_token`` and evict to stay in bounds."""
+        sink, tmp_path = self.open_temp()
+        try:
+            with sink:
+                sink.write(audio)
+        except BaseException:
+            self.discard_temp(tmp_path)
+            raise
+        return self.put_file(
+            text, model_token, tmp_path, model_name=model_name, audio_url=audio_url
+        )
+
+    def open_temp(self) -> tuple[BinaryIO, str]:
+        """Open a scratch file in the cache directory to stream a download into.
+
+        Pass the returned path to :meth:`put_file` once the file is complete, or
+        to :meth:`discard_temp` if the download fails.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        return os.fdopen(fd, "wb"), tmp_path
+
+    def discard_temp(self, tmp_path: str) -> None:
+        """Remove a scratch file opened with :meth:`open_temp`."""
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+
+    def put_file(
+        self,
+        text: str,
+        model_token: str,
+        src_path: str,
+        *,
+        model_name: str,
+        audio_url: str,
+    ) -> CacheEntry:
+        """Move the finished file at ``src_path`` into the cache."""
+        key = cache_key(text, model_token)
+        now = time.time()
+        size = os.path.getsize(src_path)
+        meta = {
+            "text": normalize_text(text),
+            "model_token": model_token,
+            "model_name": model_name,
+            "audio_url": audio_url,
+            "created_at": now,
+            "size": size,
+        }
+        with self._lock:
+            os.replace(src_path, self._wav_path(key))
+            self._atomic_write(self._meta_path(key), json.dumps(meta).encode("utf-8"))
+            self._index[key] = [size, now, now]
+            self._evict_locked(keep=key)
+        return CacheEntry(key=key, path=self._wav_path(key), **meta)
+
+    def _atomic_write(self, path: str, data: bytes) -> None:
+        sink, tmp_path = self.open_temp()
+        try:
+            with sink:
+                sink.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            self.discard_temp(tmp_path)
+            raise
+
+    def _rescan_locked(self) -> None:
+        """Bring the index up to date with clips other processes added or evicted."""
+        on_disk = {}
+        for name in os.listdir(self.directory):
+            if name.endswith(".wav"):
+                try:
+                    on_disk[name[:-4]] = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+        for key in list(self._index):
+            if key not in on_disk:
+                del self._index[key]
+        for key, stat in on_disk.items():
+            record = self._index.get(key)
+            if record is not None:
+                # Other processes mark their reads on the file's mtime
+                record[0] = stat.st_size
+                record[1] = max(record[1], stat.st_mtime)
+                continue
+            entry = self._read_entry(key)
+            if entry is not None:
+                # Without metadata it may still be being written; skip it
+                self._index[key] = [stat.st_size, stat.st_mtime, entry.created_at]
+
+    def evict(self) -> int:
+        """Drop expired entries and LRU entries over the size limit."""
+        with self._lock:
+            return self._evict_locked()
+
+    def _evict_locked(self, keep: str | None = None) -> int:
+        self._rescan_locked()
+        now = time.time()
+        removed = 0
+        for key, (_, _, created_at) in list(self._index.items()):
+            if key != keep and self._expired(created_at, now):
+                self._remove(key)
+                removed += 1
+        total = sum(record[0] for record in self._index.values())
+        if self.max_bytes > 0 and total > self.max_bytes:
+            by_age = sorted(self._index.items(), key=lambda item: item[1][1])
+            for key, (size, _, _) in by_age:
+                if total <= self.max_bytes:
+                    break
+                if key == keep:
+                    continue
+                self._remove(key)
+                total -= size
+                removed += 1
+        self.evictions += removed
+        return removed
+
+    def clear(self) -> None:
+        """Remove every cached clip."""
+        with self._lock:
+            for key in list(self._index):
+                self._remove(key)
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and current occupancy."""
+        with self._lock:
+            entries = len(self._index)
+            total = int(sum(record[0] for record in self._index.values()))
+        lookups = self.hits + self.misses
+        return {
+            "directory": self.directory,
+            "entries": entries,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "max_age_seconds": self.max_age,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+_default_cache: AudioCache | None = None
+_default_cache_lock = threading.Lock()
+
+
+def get_audio_cache() -> AudioCache | None:
+    """Return the process-wide cache, or None when ``YODA_CACHE_ENABLED`` is off.
+
+    Configured by ``YODA_CACHE_DIR``, ``YODA_CACHE_MAX_MB`` and
+    ``YODA_CACHE_MAX_AGE_DAYS``.
+    """
+    global _default_cache
+    if not env_bool("YODA_CACHE_ENABLED", True):
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            directory = env_str("YODA_CACHE_DIR") or data_dir("audio")
+            max_mb = env_float("YODA_CACHE_MAX_MB", DEFAULT_MAX_BYTES / 1024 / 1024)
+            max_days = env_float(
+                "YODA_CACHE_MAX_AGE_DAYS", DEFAULT_MAX_AGE / 24 / 60 / 60
+            )
+            try:
+                _default_cache = AudioCache(
+                    directory,
+                    max_bytes=int(max_mb * 1024 * 1024),
+                    max_age=max_days * 24 * 60 * 60,
+                )
+            except OSError as e:
+                logger.warning(f"Audio cache disabled, could not open {directory}: {e}")
+                return None
+        return _default_cache
+
+
+def reset_audio_cache() -> None:
+    """Forget the process-wide cache so the next call re-reads the environment."""
+    global _default_cache
+    with _default_cache_lock:
+        _default_cache = None
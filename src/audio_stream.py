@@ -0,0 +1,463 @@
+"""In-memory wav clips that can be played while they are still downloading.
+
+An :class:`AudioStream` is written to by the download on the event loop and read
+by the playback worker thread. Readers block until the bytes they need have
+arrived, so playback can start as soon as the wav header and the first PCM
+frames are in, without ever touching the disk.
+"""
+
+import functools
+import logging
+import math
+import struct
+import threading
+import warnings
+from dataclasses import dataclass
+from typing import Iterable, Iterator
+
+logger = logging.getLogger(__name__)
+
+# Size field value used by writers that do not know the final length
+UNKNOWN_SIZE = 0xFFFFFFFF
+
+# Header bytes to wait for before giving up on finding the data chunk
+MAX_HEADER_BYTES = 64 * 1024
+
+# PCM bytes copied at a time when joining streams
+CONCAT_CHUNK_SIZE = 64 * 1024
+
+# Taps of the low-pass filter applied around resampling, and its cutoff as a
+# fraction of the lower of the two rates
+RESAMPLE_TAPS = 127
+RESAMPLE_CUTOFF = 0.45
+
+
+@dataclass(frozen=True)
+class WavFormat:
+    """PCM layout of a wav file and where its sample data lives."""
+
+    channels: int
+    sample_width: int
+    frame_rate: int
+    data_offset: int
+    # Byte length of the data chunk, or None if the header does not say
+    data_size: int | None
+
+    @property
+    def frame_size(self) -> int:
+        return self.channels * self.sample_width
+
+
+def parse_wav_header(data: bytes) -> WavFormat | None:
+    """Parse the RIFF/WAVE header at the start of ``data``.
+
+    Returns None if more bytes are needed to reach the ``data`` chunk.
+
+    Raises:
+        ValueError: if ``data`` is not an uncompressed PCM wav file.
+    """
+    if not b"RIFF".startswith(data[:4]) or not b"WAVE".startswith(data[8:12]):
+        raise ValueError("Not a RIFF/WAVE file")
+    if len(data) < 12:
+        return None
+
+    offset = 12
+    fmt = None
+    while True:
+        if offset + 8 > len(data):
+            break
+        chunk_id = data[offset : offset + 4]
+        (chunk_size,) = struct.unpack_from("<I", data, offset + 4)
+        body = offset + 8
+        if chunk_id == b"fmt ":
+            if body + 16 > len(data):
+                break
+            audio_format, channels, frame_rate, _, _, bits = struct.unpack_from(
+                "<HHIIHH", data, body
+            )
+            # 0xFFFE is WAVE_FORMAT_EXTENSIBLE, also used for plain PCM
+            if audio_format not in (1, 0xFFFE):
+                raise ValueError(f"Unsupported wav encoding: {audio_format}")
+            if channels < 1 or bits % 8 or not 8 <= bits <= 32:
+                raise ValueError("Invalid wav format chunk")
+            fmt = (channels, bits // 8, frame_rate)
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise ValueError("wav data chunk before format chunk")
+            size = None if chunk_size in (0, UNKNOWN_SIZE) else chunk_size
+            return WavFormat(*fmt, data_offset=body, data_size=size)
+        offset = body + chunk_size + (chunk_size & 1)
+
+    if len(data) > MAX_HEADER_BYTES:
+        raise ValueError("wav data chunk not found")
+    return None
+
+
+class InvalidAudioError(ValueError):
+    """Downloaded audio that is not a usable wav clip."""
+
+    def __init__(self, message: str, reason: str):
+        super().__init__(message)
+        # Short label for metrics: not_wav, too_large, truncated or empty
+        self.reason = reason
+
+
+class WavCheck:
+    """Validate a wav download as it streams in.
+
+    Feed each chunk through :meth:`feed` and pass on what it returns. The
+    header is held back until it parses, so a body that is not a wav (an HTML
+    error page, say) is rejected before any of it reaches a sink. Anything
+    over ``max_bytes`` is rejected as soon as it arrives, and :meth:`finish`
+    rejects a clip shorter than its header says.
+    """
+
+    def __init__(self, max_bytes: int = 0):
+        """
+        Args:
+            max_bytes: Largest download accepted; ``0`` means no limit.
+        """
+        self.max_bytes = max_bytes
+        self.received = 0
+        self.format: WavFormat | None = None
+        self._head = b""
+
+    def check_length(self, content_length: str | None) -> None:
+        """Reject a download whose Content-Length is already over the limit."""
+        if self.max_bytes and content_length and content_length.isdigit():
+            if int(content_length) > self.max_bytes:
+                raise InvalidAudioError(
+                    f"Audio is {content_length} bytes, over the "
+                    f"{self.max_bytes} byte limit",
+                    reason="too_large",
+                )
+
+    def feed(self, chunk: bytes) -> bytes:
+        """Check the next chunk and return the bytes that can be passed on."""
+        self.received += len(chunk)
+        if self.max_bytes and self.received > self.max_bytes:
+            raise InvalidAudioError(
+                f"Audio is over the {self.max_bytes} byte limit", reason="too_large"
+            )
+        if self.format is not None:
+            return chunk
+        self._head += chunk
+        try:
+            self.format = parse_wav_header(self._head)
+        except ValueError as e:
+            raise InvalidAudioError(f"Not a wav clip: {e}", reason="not_wav") from e
+        if self.format is None:
+            return b""
+        head, self._head = self._head, b""
+        return head
+
+    def finish(self) -> None:
+        """Check that the whole clip arrived."""
+        if self.format is None:
+            if self.received:
+                raise InvalidAudioError(
+                    "Audio ends inside its header", reason="truncated"
+                )
+            raise InvalidAudioError("Audio is empty", reason="empty")
+        if self.format.data_size is not None:
+            expected = self.format.data_offset + self.format.data_size
+            if self.received < expected:
+                raise InvalidAudioError(
+                    f"Audio is truncated: {self.received} of {expected} bytes",
+                    reason="truncated",
+                )
+
+
+class AudioStream:
+    """A growing in-memory byte buffer with blocking, thread-safe readers."""
+
+    def __init__(self, data: bytes | None = None):
+        self._buffer = bytearray()
+        self._closed = False
+        self._error: BaseException | None = None
+        self._format: WavFormat | None = None
+        self._condition = threading.Condition()
+        if data is not None:
+            self.write(data)
+            self.close()
+
+    def write(self, chunk: bytes) -> int:
+        """Append ``chunk`` and wake any waiting reader."""
+        with self._condition:
+            if self._closed:
+                raise ValueError("write to a closed AudioStream")
+            self._buffer += chunk
+            self._condition.notify_all()
+        return len(chunk)
+
+    def close(self, error: BaseException | None = None) -> None:
+        """Mark the stream complete, or failed with ``error``."""
+        with self._condition:
+            self._closed = True
+            self._error = error
+            self._condition.notify_all()
+
+    @property
+    def complete(self) -> bool:
+        """Whether every byte has arrived."""
+        with self._condition:
+            return self._closed and self._error is None
+
+    def __len__(self) -> int:
+        with self._condition:
+            return len(self._buffer)
+
+    def _wait_for(self, size: int) -> int:
+        """Block until ``size`` bytes have arrived or the stream is closed.
+
+        Returns how many bytes are buffered.
+        """
+        with self._condition:
+            while len(self._buffer) < size and not self._closed:
+                self._condition.wait()
+            if self._error is not None:
+                raise IOError(f"Audio download failed: {self._error}")
+            return len(self._buffer)
+
+    def _read(self, start: int, end: int | None = None) -> bytes:
+        with self._condition:
+            return bytes(self._buffer[start:end])
+
+    def getvalue(self) -> bytes:
+        """Block until the download finishes and return every byte."""
+        with self._condition:
+            while not self._closed:
+                self._condition.wait()
+        self._wait_for(0)
+        return self._read(0)
+
+    def format(self) -> WavFormat:
+        """Block until the wav header has arrived and return its format.
+
+        Raises:
+            ValueError: if the bytes are not a PCM wav file.
+        """
+        if self._format is not None:
+            return self._format
+        wanted = 44
+        while True:
+            available = self._wait_for(wanted)
+            fmt = parse_wav_header(self._read(0, available))
+            if fmt is not None:
+                self._format = fmt
+                return fmt
+            if available < wanted:
+                raise ValueError("wav header is truncated")
+            wanted = available + 1
+
+    def iter_bytes(self, start: int = 0) -> Iterator[bytes]:
+        """Yield the raw file bytes from ``start`` as they arrive."""
+        position = start
+        while True:
+            available = self._wait_for(position + 1)
+            if available <= position:
+                return
+            chunk = self._read(position, available)
+            position = available
+            yield chunk
+
+    def iter_pcm(self, chunk_size: int) -> Iterator[bytes]:
+        """Yield frame-aligned PCM chunks of up to ``chunk_size`` bytes as they arrive."""
+        fmt = self.format()
+        frame = fmt.frame_size
+        chunk_size = max(frame, chunk_size - chunk_size % frame)
+        position = fmt.data_offset
+        end = None if fmt.data_size is None else fmt.data_offset + fmt.data_size
+        while end is None or position < end:
+            wanted = chunk_size if end is None else min(chunk_size, end - position)
+            available = self._wait_for(position + wanted) - position
+            if end is not None:
+                available = min(available, end - position)
+            available = min(available, chunk_size)
+            available -= available % frame
+            if available <= 0:
+                return
+            yield self._read(position, position + available)
+            position += available
+
+    def pcm(self) -> bytes:
+        """Block until the download finishes and return all PCM sample data."""
+        fmt = self.format()
+        data = self.getvalue()
+        end = None if fmt.data_size is None else fmt.data_offset + fmt.data_size
+        pcm = data[fmt.data_offset : end]
+        return pcm[: len(pcm) - len(pcm) % fmt.frame_size]
+
+
+def wav_header(
+    channels: int, sample_width: int, frame_rate: int, data_size: int | None = None
+) -> bytes:
+    """Return a 44-byte PCM wav header; a ``None`` size marks an open-ended stream."""
+    frame_size = channels * sample_width
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF",
+        UNKNOWN_SIZE if data_size is None else 36 + data_size,
+        b"WAVE",
+        b"fmt ",
+        16,
+        1,
+        channels,
+        frame_rate,
+        frame_rate * frame_size,
+        frame_size,
+        sample_width * 8,
+        b"data",
+        UNKNOWN_SIZE if data_size is None else data_size,
+    )
+
+
+@functools.lru_cache(maxsize=16)
+def _lowpass_taps(cutoff: float) -> tuple[float, ...]:
+    """Blackman-windowed sinc with unity gain; ``cutoff`` is in cycles/sample."""
+    middle = (RESAMPLE_TAPS - 1) / 2
+    taps = []
+    for n in range(RESAMPLE_TAPS):
+        x = n - middle
+        if x:
+            sinc = math.sin(2 * math.pi * cutoff * x) / (math.pi * x)
+        else:
+            sinc = 2 * cutoff
+        phase = 2 * math.pi * n / (RESAMPLE_TAPS - 1)
+        taps.append(sinc * (0.42 - 0.5 * math.cos(phase) + 0.08 * math.cos(2 * phase)))
+    total = sum(taps)
+    return tuple(tap / total for tap in taps)
+
+
+def _lowpass(audioop, pcm: bytes, channels: int, cutoff: float) -> bytes:
+    """Filter 32-bit PCM through :func:`_lowpass_taps`, without delaying it.
+
+    Each tap is one ``audioop`` pass over the whole clip, so the filter runs
+    at C speed without numpy.
+    """
+    frame_size = 4 * channels
+    taps = _lowpass_taps(cutoff)
+    pad = bytes(frame_size * (len(taps) // 2))
+    padded = pad + pcm + pad
+    out = bytes(len(pcm))
+    for i, tap in enumerate(taps):
+        start = i * frame_size
+        shifted = padded[start : start + len(pcm)]
+        out = audioop.add(out, audioop.mul(shifted, 4, tap), 4)
+    return out
+
+
+def convert_pcm(pcm: bytes, src: WavFormat, dst: WavFormat) -> bytes:
+    """Convert PCM samples to another sample width, channel count and rate.
+
+    Resampling low-pass filters below the lower rate's Nyquist frequency
+    around ``audioop.ratecv``, which has no filter of its own, so lowering
+    the rate does not alias. It works on 32-bit samples at half scale, to
+    keep precision and headroom for the filter.
+
+    Raises:
+        ValueError: for channel layouts other than mono and stereo.
+        ImportError: on Python 3.13 and later, which dropped audioop.
+    """
+    with warnings.catch_warnings():
+        # Deprecated, and removed in Python 3.13; the project needs < 3.12
+        warnings.simplefilter("ignore", DeprecationWarning)
+        import audioop
+
+    if {src.channels, dst.channels} - {1, 2}:
+        raise ValueError("Only mono and stereo audio can be converted")
+    resample = src.frame_rate != dst.frame_rate
+    width = src.sample_width
+    if width == 1:
+        # 8-bit wav samples are unsigned; audioop works on signed samples
+        pcm = audioop.bias(pcm, 1, -128)
+    work_width = 4 if resample else dst.sample_width
+    if width != work_width:
+        pcm = audioop.lin2lin(pcm, width, work_width)
+        width = work_width
+    if src.channels == 2 and dst.channels == 1:
+        pcm = audioop.tomono(pcm, width, 0.5, 0.5)
+    elif src.channels == 1 and dst.channels == 2:
+        pcm = audioop.tostereo(pcm, width, 1, 1)
+    if resample:
+        cutoff = RESAMPLE_CUTOFF * min(src.frame_rate, dst.frame_rate)
+        pcm = audioop.mul(pcm, 4, 0.5)
+        if dst.frame_rate < src.frame_rate:
+            pcm = _lowpass(audioop, pcm, dst.channels, cutoff / src.frame_rate)
+        pcm, _ = audioop.ratecv(
+            pcm, 4, dst.channels, src.frame_rate, dst.frame_rate, None
+        )
+        if dst.frame_rate > src.frame_rate:
+            pcm = _lowpass(audioop, pcm, dst.channels, cutoff / dst.frame_rate)
+        pcm = audioop.mul(pcm, 4, 2)
+        if dst.sample_width != 4:
+            pcm = audioop.lin2lin(pcm, 4, dst.sample_width)
+        width = dst.sample_width
+    if width == 1:
+        pcm = audioop.bias(pcm, 1, 128)
+    return pcm
+
+
+def convert_wav(
+    data: bytes, channels: int, sample_width: int, frame_rate: int
+) -> bytes:
+    """Return the PCM wav ``data`` re-encoded with the given layout, in memory.
+
+    Raises:
+        ValueError: if ``data`` is not a PCM wav file, or has more than two
+            channels.
+    """
+    src = parse_wav_header(data)
+    if src is None:
+        raise ValueError("wav header is truncated")
+    end = None if src.data_size is None else src.data_offset + src.data_size
+    pcm = data[src.data_offset : end]
+    pcm = pcm[: len(pcm) - len(pcm) % src.frame_size]
+    dst = WavFormat(channels, sample_width, frame_rate, 44, None)
+    if (src.channels, src.sample_width, src.frame_rate) != (
+        channels,
+        sample_width,
+        frame_rate,
+    ):
+        pcm = convert_pcm(pcm, src, dst)
+    return wav_header(channels, sample_width, frame_rate, len(pcm)) + pcm
+
+
+def concat_streams(sources: Iterable[AudioStream], out: AudioStream) -> None:
+    """Join wav ``sources`` into ``out`` as one continuous wav, in order.
+
+    Each source is copied as its bytes arrive, so this blocks while they
+    download; run it on a worker thread. The first source sets the format,
+    and later sources in another layout are converted to it. A source that
+    fails is skipped after whatever it already delivered. ``out`` is closed
+    with an error only if no source produced any audio.
+    """
+    fmt = None
+    error = None
+    try:
+        for index, source in enumerate(sources):
+            try:
+                source_fmt = source.format()
+                if fmt is None:
+                    fmt = source_fmt
+                    out.write(
+                        wav_header(fmt.channels, fmt.sample_width, fmt.frame_rate)
+                    )
+                if (
+                    source_fmt.channels,
+                    source_fmt.sample_width,
+                    source_fmt.frame_rate,
+                ) == (
+                    fmt.channels,
+                    fmt.sample_width,
+                    fmt.frame_rate,
+                ):
+                    for pcm in source.iter_pcm(CONCAT_CHUNK_SIZE):
+                        out.write(pcm)
+                else:
+                    out.write(convert_pcm(source.pcm(), source_fmt, fmt))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping audio part {index + 1}: {e}")
+                error = e
+    finally:
+        out.close(error if fmt is None else None)
@@ -0,0 +1,135 @@
+"""Speak long quotes as a pipeline of sentence-sized FakeYou jobs.
+
+FakeYou takes longer the more text a job has, and nothing can play until the
+whole clip exists. Quotes longer than ``YODA_CHUNK_CHARS`` are therefore split
+at sentence boundaries, and overlong sentences at phrase and then word
+boundaries. Up to ``YODA_CHUNK_CONCURRENCY`` chunks are synthesized at once.
+Their audio is joined into one continuous stream in order, so playback starts
+once the first sentence is ready and later sentences follow without a gap.
+Each chunk is cached on its own.
+"""
+
+import asyncio
+import logging
+import re
+import threading
+import time
+from dataclasses import dataclass
+
+from audio_cache import normalize_text
+from audio_stream import AudioStream, concat_streams
+from clips import Clip, ClipDownloadError, fetch_clip_into
+from config import env_int
+from synthesis import SynthesisError
+
+logger = logging.getLogger(__name__)
+
+# Quotes longer than this many characters are split; also the longest chunk
+DEFAULT_CHUNK_CHARS = 200
+# Chunks synthesized at the same time
+DEFAULT_CONCURRENCY = 3
+# Sentences shorter than this are merged into the next one
+MIN_CHUNK_CHARS = 40
+
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+|(?<=[.!?…][\"'”’)\]])\s+")
+_PHRASE_END = re.compile(r"(?<=[,;:—–])\s+|\s+(?=[—–]\s)")
+
+
+def _pack(parts: list[str], max_chars: int) -> list[str]:
+    """Greedily join ``parts`` into pieces of at most ``max_chars``."""
+    pieces: list[str] = []
+    for part in parts:
+        if len(part) > max_chars:
+            words = part.split()
+            if len(words) > 1:
+                pieces.extend(_pack(words, max_chars))
+                continue
+        if pieces and len(pieces[-1]) + 1 + len(part) <= max_chars:
+            pieces[-1] += " " + part
+        else:
+            pieces.append(part)
+    return pieces
+
+
+def split_text(text: str, max_chars: int) -> list[str]:
+    """Split ``text`` into chunks of at most ``max_chars`` at natural boundaries.
+
+    Text of at most ``max_chars`` (or any text when ``max_chars`` is 0) comes
+    back as a single chunk.
+    """
+    text = normalize_text(text)
+    if not text:
+        return []
+    if max_chars <= 0 or len(text) <= max_chars:
+        return [text]
+
+    pieces: list[str] = []
+    for sentence in _SENTENCE_END.split(text):
+        if len(sentence) <= max_chars:
+            pieces.append(sentence)
+        else:
+            pieces.extend(_pack(_PHRASE_END.split(sentence), max_chars))
+
+    chunks: list[str] = []
+    for piece in pieces:
+        if (
+            chunks
+            and len(chunks[-1]) < MIN_CHUNK_CHARS
+            and len(chunks[-1]) + 1 + len(piece) <= max_chars
+        ):
+            chunks[-1] += " " + piece
+        else:
+            chunks.append(piece)
+    return chunks
+
+
+def chunk_quote(quote: str) -> list[str]:
+    """Split ``quote`` as configured by ``YODA_CHUNK_CHARS`` (``0`` disables)."""
+    return split_text(quote, env_int("YODA_CHUNK_CHARS", DEFAULT_CHUNK_CHARS))
+
+
+@dataclass
+class ChunkResult:
+    """How one chunk of a long quote fared."""
+
+    index: int
+    text: str
+    clip: Clip | None = None
+    error: str | None = None
+    # Seconds from the start of the quote until this chunk's audio was in
+    ready_after: float | None = None
+
+
+async def fetch_chunks(chunks: list[str], out: AudioStream) -> list[ChunkResult]:
+    """Synthesize ``chunks`` concurrently and join their audio into ``out``.
+
+    ``out`` can be queued for playback straight away: it plays the chunks in
+    order as each one arrives. A chunk that fails is left out.
+    """
+    started = time.monotonic()
+    streams = [AudioStream() for _ in chunks]
+    threading.Thread(
+        target=concat_streams, args=(streams, out), name="chunk-join", daemon=True
+    ).start()
+    semaphore = asyncio.Semaphore(
+        max(1, env_int("YODA_CHUNK_CONCURRENCY", DEFAULT_CONCURRENCY))
+    )
+
+    async def fetch(index: int) -> ChunkResult:
+        result = ChunkResult(index, chunks[index])
+        try:
+            # Chunks queue for the semaphore in order, so earlier ones start first
+            async with semaphore:
+                result.clip = await fetch_clip_into(chunks[index], streams[index])
+        except (SynthesisError, ClipDownloadError) as e:
+            # fetch_clip_into has closed the stream, so the join skips it
+            logger.warning(f"Chunk {index + 1} of {len(chunks)} failed: {e}")
+            result.error = str(e)
+        except asyncio.CancelledError as e:
+            # Possibly still waiting for the semaphore; never leave the join hanging
+            streams[index].close(e)
+            raise
+        result.ready_after = round(time.monotonic() - started, 3)
+        return result
+
+    return await asyncio.gather(*(fetch(index) for index in range(len(chunks))))
@@ -0,0 +1,317 @@
+"""Compact storage for many clips: a few segment files and an offset index.
+
+A samples directory of tens of thousands of ``N.wav`` files costs a file
+per clip, a filesystem block or more each, and an open, read and close for
+every clip read back. An archive packs the clips end to end into
+``segment-N.dat`` files of up to ``segment_bytes`` each, and records where
+each clip lives in ``archive.sqlite3``. A clip is found by its sample ID or
+by the hash of its text, and read as a slice of the memory-mapped segment,
+with no system calls once the segment is mapped.
+
+Each clip is stored with a codec:
+
+* ``none``: the wav as-is.
+* ``zlib``, ``lzma``: the wav compressed, lossless.
+* ``ulaw``: 16-bit PCM as 8-bit mu-law, lossy, half the size.
+* ``adpcm``: 16-bit mono PCM as 4-bit IMA ADPCM, lossy, a quarter of the size.
+
+Reads always return a PCM wav; lossy clips come back as 16-bit PCM in their
+original layout.
+
+Appends are made under SQLite's write lock, so several threads or processes
+can add to one archive. A crash between writing a clip and indexing it only
+leaves unused bytes at the end of a segment.
+"""
+
+import hashlib
+import lzma
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+import warnings
+import zlib
+from dataclasses import dataclass
+
+from audio_cache import normalize_text
+from audio_stream import parse_wav_header, wav_header
+
+INDEX_NAME = "archive.sqlite3"
+DEFAULT_SEGMENT_BYTES = 256 * 1024 * 1024
+DEFAULT_CODEC = "zlib"
+LOSSLESS_CODECS = ("none", "zlib", "lzma")
+LOSSY_CODECS = ("ulaw", "adpcm")
+CODECS = LOSSLESS_CODECS + LOSSY_CODECS
+# Seconds to wait for another process's append to finish
+BUSY_TIMEOUT = 30.0
+
+# Channels, sample width, frame rate and frame count ahead of lossy PCM
+_PCM_HEADER = struct.Struct("<HHII")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS clips (
+    id INTEGER PRIMARY KEY,
+    text_hash TEXT NOT NULL,
+    segment INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    codec TEXT NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS clips_text_hash ON clips (text_hash);
+"""
+
+
+def text_hash(text: str) -> str:
+    """Return the key a clip's text is looked up by."""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def _audioop():
+    with warnings.catch_warnings():
+        # Deprecated, but in the standard library for every Python we support
+        warnings.simplefilter("ignore", DeprecationWarning)
+        import audioop
+    return audioop
+
+
+def _split_pcm(wav: bytes, codec: str) -> tuple[bytes, bytes]:
+    """Return the lossy header and the 16-bit PCM of ``wav``."""
+    fmt = parse_wav_header(wav)
+    if fmt is None:
+        raise ValueError("Truncated wav header")
+    if fmt.sample_width != 2:
+        raise ValueError(f"{codec} needs 16-bit audio")
+    if codec == "adpcm" and fmt.channels != 1:
+        raise ValueError("adpcm needs mono audio")
+    end = None if fmt.data_size is None else fmt.data_offset + fmt.data_size
+    pcm = wav[fmt.data_offset : end]
+    pcm = pcm[: len(pcm) - len(pcm) % fmt.frame_size]
+    header = _PCM_HEADER.pack(
+        fmt.channels, fmt.sample_width, fmt.frame_rate, len(pcm) // fmt.frame_size
+    )
+    return header, pcm
+
+
+def encode(wav: bytes, codec: str) -> bytes:
+    """Return ``wav`` as stored with ``codec``.
+
+    Raises:
+        ValueError: for an unknown codec, or audio a lossy codec cannot take.
+    """
+    if codec == "none":
+        return wav
+    if codec == "zlib":
+        return zlib.compress(wav, 9)
+    if codec == "lzma":
+        return lzma.compress(wav, preset=6)
+    if codec == "ulaw":
+        header, pcm = _split_pcm(wav, codec)
+        return header + _audioop().lin2ulaw(pcm, 2)
+    if codec == "adpcm":
+        header, pcm = _split_pcm(wav, codec)
+        if len(pcm) % 4:
+            # Two samples a byte; pad an odd count so the last one is kept
+            pcm += b"\x00\x00"
+        return header + _audioop().lin2adpcm(pcm, 2, None)[0]
+    raise ValueError(f"Unknown codec {codec!r}; one of {', '.join(CODECS)}")
+
+
+def decode(data: bytes, codec: str) -> bytes:
+    """Return the wav stored as ``data`` with ``codec``."""
+    if codec == "none":
+        return bytes(data)
+    if codec == "zlib":
+        return zlib.decompress(data)
+    if codec == "lzma":
+        return lzma.decompress(data)
+    channels, width, frame_rate, frames = _PCM_HEADER.unpack_from(data)
+    payload = data[_PCM_HEADER.size :]
+    if codec == "ulaw":
+        pcm = _audioop().ulaw2lin(payload, width)
+    elif codec == "adpcm":
+        pcm = _audioop().adpcm2lin(payload, width, None)[0]
+    else:
+        raise ValueError(f"Unknown codec {codec!r}")
+    # Drop the sample that pads an odd count out to a whole ADPCM byte
+    pcm = pcm[: frames * channels * width]
+    return wav_header(channels, width, frame_rate, len(pcm)) + pcm
+
+
+@dataclass
+class ArchivedClip:
+    """Where one clip lives in an archive."""
+
+    id: int
+    text_hash: str
+    segment: int
+    offset: int
+    length: int
+    codec: str
+    # Bytes of the wav it decodes to
+    size: int
+
+
+class ClipArchive:
+    """Clips packed into segment files under ``directory``."""
+
+    def __init__(
+        self,
+        directory: str,
+        codec: str = DEFAULT_CODEC,
+        segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+    ):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec {codec!r}; one of {', '.join(CODECS)}")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.codec = codec
+        self.segment_bytes = segment_bytes
+        self._lock = threading.Lock()
+        self._maps: dict[int, mmap.mmap] = {}
+        self._db = sqlite3.connect(
+            os.path.join(directory, INDEX_NAME),
+            timeout=BUSY_TIMEOUT,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            for segment_map in self._maps.values():
+                segment_map.close()
+            self._maps.clear()
+            self._db.close()
+
+    def segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"segment-{segment}.dat")
+
+    def add(
+        self, clip_id: int, text: str, wav: bytes, codec: str | None = None
+    ) -> ArchivedClip:
+        """Store ``wav`` as clip ``clip_id``, replacing any clip with that ID.
+
+        Raises:
+            ValueError: if ``codec`` (default: the archive's) cannot store it.
+        """
+        codec = codec or self.codec
+        data = encode(wav, codec)
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT segment, offset + length FROM clips "
+                    "ORDER BY segment DESC, offset DESC LIMIT 1"
+                ).fetchone()
+                segment, end = row if row else (0, 0)
+                if end and end + len(data) > self.segment_bytes:
+                    segment += 1
+                fd = os.open(
+                    self.segment_path(segment),
+                    os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                    0o644,
+                )
+                try:
+                    # Past any bytes a crashed append left behind
+                    offset = os.fstat(fd).st_size
+                    os.write(fd, data)
+                finally:
+                    os.close(fd)
+                clip = ArchivedClip(
+                    clip_id,
+                    text_hash(text),
+                    segment,
+                    offset,
+                    len(data),
+                    codec,
+                    len(wav),
+                )
+                self._db.execute(
+                    "INSERT OR REPLACE INTO clips VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        clip.id,
+                        clip.text_hash,
+                        clip.segment,
+                        clip.offset,
+                        clip.length,
+                        clip.codec,
+                        clip.size,
+                    ),
+                )
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+        return clip
+
+    def _query(self, sql: str, params: tuple = ()) -> list[ArchivedClip]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, text_hash, segment, offset, length, codec, size "
+                f"FROM clips {sql}",
+                params,
+            ).fetchall()
+        return [ArchivedClip(*row) for row in rows]
+
+    def get(self, clip_id: int) -> ArchivedClip | None:
+        clips = self._query("WHERE id = ?", (clip_id,))
+        return clips[0] if clips else None
+
+    def find(self, text: str) -> ArchivedClip | None:
+        """Return the newest clip of ``text``, or None."""
+        clips = self._query(
+            "WHERE text_hash = ? ORDER BY id DESC LIMIT 1", (text_hash(text),)
+        )
+        return clips[0] if clips else None
+
+    def clips(self) -> list[ArchivedClip]:
+        return self._query("ORDER BY id")
+
+    def __contains__(self, clip_id: int) -> bool:
+        return self.get(clip_id) is not None
+
+    def _segment_map(self, segment: int, end: int) -> mmap.mmap:
+        """Return segment ``segment`` mapped up to at least ``end`` bytes."""
+        with self._lock:
+            segment_map = self._maps.get(segment)
+            if segment_map is None or len(segment_map) < end:
+                # Mapped before the segment grew; map it again at its new size
+                if segment_map is not None:
+                    segment_map.close()
+                with open(self.segment_path(segment), "rb") as f:
+                    segment_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._maps[segment] = segment_map
+            return segment_map
+
+    def read_clip(self, clip: ArchivedClip) -> bytes:
+        end = clip.offset + clip.length
+        data = self._segment_map(clip.segment, end)[clip.offset : end]
+        return decode(data, clip.codec)
+
+    def read(self, clip_id: int) -> bytes | None:
+        """Return clip ``clip_id`` as a wav, or None if it is not archived."""
+        clip = self.get(clip_id)
+        return None if clip is None else self.read_clip(clip)
+
+    def read_text(self, text: str) -> bytes | None:
+        """Return the newest clip of ``text`` as a wav, or None."""
+        clip = self.find(text)
+        return None if clip is None else self.read_clip(clip)
+
+    def stats(self) -> dict:
+        with self._lock:
+            clips, stored, size, segments = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(length), 0), "
+                "COALESCE(SUM(size), 0), COUNT(DISTINCT segment) FROM clips"
+            ).fetchone()
+        return {
+            "clips": clips,
+            "segments": segments,
+            "stored_bytes": stored,
+            "wav_bytes": size,
+            "ratio": round(stored / size, 3) if size else None,
+        }
@@ -0,0 +1,280 @@
+"""Get a playable clip for a quote: from the cache, or synthesized and downloaded."""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field, replace
+
+from audio_cache import AudioCache, get_audio_cache
+from audio_stream import AudioStream
+from config import env_float
+from engines import get_engine
+from fakeyou import YODA_MODELS
+from job_journal import JournalEntry, get_job_journal
+from job_progress import DOWNLOADING, JobProgress, publish
+from metrics import get_metrics
+from single_flight import Flight, SingleFlight
+from synthesis import Synthesis, SynthesisError, resume_job, synthesize
+
+logger = logging.getLogger(__name__)
+
+# Clip downloads in flight, keyed on the audio URL
+_downloads = SingleFlight("download")
+
+# Journaled jobs older than this many seconds are dropped, not resumed
+DEFAULT_RESUME_MAX_AGE = 60 * 60
+
+
+class ClipDownloadError(Exception):
+    """FakeYou produced audio but it could not be downloaded."""
+
+    def __init__(self, synthesis: Synthesis, error: Exception):
+        super().__init__(str(error))
+        self.synthesis = synthesis
+
+
+@dataclass
+class Clip:
+    """A quote spoken by a Yoda model, as a cached wav file or in memory."""
+
+    quote: str
+    model_token: str
+    model_name: str
+    audio_url: str
+    # Cached wav file, or None when the audio only lives in ``stream``
+    path: str | None = None
+    stream: AudioStream | None = None
+    # Served from the audio cache without calling FakeYou
+    cached: bool = False
+    # Seconds spent per phase, plus "total"
+    timings: dict[str, float] = field(default_factory=dict)
+
+    @property
+    def source(self) -> str | AudioStream:
+        """What to hand the playback queue: the cached file, else the stream."""
+        return self.path if self.path is not None else self.stream
+
+
+@dataclass
+class PendingClip:
+    """A clip whose download has started, possibly shared with other callers."""
+
+    quote: str
+    # Receives the audio as it arrives; safe to queue for playback at once
+    stream: AudioStream
+    flight: Flight
+
+    async def wait(self) -> Clip:
+        """Wait for the download to finish.
+
+        Raises:
+            ClipDownloadError: if the download fails.
+        """
+        clip = await _downloads.wait(self.flight)
+        return replace(clip, quote=self.quote)
+
+
+def start_download(
+    quote: str, synthesis: Synthesis, cache: AudioCache | None
+) -> PendingClip:
+    """Start downloading a finished job's audio, or join the download in flight.
+
+    Concurrent callers for the same audio share one request and one stream.
+    """
+    flight = _downloads.join(
+        synthesis.audio_url,
+        lambda stream: download_clip(quote, synthesis, cache, stream),
+        AudioStream(),
+    )
+    return PendingClip(quote, flight.context, flight)
+
+
+async def download_clip(
+    quote: str,
+    synthesis: Synthesis,
+    cache: AudioCache | None,
+    stream: AudioStream | None = None,
+) -> Clip:
+    """Stream a finished job's audio into memory, and into the cache if enabled.
+
+    Clips from an engine that is not ``cacheable`` are never cached. Pass a
+    ``stream`` that is already queued for playback to have it start
+    while the download is still running. Nothing is written to disk when the
+    cache is disabled. Without a ``stream``, a download of the same audio
+    that is already running is shared (see :func:`start_download`).
+
+    Raises:
+        ClipDownloadError: if the download fails.
+    """
+    if stream is None:
+        return await start_download(quote, synthesis, cache).wait()
+    logger.info(f"Success! Downloading audio from: {synthesis.audio_url}")
+    publish(quote, JobProgress(DOWNLOADING, synthesis.model_name))
+    started = time.monotonic()
+    engine = get_engine(synthesis.engine)
+    if not engine.cacheable:
+        cache = None
+    sink = tmp_path = None
+    if cache is not None:
+        try:
+            sink, tmp_path = cache.open_temp()
+        except OSError as e:
+            logger.warning(f"Could not cache audio: {e}")
+
+    clip = Clip(
+        quote=quote,
+        model_token=synthesis.model_token,
+        model_name=synthesis.model_name,
+        audio_url=synthesis.audio_url,
+        stream=stream,
+        timings=dict(synthesis.timings),
+    )
+    sinks = [stream] if sink is None else [stream, sink]
+    try:
+        await engine.fetch(synthesis.audio_url, *sinks)
+    except BaseException as e:
+        # Also on cancellation, so a queued stream never blocks the player
+        stream.close(e)
+        if sink is not None:
+            sink.close()
+            cache.discard_temp(tmp_path)
+        if isinstance(e, Exception):
+            raise ClipDownloadError(synthesis, e) from e
+        raise
+    stream.close()
+
+    if sink is not None:
+        sink.close()
+        try:
+            clip.path = cache.put_file(
+                quote,
+                synthesis.model_token,
+                tmp_path,
+                model_name=synthesis.model_name,
+                audio_url=synthesis.audio_url,
+            ).path
+        except OSError as e:
+            logger.warning(f"Could not cache audio: {e}")
+            cache.discard_temp(tmp_path)
+    clip.timings["download"] = round(time.monotonic() - started, 3)
+    return clip
+
+
+def lookup_clip(quote: str) -> Clip | None:
+    """Return the cached clip for ``quote``, or None on a miss or with no cache."""
+    cache = get_audio_cache()
+    if cache is None:
+        return None
+    entry = cache.lookup(quote, YODA_MODELS)
+    if entry is None:
+        return None
+    logger.info(f"Cache hit with {entry.model_name}: {entry.path}")
+    return Clip(
+        quote=quote,
+        model_token=entry.model_token,
+        model_name=entry.model_name,
+        audio_url=entry.audio_url,
+        path=entry.path,
+        cached=True,
+    )
+
+
+async def fetch_clip(quote: str) -> Clip:
+    """Return a clip for ``quote``, calling FakeYou only on a cache miss.
+
+    Raises:
+        SynthesisError: if every model fails.
+        ClipDownloadError: if the audio could not be downloaded.
+    """
+    clip = lookup_clip(quote)
+    if clip is not None:
+        return clip
+    pool = _worker_pool()
+    if pool is not None:
+        return await pool.fetch_clip(quote)
+    synthesis = await synthesize(quote)
+    return await download_clip(quote, synthesis, get_audio_cache())
+
+
+def _worker_pool():
+    # Imported here: the worker pool itself is built on this module
+    from worker_pool import get_worker_pool
+
+    return get_worker_pool()
+
+
+async def fetch_clip_into(quote: str, stream: AudioStream) -> Clip:
+    """Like :func:`fetch_clip`, but deliver the audio into ``stream``.
+
+    ``stream`` is closed when the audio is complete, or with the error if
+    there is none, so a reader never waits on it forever.
+
+    Raises:
+        SynthesisError: if every model fails.
+        ClipDownloadError: if the audio could not be downloaded.
+    """
+    clip = lookup_clip(quote)
+    pool = _worker_pool()
+    if clip is None and pool is not None:
+        try:
+            clip = await pool.fetch_clip(quote)
+        except BaseException as e:
+            stream.close(e)
+            raise
+    if clip is not None:
+        try:
+            if clip.path is None:
+                audio = clip.stream.getvalue()
+            else:
+                with open(clip.path, "rb") as f:
+                    audio = f.read()
+        except OSError as e:
+            stream.close(e)
+            cached = Synthesis(clip.model_token, clip.model_name, clip.audio_url)
+            raise ClipDownloadError(cached, e) from e
+        stream.write(audio)
+        stream.close()
+        clip.stream = stream
+        return clip
+    try:
+        synthesis = await synthesize(quote)
+    except BaseException as e:
+        stream.close(e)
+        raise
+    return await download_clip(quote, synthesis, get_audio_cache(), stream)
+
+
+async def resume_journaled_jobs() -> int:
+    """Finish the jobs an earlier server left in the job journal, into the cache.
+
+    This process's journal first adopts those of servers that have stopped.
+    Jobs older than ``YODA_JOB_RESUME_MAX_AGE`` seconds, or whose quote is
+    cached by now, are dropped. Returns the number of clips cached.
+    """
+    journal = get_job_journal()
+    cache = get_audio_cache()
+    if journal is None or cache is None:
+        return 0
+    await asyncio.to_thread(journal.adopt_orphans)
+    max_age = env_float("YODA_JOB_RESUME_MAX_AGE", DEFAULT_RESUME_MAX_AGE)
+
+    async def resume(entry: JournalEntry) -> bool:
+        if time.time() - entry.submitted_at > max_age:
+            await journal.remove(entry.job_token)
+            get_metrics().inc("yoda_jobs_resumed_total", outcome="expired")
+            return False
+        if cache.get(entry.quote, entry.model_token) is not None:
+            await journal.remove(entry.job_token)
+            return False
+        try:
+            synthesis = await resume_job(entry)
+            await download_clip(entry.quote, synthesis, cache)
+        except (SynthesisError, ClipDownloadError) as e:
+            logger.warning(f"Could not resume job {entry.job_token}: {e}")
+            return False
+        return True
+
+    entries = journal.entries()
+    if entries:
+        logger.info(f"Resuming {len(entries)} FakeYou jobs from the journal")
+    return sum(await asyncio.gather(*(resume(entry) for entry in entries)))
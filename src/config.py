@@ -0,0 +1,72 @@
+"""Environment-driven settings for the Yoda TTS server.
+
+Every knob is read from a ``YODA_*`` environment variable so it can be set from
+the ``env`` block of an MCP client configuration. Values are read when they are
+used, which keeps tests free to ``monkeypatch.setenv`` them.
+"""
+
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+_TRUE = {"1", "true", "yes", "on"}
+_FALSE = {"0", "false", "no", "off"}
+
+
+def env_str(name: str, default: str | None = None) -> str | None:
+    """Return the environment variable ``name`` or ``default`` when unset/empty."""
+    value = os.environ.get(name, "").strip()
+    return value if value else default
+
+
+def env_int(name: str, default: int) -> int:
+    """Return ``name`` parsed as an int, falling back to ``default`` on bad input."""
+    value = env_str(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        logger.warning(f"Ignoring invalid integer for {name}: {value!r}")
+        return default
+
+
+def env_float(name: str, default: float) -> float:
+    """Return ``name`` parsed as a float, falling back to ``default`` on bad input."""
+    value = env_str(name)
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        logger.warning(f"Ignoring invalid number for {name}: {value!r}")
+        return default
+
+
+def env_bool(name: str, default: bool) -> bool:
+    """Return ``name`` parsed as a boolean flag (1/0, true/false, yes/no, on/off)."""
+    value = env_str(name)
+    if value is None:
+        return default
+    lowered = value.lower()
+    if lowered in _TRUE:
+        return True
+    if lowered in _FALSE:
+        return False
+    logger.warning(f"Ignoring invalid flag for {name}: {value!r}")
+    return default
+
+
+def data_dir(name: str) -> str:
+    """Return the per-user cache directory for ``name``.
+
+    Honours ``YODA_DATA_DIR`` first, then ``XDG_CACHE_HOME``, then ``~/.cache``.
+    """
+    base = env_str("YODA_DATA_DIR")
+    if base is None:
+        xdg = env_str("XDG_CACHE_HOME") or os.path.join(
+            os.path.expanduser("~"), ".cache"
+        )
+        base = os.path.join(xdg, "mcp-yoda")
+    return os.path.join(base, name)
@@ -0,0 +1,39 @@
+"""Text-to-speech engines that :mod:`synthesis` submits jobs to.
+
+``fakeyou`` is the hosted Yoda voice used for everything by default.
+``local`` is an offline stand-in voice for when FakeYou is slow or down.
+"""
+
+from engines.base import Engine, EngineError, JobStatus, RateLimited
+from engines.fakeyou_engine import FakeYouEngine
+from engines.local_engine import LocalEngine
+
+__all__ = [
+    "Engine",
+    "EngineError",
+    "FakeYouEngine",
+    "JobStatus",
+    "LocalEngine",
+    "RateLimited",
+    "get_engine",
+    "reset_engines",
+]
+
+_engines: dict[str, Engine] = {}
+
+
+def get_engine(name: str = "fakeyou") -> Engine:
+    """Return the process-wide engine called ``name``.
+
+    Raises:
+        KeyError: if there is no such engine.
+    """
+    if not _engines:
+        for engine in (FakeYouEngine(), LocalEngine()):
+            _engines[engine.name] = engine
+    return _engines[name]
+
+
+def reset_engines() -> None:
+    """Forget the engines, and any local jobs they were running."""
+    _engines.clear()
@@ -0,0 +1,88 @@
+"""The interface every text-to-speech engine implements."""
+
+from dataclasses import dataclass
+from typing import BinaryIO
+
+
+class EngineError(Exception):
+    """An engine refused or lost a job.
+
+    ``reason`` is a short outcome for metrics, as on
+    :class:`synthesis.SynthesisError`.
+    """
+
+    def __init__(self, message: str, reason: str = "error"):
+        super().__init__(message)
+        self.reason = reason
+
+
+class RateLimited(Exception):
+    """The engine answered 429; try again after ``retry_after`` seconds."""
+
+    def __init__(self, retry_after: float | None = None):
+        super().__init__("Rate limited")
+        self.retry_after = retry_after
+
+
+@dataclass
+class JobStatus:
+    """Where a job is, in FakeYou's status vocabulary (see :mod:`polling`)."""
+
+    status: str
+    attempt_count: int = 0
+    # Jobs ahead of it in the engine's queue, if the engine says
+    queue_position: int | None = None
+    # Set once the status is complete_success
+    audio_url: str | None = None
+    error: str | None = None
+
+
+class Engine:
+    """A way of turning text into a wav clip, as a job to submit and poll.
+
+    :mod:`synthesis` drives every engine the same way: ``submit`` a job,
+    ``poll`` it on the :class:`polling.PollScheduler` schedule until it
+    succeeds or fails, then ``fetch`` its audio; ``cancel`` if the job is no
+    longer wanted.
+    """
+
+    name = ""
+    # rate_limit names for submissions and polls, or None for no limit
+    submit_limit: str | None = None
+    poll_limit: str | None = None
+    # Jobs outlive this process, so they are journaled and resumed on restart
+    durable = False
+    # Clips are worth keeping in the audio cache
+    cacheable = True
+
+    def available(self) -> bool:
+        """True if the engine can be used here."""
+        return True
+
+    def models(self) -> list[tuple[str, str]]:
+        """Return the ``(model_token, model_name)`` pairs the engine offers."""
+        raise NotImplementedError
+
+    async def submit(self, quote: str, model_token: str, idempotency_token: str) -> str:
+        """Start a job for ``quote`` and return its job token.
+
+        Raises:
+            RateLimited: if the engine asks to be called later.
+            EngineError: if the job is refused.
+        """
+        raise NotImplementedError
+
+    async def poll(self, job_token: str) -> JobStatus | None:
+        """Return the job's status, or None if the engine could not say.
+
+        Raises:
+            RateLimited: if the engine asks to be polled later.
+        """
+        raise NotImplementedError
+
+    async def fetch(self, audio_url: str, *sinks: BinaryIO) -> int:
+        """Write a finished job's audio into every sink; return the byte count."""
+        raise NotImplementedError
+
+    async def cancel(self, job_token: str) -> None:
+        """Stop a job that is no longer wanted, if the engine allows it."""
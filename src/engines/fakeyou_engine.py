@@ -0,0 +1,83 @@
+"""FakeYou's hosted TTS API as an engine."""
+
+import logging
+from typing import BinaryIO
+
+from engines.base import Engine, EngineError, JobStatus, RateLimited
+from fakeyou import (
+    HEADERS,
+    POST_PATH,
+    STATUS_PATH,
+    YODA_MODELS,
+    api_url,
+    get_http_client,
+    stream_download,
+)
+from polling import parse_retry_after
+
+logger = logging.getLogger(__name__)
+
+
+class FakeYouEngine(Engine):
+    """Jobs queue on FakeYou's servers and are fetched from its CDN."""
+
+    name = "fakeyou"
+    submit_limit = "post"
+    poll_limit = "poll"
+    durable = True
+
+    def models(self) -> list[tuple[str, str]]:
+        return YODA_MODELS
+
+    async def submit(self, quote: str, model_token: str, idempotency_token: str) -> str:
+        post_body = {
+            "uuid_idempotency_token": idempotency_token,
+            "tts_model_token": model_token,
+            "inference_text": quote,
+        }
+        response = await get_http_client().post(
+            api_url(POST_PATH), json=post_body, headers=HEADERS
+        )
+        if response.status_code == 429:
+            raise RateLimited(parse_retry_after(response.headers.get("Retry-After")))
+        response.raise_for_status()
+        data = response.json()
+        if not data.get("success"):
+            logger.error(f"POST response: {data}")
+            raise EngineError(
+                data.get("error_reason", "Unknown error"), reason="rejected"
+            )
+        return data["inference_job_token"]
+
+    async def poll(self, job_token: str) -> JobStatus | None:
+        response = await get_http_client().get(
+            api_url(STATUS_PATH) + job_token, headers=HEADERS
+        )
+        if response.status_code == 429:
+            raise RateLimited(parse_retry_after(response.headers.get("Retry-After")))
+        response.raise_for_status()
+        data = response.json()
+        if not data.get("success"):
+            logger.error(f"Job status check failed: {data}")
+            return None
+
+        state = data.get("state", {})
+        status_info = state.get("status", {})
+        result = state.get("maybe_result") or {}
+        return JobStatus(
+            status=status_info.get("status", "unknown"),
+            attempt_count=status_info.get("attempt_count", 0),
+            queue_position=status_info.get("maybe_queue_position"),
+            audio_url=(result.get("media_links") or {}).get("cdn_url"),
+            error=state.get(
+                "error",
+                status_info.get("maybe_extra_status_description", "Unknown error"),
+            ),
+        )
+
+    async def fetch(self, audio_url: str, *sinks: BinaryIO) -> int:
+        return await stream_download(audio_url, *sinks)
+
+    async def cancel(self, job_token: str) -> None:
+        # The public API cannot cancel a job; it finishes unread on FakeYou
+        pass
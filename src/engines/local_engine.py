@@ -0,0 +1,128 @@
+"""An offline voice from a TTS program installed on this machine.
+
+It sounds nothing like Yoda, but it answers in about a second whatever
+FakeYou is doing, so :mod:`synthesis` can fall back to it when FakeYou is
+slow or down (see ``YODA_LOCAL_FALLBACK_AFTER``).
+
+``YODA_LOCAL_TTS`` is the command to run, with ``{text}`` where the quote
+goes; it must write a wav to stdout. Unset, espeak-ng or espeak is used if
+installed, pitched low and slowed down.
+"""
+
+import asyncio
+import logging
+import os
+import shlex
+import shutil
+import uuid
+from typing import BinaryIO
+
+from audio_stream import WavCheck
+from config import env_str
+from engines.base import Engine, EngineError, JobStatus
+
+logger = logging.getLogger(__name__)
+
+LOCAL_MODEL = "local"
+
+# Built-in commands, in order of preference
+COMMANDS = {
+    "espeak-ng": ["espeak-ng", "-p", "20", "-s", "130", "--stdout", "{text}"],
+    "espeak": ["espeak", "-p", "20", "-s", "130", "--stdout", "{text}"],
+}
+
+# Characters of error output kept from a failed command
+MAX_ERROR_CHARS = 200
+
+
+class LocalEngine(Engine):
+    """Each job is one run of the local TTS command, kept in memory."""
+
+    name = "local"
+    # A stand-in voice; the next request should try FakeYou again
+    cacheable = False
+
+    def __init__(self):
+        self._processes: dict[str, asyncio.Task] = {}
+        self._audio: dict[str, bytes] = {}
+
+    def command(self) -> list[str] | None:
+        """Return the argv template to run, or None if there is nothing to run."""
+        configured = env_str("YODA_LOCAL_TTS")
+        if configured:
+            return shlex.split(configured)
+        for program, argv in COMMANDS.items():
+            if shutil.which(program):
+                return argv
+        return None
+
+    def available(self) -> bool:
+        command = self.command()
+        return command is not None and shutil.which(command[0]) is not None
+
+    def models(self) -> list[tuple[str, str]]:
+        command = self.command()
+        program = os.path.basename(command[0]) if command else "none"
+        return [(LOCAL_MODEL, f"Local voice ({program})")]
+
+    async def submit(self, quote: str, model_token: str, idempotency_token: str) -> str:
+        command = self.command()
+        if command is None:
+            raise EngineError("No local TTS program is installed", reason="rejected")
+        argv = [arg.replace("{text}", quote) for arg in command]
+        job_token = uuid.uuid4().hex
+        self._processes[job_token] = asyncio.create_task(self._run(argv))
+        return job_token
+
+    async def _run(self, argv: list[str]) -> bytes:
+        process = await asyncio.create_subprocess_exec(
+            *argv,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            stdout, stderr = await process.communicate()
+        except asyncio.CancelledError:
+            process.kill()
+            await process.wait()
+            raise
+        if process.returncode != 0:
+            error = stderr.decode(errors="replace").strip()[:MAX_ERROR_CHARS]
+            raise EngineError(
+                f"{argv[0]} exited with status {process.returncode}: {error}",
+                reason="failed",
+            )
+        return stdout
+
+    async def poll(self, job_token: str) -> JobStatus | None:
+        task = self._processes.get(job_token)
+        if task is None:
+            return None
+        if not task.done():
+            return JobStatus("started")
+        del self._processes[job_token]
+        try:
+            self._audio[job_token] = task.result()
+        except (OSError, EngineError) as e:
+            return JobStatus("failed", error=str(e))
+        return JobStatus("complete_success", audio_url=f"local:{job_token}")
+
+    async def fetch(self, audio_url: str, *sinks: BinaryIO) -> int:
+        audio = self._audio.pop(audio_url.removeprefix("local:"), None)
+        if audio is None:
+            raise EngineError(f"No local audio at {audio_url}")
+        check = WavCheck()
+        # Piped output has no length in its header, so this only checks the start
+        chunk = check.feed(audio)
+        check.finish()
+        for sink in sinks:
+            sink.write(chunk)
+        return len(chunk)
+
+    async def cancel(self, job_token: str) -> None:
+        task = self._processes.pop(job_token, None)
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        self._audio.pop(job_token, None)
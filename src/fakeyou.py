@@ -0,0 +1,136 @@
+"""FakeYou API endpoints and the shared HTTP client used to reach them.
+
+One pooled, keep-alive ``httpx.AsyncClient`` is shared by every request the
+server makes, so concurrent tool calls reuse TCP/TLS connections instead of
+opening new ones per call.
+"""
+
+import asyncio
+import logging
+from typing import BinaryIO
+
+import httpx
+
+from audio_stream import InvalidAudioError, WavCheck
+from config import env_int, env_str
+from metrics import get_metrics
+from polling import parse_retry_after
+from rate_limit import get_rate_limiter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_API_URL = "https://api.fakeyou.com"
+POST_PATH = "/tts/inference"
+STATUS_PATH = "/v1/model_inference/job_status/"
+
+POST_URL = DEFAULT_API_URL + POST_PATH
+GET_URL = DEFAULT_API_URL + STATUS_PATH
+
+# Add headers that might be required
+HEADERS = {
+    "Accept": "application/json",
+    "Content-Type": "application/json",
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36",
+}
+
+# List of Yoda models to try in order of preference
+YODA_MODELS = [
+    ("weight_8ye42btvd3ybnc6srbghr2ap2", "Yoda (Version 1.0)"),
+    ("weight_tqpbyrp6t9rmdez9c38zzvp0z", "Yoda (Version 2.0)"),
+]
+
+API_TIMEOUT = 10.0
+DOWNLOAD_TIMEOUT = 30.0
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+DOWNLOAD_RETRIES = 2
+# Largest clip downloaded, unless YODA_MAX_CLIP_BYTES says otherwise
+DEFAULT_MAX_CLIP_BYTES = 32 * 1024 * 1024
+
+
+def api_url(path: str) -> str:
+    """Return the URL of ``path`` on the FakeYou API.
+
+    ``YODA_FAKEYOU_API_URL`` points the server at another base URL, such as the
+    local stand-in used by the benchmarks.
+    """
+    return env_str("YODA_FAKEYOU_API_URL", DEFAULT_API_URL).rstrip("/") + path
+
+
+_client: httpx.AsyncClient | None = None
+_client_loop: asyncio.AbstractEventLoop | None = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared client, creating it on first use.
+
+    A client's connection pool belongs to the event loop it was first used on,
+    so a fresh client is created if called from a different loop.
+    """
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(API_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=32,
+                max_keepalive_connections=16,
+                keepalive_expiry=60.0,
+            ),
+            follow_redirects=True,
+        )
+        _client_loop = loop
+    return _client
+
+
+async def close_http_client() -> None:
+    """Close the shared client, if one was opened."""
+    global _client, _client_loop
+    if _client is not None:
+        await _client.aclose()
+    _client = None
+    _client_loop = None
+
+
+def max_clip_bytes() -> int:
+    """Largest clip to download, from ``YODA_MAX_CLIP_BYTES`` (``0``: no limit)."""
+    return env_int("YODA_MAX_CLIP_BYTES", DEFAULT_MAX_CLIP_BYTES)
+
+
+async def stream_download(url: str, *sinks: BinaryIO) -> int:
+    """Stream ``url`` into every sink in chunks and return the number of bytes.
+
+    Downloads share the ``download`` rate limit; a 429 is waited out and
+    retried up to ``DOWNLOAD_RETRIES`` times before nothing has been written.
+
+    Raises:
+        InvalidAudioError: as soon as the body is found not to be a wav clip,
+            to be over ``YODA_MAX_CLIP_BYTES``, or (at the end) to be
+            truncated. Nothing is written to the sinks before the wav header
+            has been checked.
+    """
+    client = get_http_client()
+    limiter = get_rate_limiter("download")
+    written = 0
+    for attempt in range(DOWNLOAD_RETRIES + 1):
+        await limiter.acquire()
+        async with client.stream("GET", url, timeout=DOWNLOAD_TIMEOUT) as response:
+            if response.status_code == 429 and attempt < DOWNLOAD_RETRIES:
+                get_metrics().inc("yoda_rate_limited_total", endpoint="download")
+                limiter.penalize(parse_retry_after(response.headers.get("Retry-After")))
+                continue
+            response.raise_for_status()
+            limiter.succeeded()
+            check = WavCheck(max_clip_bytes())
+            try:
+                check.check_length(response.headers.get("Content-Length"))
+                async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                    chunk = check.feed(chunk)
+                    for sink in sinks:
+                        sink.write(chunk)
+                    written += len(chunk)
+                check.finish()
+            except InvalidAudioError as e:
+                get_metrics().inc("yoda_downloads_rejected_total", reason=e.reason)
+                raise
+            return written
+    return written
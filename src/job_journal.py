@@ -0,0 +1,253 @@
+"""Durable record of FakeYou jobs that have been submitted but not finished.
+
+A job's token is written here as soon as FakeYou accepts it and removed once
+the job succeeds or fails. A job whose server was stopped or killed while it
+was being polled stays in the journal; one whose request was cancelled, or
+that lost a hedge race, is dropped with it. When the server starts again it polls
+those jobs to the end and puts their audio in the cache (see
+:func:`clips.resume_journaled_jobs`), so the queue time and synthesis are not
+thrown away. A request for the same quote while that runs joins the resumed
+job.
+
+The journal is a small JSON file, rewritten atomically on every change. The
+rewrite runs in a worker thread, so it never blocks the event loop, and
+changes made while one is under way are saved together by the next. It is
+only kept while the audio cache is enabled, since a resumed job has nowhere
+else to go.
+
+Every process keeps its own file, numbered with its pid next to the
+configured path (``journal.1234.json``), and holds an ``fcntl`` lock on it
+while it runs. Processes sharing a data dir so never overwrite each other's
+jobs. A starting server adopts only the files nobody holds, those of
+processes that have died, and so never resumes a job a live server is still
+polling. Without ``fcntl`` (on Windows) no file is adopted.
+"""
+
+import asyncio
+import glob
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass
+
+from audio_cache import get_audio_cache
+from config import data_dir, env_bool, env_str
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class JournalEntry:
+    """One submitted FakeYou job."""
+
+    job_token: str
+    quote: str
+    model_token: str
+    model_name: str
+    submitted_at: float
+
+
+class JobJournal:
+    """JSON file of the jobs in flight, keyed on job token.
+
+    With a ``pid``, the file is that process's own, numbered after ``path``
+    and locked until :meth:`close`; :meth:`adopt_orphans` then takes over
+    the files of other processes numbered after ``path`` that have died.
+    """
+
+    def __init__(self, path: str, pid: int | None = None):
+        self.base_path = path
+        self.path = path if pid is None else _numbered(path, pid)
+        self._lock = threading.Lock()
+        # Held while writing the file, so saves land in the order they began
+        self._save_lock = threading.Lock()
+        # Bumped on every change; the file holds the state of _saved_version
+        self._version = 0
+        self._saved_version = 0
+        # Set once the server starts shutting down; see begin_shutdown()
+        self.shutting_down = False
+        self._owner_fd = None if pid is None else _lock_file(self.path)
+        self._jobs: dict[str, JournalEntry] = {
+            job.job_token: job for job in _read(self.path)
+        }
+
+    def close(self) -> None:
+        """Release the file's lock, leaving its jobs for another process."""
+        if self._owner_fd is not None:
+            os.close(self._owner_fd)
+            self._owner_fd = None
+
+    def adopt_orphans(self) -> int:
+        """Move the jobs of dead processes' journals into this one.
+
+        Blocks on file I/O; call it from a worker thread. Returns the number
+        of jobs adopted.
+        """
+        if fcntl is None or self._owner_fd is None:
+            return 0
+        stem, ext = os.path.splitext(self.base_path)
+        paths = [
+            path
+            for path in glob.glob(f"{glob.escape(stem)}.*{ext}")
+            if path != self.path and path[len(stem) + 1 : -len(ext) or None].isdigit()
+        ]
+        if os.path.exists(self.base_path):
+            # Left by a server from before journals were numbered
+            paths.append(self.base_path)
+        adopted = 0
+        for path in paths:
+            fd = _lock_file(path)
+            if fd is None:
+                # Its process is still running
+                continue
+            try:
+                jobs = _read(path)
+                with self._lock:
+                    new = [job for job in jobs if job.job_token not in self._jobs]
+                    for job in new:
+                        self._jobs[job.job_token] = job
+                    if new:
+                        self._version += 1
+                adopted += len(new)
+                # Saved before the orphan goes, so a crash here loses nothing
+                self._save()
+                for orphan in (path, _lock_path(path)):
+                    try:
+                        os.unlink(orphan)
+                    except FileNotFoundError:
+                        pass
+            finally:
+                os.close(fd)
+        if adopted:
+            logger.info(f"Adopted {adopted} jobs from the journals of stopped servers")
+        return adopted
+
+    def _save(self) -> None:
+        with self._save_lock:
+            with self._lock:
+                if self._saved_version == self._version:
+                    # A save that started after our change has written it
+                    return
+                version = self._version
+                state = {"jobs": [asdict(job) for job in self._jobs.values()]}
+            try:
+                directory = os.path.dirname(os.path.abspath(self.path))
+                os.makedirs(directory, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(state, f)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logger.warning(f"Could not save job journal: {e}")
+            self._saved_version = version
+
+    async def add(
+        self, job_token: str, quote: str, model_token: str, model_name: str
+    ) -> None:
+        """Record a job FakeYou has just accepted."""
+        with self._lock:
+            self._jobs[job_token] = JournalEntry(
+                job_token, quote, model_token, model_name, time.time()
+            )
+            self._version += 1
+        await asyncio.to_thread(self._save)
+
+    async def remove(self, job_token: str) -> None:
+        """Forget a job that has finished, one way or the other."""
+        with self._lock:
+            if self._jobs.pop(job_token, None) is None:
+                return
+            self._version += 1
+        await asyncio.to_thread(self._save)
+
+    def begin_shutdown(self) -> None:
+        """Keep the jobs still in flight for the next start.
+
+        Jobs cancelled before this are dropped from the journal; jobs
+        cancelled after it, as the server stops, stay to be resumed.
+        """
+        self.shutting_down = True
+
+    def entries(self) -> list[JournalEntry]:
+        """Return the recorded jobs, oldest first."""
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda job: job.submitted_at)
+
+
+def _numbered(path: str, pid: int) -> str:
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{pid}{ext}"
+
+
+def _lock_path(path: str) -> str:
+    return f"{os.path.splitext(path)[0]}.lock"
+
+
+def _lock_file(path: str) -> int | None:
+    """Lock ``path``'s lock file; return its descriptor, or None if it is held.
+
+    Without ``fcntl`` the descriptor is returned unlocked.
+    """
+    lock_path = _lock_path(path)
+    os.makedirs(os.path.dirname(os.path.abspath(lock_path)), exist_ok=True)
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    if fcntl is None:
+        return fd
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        # An adopter may have removed the file between our open and flock
+        if os.fstat(fd).st_ino == os.stat(lock_path).st_ino:
+            return fd
+    except (BlockingIOError, FileNotFoundError):
+        pass
+    os.close(fd)
+    return None
+
+
+def _read(path: str) -> list[JournalEntry]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            saved = json.load(f)
+        return [JournalEntry(**job) for job in saved.get("jobs", [])]
+    except FileNotFoundError:
+        return []
+    except (OSError, ValueError, TypeError) as e:
+        logger.warning(f"Ignoring unreadable job journal {path}: {e}")
+        return []
+
+
+_journal: JobJournal | None = None
+
+
+def get_job_journal() -> JobJournal | None:
+    """Return this process's job journal, or None while it is not kept.
+
+    It is not kept while the cache is disabled, nor with
+    ``YODA_JOB_JOURNAL_ENABLED`` off. It is numbered after
+    ``YODA_JOB_JOURNAL``, or after ``journal.json`` under the data dir.
+    """
+    global _journal
+    if get_audio_cache() is None or not env_bool("YODA_JOB_JOURNAL_ENABLED", True):
+        return None
+    if _journal is None:
+        path = env_str("YODA_JOB_JOURNAL") or os.path.join(
+            data_dir("jobs"), "journal.json"
+        )
+        _journal = JobJournal(path, pid=os.getpid())
+    return _journal
+
+
+def reset_job_journal() -> None:
+    """Forget the process-wide job journal (the file is kept)."""
+    global _journal
+    if _journal is not None:
+        _journal.close()
+    _journal = None
@@ -0,0 +1,69 @@
+"""Progress of the work speaking a quote, for tools to pass on to clients.
+
+Jobs and downloads are shared between callers (see :mod:`single_flight`), so
+progress is published by quote rather than to whichever call started the
+work: every tool call waiting on a quote hears how its job is doing.
+Callbacks run on the event loop and must not block.
+"""
+
+import logging
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Callable, Iterator
+
+from audio_cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+STARTED = "started"
+DOWNLOADING = "downloading"
+PLAYING = "playing"
+# In the order a quote goes through them
+STAGES = (QUEUED, STARTED, DOWNLOADING, PLAYING)
+
+
+@dataclass
+class JobProgress:
+    """Where the work on a quote has got to."""
+
+    stage: str
+    model_name: str | None = None
+    # Set when FakeYou reports them
+    attempt_count: int | None = None
+    queue_position: int | None = None
+    # Clips ahead of it in the playback queue, once it is playing
+    playback_position: int | None = None
+
+    def describe(self) -> dict:
+        """Return the fields that are set, for a JSON log message."""
+        return {key: value for key, value in asdict(self).items() if value is not None}
+
+
+_watchers: dict[str, list[Callable[[JobProgress], None]]] = {}
+
+
+@contextmanager
+def watch(quotes: list[str], callback: Callable[[JobProgress], None]) -> Iterator[None]:
+    """Call ``callback(progress)`` for progress on any of ``quotes`` meanwhile."""
+    keys = [normalize_text(quote) for quote in quotes]
+    for key in keys:
+        _watchers.setdefault(key, []).append(callback)
+    try:
+        yield
+    finally:
+        for key in keys:
+            callbacks = _watchers.get(key, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if not callbacks:
+                _watchers.pop(key, None)
+
+
+def publish(quote: str, progress: JobProgress) -> None:
+    """Tell everyone watching ``quote`` about ``progress``."""
+    for callback in list(_watchers.get(normalize_text(quote), ())):
+        try:
+            callback(progress)
+        except Exception:
+            logger.exception("Progress callback failed")
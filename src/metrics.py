@@ -0,0 +1,317 @@
+"""In-process latency spans and counters, exportable as JSON or Prometheus text.
+
+Each tool call records a :class:`Span` with the time spent in each phase
+(POST, FakeYou queue, synthesis, download, ...) and its outcome. Counters
+track events such as 429s, fallbacks to the next model and cache hits.
+Phase durations feed histograms, so they can be scraped as Prometheus
+metrics or summarized as percentiles by the ``server_stats`` tool.
+
+Set ``YODA_METRICS_FILE`` to also write the Prometheus text to a file after
+every request, e.g. for node_exporter's textfile collector.
+"""
+
+import bisect
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator
+
+from config import env_str
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds in seconds; FakeYou jobs can take a minute
+BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+# Durations kept per histogram for the percentiles in the JSON snapshot
+RESERVOIR_SIZE = 1024
+
+# Finished spans kept for the JSON snapshot
+RECENT_SPANS = 20
+
+HELP = {
+    "yoda_requests_total": "Tool calls by tool and outcome.",
+    "yoda_request_seconds": "End-to-end tool call latency.",
+    "yoda_phase_seconds": "Time spent in each phase of a request.",
+    "yoda_jobs_total": "FakeYou jobs by model and outcome.",
+    "yoda_job_seconds": "FakeYou job latency from POST to result, by model.",
+    "yoda_jobs_resumed_total": "Journaled jobs resumed after a restart, by outcome.",
+    "yoda_polls_total": "FakeYou job_status polls, by model.",
+    "yoda_rate_limited_total": "429 responses from FakeYou, by endpoint.",
+    "yoda_fallbacks_total": "Times a failed model was followed by the next one.",
+    "yoda_local_fallbacks_total": "Quotes also given to the local voice, by reason (slow or failed).",
+    "yoda_hedges_total": "Times a slow model was hedged with the next one.",
+    "yoda_single_flight_joined_total": "Requests that shared a FakeYou job or download already in flight.",
+    "yoda_downloads_rejected_total": "Downloads dropped as not a wav, too large or truncated.",
+    "yoda_worker_jobs_total": "Quotes handed to worker processes, by worker and outcome.",
+    "yoda_prewarm_total": "Corpus quotes synthesized in the background, by outcome.",
+    "yoda_cache_hits_total": "Audio cache hits.",
+    "yoda_cache_misses_total": "Audio cache misses.",
+    "yoda_cache_bytes": "Bytes held in the audio cache.",
+}
+
+Labels = tuple[tuple[str, str], ...]
+
+
+def _labels(labels: dict) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels, extra: dict | None = None) -> str:
+    pairs = list(labels) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def _sampled_gauges() -> dict[str, float]:
+    """Values read at export time rather than counted as they happen."""
+    # Imported lazily so the cache is only opened when metrics are exported
+    from audio_cache import get_audio_cache
+
+    cache = get_audio_cache()
+    if cache is None:
+        return {}
+    stats = cache.stats()
+    return {
+        "yoda_cache_hits_total": stats["hits"],
+        "yoda_cache_misses_total": stats["misses"],
+        "yoda_cache_bytes": stats["bytes"],
+    }
+
+
+def _percentile(ordered: list[float], pct: float) -> float:
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+class Histogram:
+    """Cumulative buckets plus a reservoir of recent values for percentiles."""
+
+    def __init__(self):
+        self.bucket_counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.recent: deque[float] = deque(maxlen=RESERVOIR_SIZE)
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(BUCKETS, value)
+        if index < len(BUCKETS):
+            self.bucket_counts[index] += 1
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def summary(self) -> dict:
+        ordered = sorted(self.recent)
+        if not ordered:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean": round(self.sum / self.count, 4),
+            "p50": round(_percentile(ordered, 50), 4),
+            "p95": round(_percentile(ordered, 95), 4),
+            "p99": round(_percentile(ordered, 99), 4),
+            "max": round(ordered[-1], 4),
+        }
+
+
+@dataclass
+class Span:
+    """Timings and outcome of one tool call."""
+
+    name: str
+    attrs: dict = field(default_factory=dict)
+    started_at: float = field(default_factory=time.time)
+    # Seconds per phase, in the order they were recorded
+    phases: dict[str, float] = field(default_factory=dict)
+    outcome: str | None = None
+    duration: float | None = None
+    _start: float = field(default_factory=time.monotonic, repr=False)
+    _metrics: "Metrics | None" = field(default=None, repr=False)
+
+    def record(self, phase: str, seconds: float) -> None:
+        """Add ``seconds`` to ``phase``."""
+        self.phases[phase] = round(self.phases.get(phase, 0.0) + seconds, 4)
+
+    def record_all(self, timings: dict[str, float]) -> None:
+        """Add every phase of a ``timings`` dict, ignoring its ``total``."""
+        for phase, seconds in timings.items():
+            if phase != "total":
+                self.record(phase, seconds)
+
+    @contextmanager
+    def phase(self, phase: str) -> Iterator[None]:
+        """Time the body of the ``with`` block as ``phase``."""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(phase, time.monotonic() - started)
+
+    def finish(self, outcome: str) -> None:
+        """Close the span and feed its timings into the metrics."""
+        if self.duration is not None:
+            return
+        self.outcome = outcome
+        self.duration = round(time.monotonic() - self._start, 4)
+        if self._metrics is not None:
+            self._metrics._finish_span(self)
+
+    def describe(self) -> dict:
+        """Return a JSON-friendly summary of the span."""
+        return {
+            "name": self.name,
+            **self.attrs,
+            "started_at": round(self.started_at, 3),
+            "outcome": self.outcome,
+            "duration": self.duration,
+            "phases": self.phases,
+        }
+
+
+class Metrics:
+    """Thread-safe counters, histograms and recent spans."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: dict[str, dict[Labels, float]] = {}
+        self._histograms: dict[str, dict[Labels, Histogram]] = {}
+        self._recent: deque[Span] = deque(maxlen=RECENT_SPANS)
+        # Spans started but not finished, and when the last one finished
+        self._active = 0
+        self._last_finished = time.monotonic()
+
+    def inc(self, name: str, amount: float = 1, **labels) -> None:
+        """Add ``amount`` to the counter ``name`` with ``labels``."""
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        """Record a duration in the histogram ``name`` with ``labels``."""
+        key = _labels(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            series.setdefault(key, Histogram()).observe(seconds)
+
+    def counter(self, name: str, **labels) -> float:
+        """Return the current value of a counter (0 if never incremented)."""
+        with self._lock:
+            return self._counters.get(name, {}).get(_labels(labels), 0)
+
+    def span(self, name: str, **attrs) -> Span:
+        """Start a span; call :meth:`Span.finish` to record it."""
+        with self._lock:
+            self._active += 1
+        return Span(name=name, attrs=attrs, _metrics=self)
+
+    def idle_for(self) -> float | None:
+        """Seconds since the last span finished, or None while any is running."""
+        with self._lock:
+            if self._active:
+                return None
+            return time.monotonic() - self._last_finished
+
+    def _finish_span(self, span: Span) -> None:
+        with self._lock:
+            self._active -= 1
+            self._last_finished = time.monotonic()
+        for phase, seconds in span.phases.items():
+            self.observe("yoda_phase_seconds", seconds, phase=phase)
+        self.observe(
+            "yoda_request_seconds", span.duration, tool=span.name, outcome=span.outcome
+        )
+        self.inc("yoda_requests_total", tool=span.name, outcome=span.outcome)
+        with self._lock:
+            self._recent.append(span)
+        path = env_str("YODA_METRICS_FILE")
+        if path:
+            self.write_prometheus(path)
+
+    def snapshot(self) -> dict:
+        """Return counters, latency percentiles and recent spans as a dict."""
+        with self._lock:
+            counters = {
+                name: {
+                    _format_labels(key) or "total": value
+                    for key, value in series.items()
+                }
+                for name, series in sorted(self._counters.items())
+            }
+            latency = {
+                name: {
+                    _format_labels(key) or "all": histogram.summary()
+                    for key, histogram in series.items()
+                }
+                for name, series in sorted(self._histograms.items())
+            }
+            recent = [span.describe() for span in self._recent]
+        return {"counters": counters, "latency": latency, "recent": recent}
+
+    def prometheus(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        gauges = _sampled_gauges()
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{_format_labels(key)} {value:g}")
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(BUCKETS, histogram.bucket_counts):
+                        cumulative += count
+                        labels = _format_labels(key, {"le": f"{bound:g}"})
+                        lines.append(f"{name}_bucket{labels} {cumulative}")
+                    labels = _format_labels(key, {"le": "+Inf"})
+                    lines.append(f"{name}_bucket{labels} {histogram.count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {histogram.sum:.6f}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        for name, value in sorted(gauges.items()):
+            kind = "counter" if name.endswith("_total") else "gauge"
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        """Atomically replace ``path`` with the Prometheus text."""
+        try:
+            directory = os.path.dirname(os.path.abspath(path))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                f.write(self.prometheus())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write metrics to {path}: {e}")
+
+
+_default_metrics = Metrics()
+
+
+def get_metrics() -> Metrics:
+    """Return the process-wide metrics registry."""
+    return _default_metrics
+
+
+def reset_metrics() -> None:
+    """Start the process-wide registry from zero."""
+    global _default_metrics
+    _default_metrics = Metrics()
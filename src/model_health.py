@@ -0,0 +1,252 @@
+"""Health tracking and circuit breaking per Yoda model.
+
+Every finished job is recorded against its model: whether it succeeded, how
+long it took and how long it sat in FakeYou's queue. The last
+``YODA_HEALTH_WINDOW`` jobs per model give a rolling success rate and median
+latency. Models are then tried in order of expected latency, the median job
+time divided by the success rate, rather than in the order of ``YODA_MODELS``.
+
+Models are only measured when they are tried, so without probes the first
+model to succeed would be tried first forever and the others never timed.
+A model with no jobs yet, or none in ``YODA_HEALTH_PROBE_INTERVAL`` seconds,
+is therefore tried first by the next request, as a probe; one request at a
+time probes each model.
+
+After ``YODA_BREAKER_FAILURES`` failures in a row a model's breaker opens,
+and for ``YODA_BREAKER_COOLDOWN`` seconds the model goes to the back of the
+list. Every healthy model is tried before it. After the cooldown the breaker
+is half-open: the next request tries the model first, as a probe. Success
+closes the breaker; failure opens it for another cooldown. Models are demoted
+rather than skipped, so a request still reaches an open model when every
+other model fails.
+
+Rate limiting and cancelled hedges say nothing about a model and are not
+recorded.
+"""
+
+import statistics
+import threading
+import time
+from collections import deque
+from typing import Callable
+
+from config import env_float, env_int
+
+# Jobs per model the rolling stats are taken over
+DEFAULT_WINDOW = 20
+# Failures in a row that open a model's breaker
+DEFAULT_FAILURES = 3
+# Seconds a breaker stays open before the model is probed
+DEFAULT_COOLDOWN = 60.0
+# Seconds without a job after which a healthy model is probed again
+DEFAULT_PROBE_INTERVAL = 300.0
+
+# Outcomes that are not the model's fault
+IGNORED_OUTCOMES = ("rate_limited", "cancelled")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class ModelHealth:
+    """Rolling stats and circuit breaker state for one model."""
+
+    def __init__(
+        self,
+        model_name: str,
+        window: int = DEFAULT_WINDOW,
+        failures: int = DEFAULT_FAILURES,
+        cooldown: float = DEFAULT_COOLDOWN,
+        probe_interval: float = DEFAULT_PROBE_INTERVAL,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.model_name = model_name
+        self.failures = failures
+        self.cooldown = cooldown
+        self.probe_interval = probe_interval
+        self._clock = clock
+        self.outcomes: deque[bool] = deque(maxlen=window)
+        self.latencies: deque[float] = deque(maxlen=window)
+        self.queue_times: deque[float] = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.opened_at: float | None = None
+        self.probing = False
+        self.last_job_at: float | None = None
+        self.last_error: str | None = None
+
+    def state(self) -> str:
+        if self.opened_at is None:
+            return CLOSED
+        if self._clock() - self.opened_at < self.cooldown or self.probing:
+            return OPEN
+        return HALF_OPEN
+
+    def needs_probe(self) -> bool:
+        """Whether a closed model is due a job to measure it (again)."""
+        if self.opened_at is not None or self.probing:
+            return False
+        if self.last_job_at is None:
+            return True
+        return (
+            self.probe_interval > 0
+            and self._clock() - self.last_job_at >= self.probe_interval
+        )
+
+    def success_rate(self) -> float | None:
+        if not self.outcomes:
+            return None
+        return sum(self.outcomes) / len(self.outcomes)
+
+    def median_latency(self) -> float | None:
+        return statistics.median(self.latencies) if self.latencies else None
+
+    def median_queue_time(self) -> float | None:
+        return statistics.median(self.queue_times) if self.queue_times else None
+
+    def expected_latency(self) -> float | None:
+        """Median job time over success rate; None for a model not measured yet."""
+        latency = self.median_latency()
+        rate = self.success_rate()
+        if latency is None or rate is None:
+            return None
+        return latency / max(rate, 0.05)
+
+    def succeeded(self, seconds: float, queue_seconds: float | None = None) -> None:
+        self.outcomes.append(True)
+        self.last_job_at = self._clock()
+        self.latencies.append(seconds)
+        if queue_seconds is not None:
+            self.queue_times.append(queue_seconds)
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def failed(self, error: str) -> None:
+        self.outcomes.append(False)
+        self.last_job_at = self._clock()
+        self.consecutive_failures += 1
+        self.last_error = error
+        if self.opened_at is not None or self.consecutive_failures >= self.failures:
+            # Trips the breaker, or re-opens it after a failed probe
+            self.opened_at = self._clock()
+        self.probing = False
+
+    def stats(self) -> dict:
+        rate = self.success_rate()
+        latency = self.median_latency()
+        queue_time = self.median_queue_time()
+        stats = {
+            "state": self.state(),
+            "jobs": len(self.outcomes),
+            "success_rate": None if rate is None else round(rate, 3),
+            "median_seconds": None if latency is None else round(latency, 3),
+            "median_queue_seconds": (
+                None if queue_time is None else round(queue_time, 3)
+            ),
+            "consecutive_failures": self.consecutive_failures,
+        }
+        if self.opened_at is not None:
+            stats["open_for"] = round(
+                max(0.0, self.cooldown - (self._clock() - self.opened_at)), 3
+            )
+        if self.last_error:
+            stats["last_error"] = self.last_error
+        return stats
+
+
+class ModelHealthTracker:
+    """Health of every model, and the order to try them in."""
+
+    def __init__(self, **settings):
+        self._settings = settings
+        self._lock = threading.Lock()
+        self._models: dict[str, ModelHealth] = {}
+
+    def _health(self, model_token: str, model_name: str) -> ModelHealth:
+        health = self._models.get(model_token)
+        if health is None:
+            health = self._models[model_token] = ModelHealth(
+                model_name, **self._settings
+            )
+        return health
+
+    def record(
+        self,
+        model_token: str,
+        model_name: str,
+        outcome: str,
+        seconds: float = 0.0,
+        timings: dict[str, float] | None = None,
+        error: str | None = None,
+    ) -> None:
+        """Record a finished job: ``outcome`` is "success" or a failure reason."""
+        with self._lock:
+            health = self._health(model_token, model_name)
+            if outcome in IGNORED_OUTCOMES:
+                # A probe that told us nothing; the next request probes again
+                health.probing = False
+            elif outcome == "success":
+                queue_seconds = None if timings is None else timings.get("pending")
+                health.succeeded(seconds, queue_seconds)
+            else:
+                health.failed(error or outcome)
+
+    def order(self, models: list[tuple[str, str]]) -> list[tuple[str, str]]:
+        """Return ``models`` in the order to try them.
+
+        Models due a probe come first: half-open ones, and closed ones not
+        measured yet or not lately. Then the other closed models, fastest
+        expected latency first. Models with open breakers come last.
+        """
+        with self._lock:
+            ranked = []
+            for index, (model_token, model_name) in enumerate(models):
+                health = self._health(model_token, model_name)
+                rank = {HALF_OPEN: 0, CLOSED: 1, OPEN: 2}[health.state()]
+                if health.needs_probe():
+                    rank = 0
+                expected = health.expected_latency()
+                ranked.append(
+                    (rank, expected is None, expected or 0.0, index, model_token)
+                )
+            ranked.sort()
+            by_token = dict(models)
+            return [(token, by_token[token]) for *_, token in ranked]
+
+    def started(self, model_token: str, model_name: str) -> None:
+        """Note a job starting; on a model due a probe it is the one probe."""
+        with self._lock:
+            health = self._health(model_token, model_name)
+            if health.state() == HALF_OPEN or health.needs_probe():
+                health.probing = True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                health.model_name: health.stats() for health in self._models.values()
+            }
+
+
+_tracker: ModelHealthTracker | None = None
+
+
+def get_model_health() -> ModelHealthTracker:
+    """Return the process-wide tracker, configured from ``YODA_HEALTH_*``."""
+    global _tracker
+    if _tracker is None:
+        _tracker = ModelHealthTracker(
+            window=max(1, env_int("YODA_HEALTH_WINDOW", DEFAULT_WINDOW)),
+            failures=max(1, env_int("YODA_BREAKER_FAILURES", DEFAULT_FAILURES)),
+            cooldown=env_float("YODA_BREAKER_COOLDOWN", DEFAULT_COOLDOWN),
+            probe_interval=env_float(
+                "YODA_HEALTH_PROBE_INTERVAL", DEFAULT_PROBE_INTERVAL
+            ),
+        )
+    return _tracker
+
+
+def reset_model_health() -> None:
+    """Forget all model health, e.g. between tests."""
+    global _tracker
+    _tracker = None
@@ -0,0 +1,233 @@
+"""Background FIFO playback so tools return before the audio finishes.
+
+A single worker thread plays queued clips one at a time, in the order they were
+enqueued, so overlapping tool calls never talk over each other. A clip is
+either a wav file path or an :class:`audio_stream.AudioStream` that may still
+be downloading. Each queued
+item carries a :class:`concurrent.futures.Future` resolved with whether the
+clip was played, for callers that do want to wait.
+"""
+
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable
+
+from audio_backends import get_audio_backends
+from audio_stream import AudioStream
+from metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PlaybackItem:
+    """One clip waiting in, or taken from, the playback queue."""
+
+    id: int
+    source: str | AudioStream
+    label: str
+    on_done: Callable[[], None] | None = None
+    enqueued_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    # Resolved with True if the clip played, False if it failed or was dropped
+    future: Future = field(default_factory=Future)
+
+    def describe(self) -> dict:
+        """Return a JSON-friendly summary of the item."""
+        now = time.time()
+        info = {"id": self.id, "label": self.label}
+        if isinstance(self.source, AudioStream):
+            info["streaming"] = not self.source.complete
+            info["bytes"] = len(self.source)
+        else:
+            info["path"] = self.source
+        if self.started_at is None:
+            info["waiting"] = round(now - self.enqueued_at, 3)
+        else:
+            info["playing_for"] = round(now - self.started_at, 3)
+        return info
+
+
+class PlaybackQueue:
+    """Serialize playback of clips on a background worker thread."""
+
+    def __init__(
+        self,
+        player: Callable[[str | AudioStream], bool],
+        stopper: Callable[[], None] | None = None,
+    ):
+        """
+        Args:
+            player: Blocking function that plays a file path or an in-memory
+                stream and reports success.
+            stopper: Interrupts the clip ``player`` is currently playing.
+        """
+        self._player = player
+        self._stopper = stopper
+        self._items: deque[PlaybackItem] = deque()
+        self._current: PlaybackItem | None = None
+        self._condition = threading.Condition()
+        self._ids = itertools.count(1)
+        self._worker: threading.Thread | None = None
+        self.played = 0
+        self.failed = 0
+        self.skipped = 0
+        self.flushed = 0
+
+    def enqueue(
+        self,
+        source: str | AudioStream,
+        label: str = "",
+        on_done: Callable[[], None] | None = None,
+    ) -> PlaybackItem:
+        """Queue a wav file or stream for playback and return immediately.
+
+        A stream may still be downloading; playback starts once its header has
+        arrived. ``on_done`` runs on the worker once the clip has played,
+        failed or been dropped.
+        """
+        item = PlaybackItem(
+            id=next(self._ids), source=source, label=label, on_done=on_done
+        )
+        with self._condition:
+            self._items.append(item)
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name="yoda-playback", daemon=True
+                )
+                self._worker.start()
+            self._condition.notify()
+        return item
+
+    def position(self, item: PlaybackItem) -> int:
+        """Return how many clips play before ``item`` (0 if it is playing now)."""
+        with self._condition:
+            if self._current is item:
+                return 0
+            try:
+                return self._items.index(item) + (self._current is not None)
+            except ValueError:
+                return 0
+
+    def skip(self) -> dict | None:
+        """Stop the clip that is playing now; the next one starts right away."""
+        with self._condition:
+            current = self._current
+            if current is None:
+                return None
+            logger.info(f"Skipping playback of: {current.label}")
+            self.skipped += 1
+            # Under the lock the worker cannot move on, so a clip that ends
+            # meanwhile cannot leave this stop to land on the next one
+            if self._stopper is not None:
+                self._stopper()
+        return current.describe()
+
+    def flush(self) -> int:
+        """Drop every clip still waiting; the one playing now is left alone."""
+        with self._condition:
+            dropped = list(self._items)
+            self._items.clear()
+            self._condition.notify_all()
+        for item in dropped:
+            self._finish(item, False)
+        self.flushed += len(dropped)
+        return len(dropped)
+
+    def status(self) -> dict:
+        """Return the playing clip, the waiting clips and lifetime counters."""
+        with self._condition:
+            current = self._current.describe() if self._current else None
+            waiting = [item.describe() for item in self._items]
+        return {
+            "playing": current,
+            "queued": waiting,
+            "played": self.played,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "flushed": self.flushed,
+        }
+
+    def wait_idle(self, timeout: float | None = None) -> bool:
+        """Block until nothing is playing or queued; return False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while self._items or self._current is not None:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._items:
+                    self._condition.wait()
+                item = self._items.popleft()
+                self._current = item
+                item.started_at = time.time()
+            played = False
+            try:
+                played = self._player(item.source)
+            except Exception as e:
+                logger.error(f"Playback of {item.label!r} failed: {e}")
+            if played:
+                self.played += 1
+            else:
+                self.failed += 1
+            metrics = get_metrics()
+            metrics.observe(
+                "yoda_phase_seconds",
+                item.started_at - item.enqueued_at,
+                phase="playback_wait",
+            )
+            metrics.observe(
+                "yoda_phase_seconds", time.time() - item.started_at, phase="playback"
+            )
+            self._finish(item, played)
+            with self._condition:
+                self._current = None
+                self._condition.notify_all()
+
+    def _finish(self, item: PlaybackItem, played: bool) -> None:
+        if item.on_done is not None:
+            try:
+                item.on_done()
+            except Exception as e:
+                logger.warning(f"Playback cleanup failed for {item.label!r}: {e}")
+        if not item.future.done():
+            item.future.set_result(played)
+
+
+_default_queue: PlaybackQueue | None = None
+_default_queue_lock = threading.Lock()
+
+
+def _play(source: str | AudioStream) -> bool:
+    return get_audio_backends().play(source)
+
+
+def _stop() -> None:
+    get_audio_backends().stop()
+
+
+def get_playback_queue() -> PlaybackQueue:
+    """Return the process-wide playback queue."""
+    global _default_queue
+    with _default_queue_lock:
+        if _default_queue is None:
+            _default_queue = PlaybackQueue(_play, _stop)
+        return _default_queue
+
+
+def reset_playback_queue() -> None:
+    """Forget the process-wide queue; clips already queued on it still play."""
+    global _default_queue
+    with _default_queue_lock:
+        _default_queue = None
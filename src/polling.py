@@ -0,0 +1,175 @@
+"""Adaptive scheduling of FakeYou ``job_status`` polls.
+
+A fixed poll interval either wastes time after a job finishes or hammers the
+API while a job sits in the queue. :class:`PollScheduler` adapts instead:
+
+* while the job is ``pending`` the interval backs off exponentially, with
+  jitter so concurrent jobs do not poll in lockstep;
+* once the job is ``started``/``processing`` it polls fast, since synthesis of
+  a short quote usually finishes within a few seconds;
+* a 429 response's ``Retry-After`` header is honoured;
+* the overall deadline and the stuck-in-queue limit are measured in seconds.
+
+It also records how long the job spent in each phase so the defaults can be
+tuned from real runs.
+"""
+
+import email.utils
+import random
+import time
+from typing import Callable
+
+from config import env_float
+
+DEFAULT_DEADLINE = 60.0
+DEFAULT_PENDING_TIMEOUT = 20.0
+DEFAULT_MIN_INTERVAL = 0.5
+DEFAULT_MAX_INTERVAL = 4.0
+DEFAULT_FAST_INTERVAL = 0.25
+BACKOFF_FACTOR = 1.6
+JITTER = 0.2
+
+RUNNING_STATUSES = ("started", "processing")
+
+
+def parse_retry_after(value: str | None, now: float | None = None) -> float | None:
+    """Return the delay in seconds requested by a ``Retry-After`` header value."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when is None:
+        return None
+    now = time.time() if now is None else now
+    return max(0.0, when.timestamp() - now)
+
+
+class PollScheduler:
+    """Decide when to poll a job next and when to give up on it."""
+
+    def __init__(
+        self,
+        deadline: float = DEFAULT_DEADLINE,
+        pending_timeout: float = DEFAULT_PENDING_TIMEOUT,
+        min_interval: float = DEFAULT_MIN_INTERVAL,
+        max_interval: float = DEFAULT_MAX_INTERVAL,
+        fast_interval: float = DEFAULT_FAST_INTERVAL,
+        clock: Callable[[], float] = time.monotonic,
+        rng: Callable[[], float] = random.random,
+    ):
+        self.deadline = deadline
+        self.pending_timeout = pending_timeout
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.fast_interval = min(fast_interval, max_interval)
+        self._clock = clock
+        self._rng = rng
+
+        self.started_at = clock()
+        self.polls = 0
+        self.status: str | None = None
+        self.attempt_count = 0
+        self._phase_started = self.started_at
+        self._stalled_since = self.started_at
+        self._streak = 0
+        self._retry_after: float | None = None
+        self.phases: dict[str, float] = {}
+
+    @classmethod
+    def from_env(cls) -> "PollScheduler":
+        """Build a scheduler from ``YODA_POLL_*`` / ``YODA_PENDING_TIMEOUT``."""
+        return cls(
+            deadline=env_float("YODA_POLL_TIMEOUT", DEFAULT_DEADLINE),
+            pending_timeout=env_float("YODA_PENDING_TIMEOUT", DEFAULT_PENDING_TIMEOUT),
+            min_interval=env_float("YODA_POLL_MIN_INTERVAL", DEFAULT_MIN_INTERVAL),
+            max_interval=env_float("YODA_POLL_MAX_INTERVAL", DEFAULT_MAX_INTERVAL),
+            fast_interval=env_float("YODA_POLL_FAST_INTERVAL", DEFAULT_FAST_INTERVAL),
+        )
+
+    def elapsed(self) -> float:
+        """Seconds since the job was submitted."""
+        return self._clock() - self.started_at
+
+    def remaining(self) -> float:
+        """Seconds left before the overall deadline."""
+        return max(0.0, self.deadline - self.elapsed())
+
+    def expired(self) -> bool:
+        """Whether the overall deadline has passed."""
+        return self.elapsed() >= self.deadline
+
+    def stuck(self) -> bool:
+        """Whether the job has sat in the queue without any attempt for too long."""
+        return (
+            self.status == "pending"
+            and self.attempt_count == 0
+            and self._clock() - self._stalled_since >= self.pending_timeout
+        )
+
+    def observe(self, status: str, attempt_count: int = 0) -> None:
+        """Record the status reported by a poll."""
+        self.polls += 1
+        now = self._clock()
+        if self.status is None:
+            # Time before the first poll counts towards the first status seen
+            self.status = status
+        elif status != self.status:
+            self._close_phase(now)
+            self.status = status
+            self._streak = 0
+            self._stalled_since = now
+        elif attempt_count != self.attempt_count:
+            # FakeYou picked the job up again; that counts as progress
+            self._streak = 0
+            self._stalled_since = now
+        else:
+            self._streak += 1
+        self.attempt_count = attempt_count
+
+    def rate_limited(self, retry_after: float | None) -> None:
+        """Record a 429 so the next delay honours the server's ``Retry-After``."""
+        self._streak += 1
+        self._retry_after = retry_after if retry_after is not None else self._backoff()
+
+    def next_delay(self) -> float:
+        """Seconds to sleep before the next poll, never past the deadline."""
+        if self._retry_after is not None:
+            delay = self._retry_after
+            self._retry_after = None
+        elif self.status in RUNNING_STATUSES:
+            delay = self._jitter(
+                min(
+                    self.fast_interval * BACKOFF_FACTOR**self._streak, self.max_interval
+                )
+            )
+        else:
+            delay = self._jitter(self._backoff())
+        return max(0.0, min(delay, self.remaining()))
+
+    def _backoff(self) -> float:
+        return min(self.min_interval * BACKOFF_FACTOR**self._streak, self.max_interval)
+
+    def _jitter(self, delay: float) -> float:
+        return delay * (1 + JITTER * (2 * self._rng() - 1))
+
+    def _close_phase(self, now: float) -> None:
+        if self.status is None:
+            return
+        duration = now - self._phase_started
+        self.phases[self.status] = self.phases.get(self.status, 0.0) + duration
+        self._phase_started = now
+
+    def finish(self) -> dict[str, float]:
+        """Close the current phase and return per-phase and total durations."""
+        now = self._clock()
+        self._close_phase(now)
+        timings = {phase: round(seconds, 3) for phase, seconds in self.phases.items()}
+        timings["total"] = round(now - self.started_at, 3)
+        return timings
@@ -0,0 +1,276 @@
+"""Fill the audio cache in the background from a corpus of likely quotes.
+
+The corpus is a text file with one quote per line. Blank lines and lines
+starting with ``#`` are ignored, and a sampler ``transcript.txt``
+(``samples/1.wav|quote``) works as-is. Quotes are synthesized one at a time,
+at low priority:
+
+* a quote is only started once no tool call has run for
+  ``YODA_PREWARM_IDLE`` seconds;
+* it also waits until the shared ``post`` rate limit has a token to spare,
+  so prewarming never makes a user's request queue;
+* quotes are at least ``YODA_PREWARM_INTERVAL`` seconds apart.
+
+Progress is saved after every quote, so a restarted server resumes where the
+last one stopped. Quotes that are already cached cost nothing. Set
+``YODA_PREWARM_CORPUS`` to start prewarming when the server starts, or use
+the ``prewarm_start`` tool.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+from audio_cache import AudioCache, get_audio_cache
+from clips import ClipDownloadError, download_clip
+from config import data_dir, env_float, env_str
+from fakeyou import YODA_MODELS
+from metrics import get_metrics
+from rate_limit import get_rate_limiter
+from synthesis import SynthesisError, synthesize
+
+logger = logging.getLogger(__name__)
+
+# Seconds without tool calls before a quote is prewarmed
+DEFAULT_IDLE = 5.0
+# Least seconds between prewarmed quotes
+DEFAULT_INTERVAL = 2.0
+# How often to re-check for idle time while waiting
+CHECK_INTERVAL = 0.5
+# Failed quotes kept in the state file and status
+MAX_ERRORS = 50
+
+
+def read_corpus(path: str) -> list[str]:
+    """Return the quotes in a corpus file, in order and without duplicates."""
+    quotes = []
+    seen = set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            # Sampler transcripts are "samples/<n>.wav|<quote>"
+            _, sep, text = line.partition("|")
+            quote = text.strip() if sep else line
+            if quote and quote not in seen:
+                seen.add(quote)
+                quotes.append(quote)
+    return quotes
+
+
+def _fingerprint(quotes: list[str]) -> str:
+    return hashlib.sha256("\n".join(quotes).encode("utf-8")).hexdigest()
+
+
+class Prewarmer:
+    """Synthesize a corpus into the audio cache on a background task."""
+
+    def __init__(self, state_path: str):
+        """
+        Args:
+            state_path: JSON file progress is saved to and resumed from.
+        """
+        self.state_path = state_path
+        self.corpus: str | None = None
+        self.total = 0
+        self.position = 0
+        self.synthesized = 0
+        self.already_cached = 0
+        self.failed = 0
+        # Error per failed quote, up to MAX_ERRORS
+        self.errors: dict[str, str] = {}
+        self.state = "idle"
+        self.error: str | None = None
+        self.started_at: float | None = None
+        self.synth_seconds = 0.0
+        self._fingerprint: str | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, corpus: str) -> None:
+        """Start (or resume) prewarming ``corpus`` on the running event loop.
+
+        Raises:
+            OSError: if the corpus cannot be read.
+            RuntimeError: if prewarming is already running or the cache is off.
+        """
+        if self.running:
+            raise RuntimeError(f"Already prewarming {self.corpus}")
+        cache = get_audio_cache()
+        if cache is None:
+            raise RuntimeError("The audio cache is disabled")
+        quotes = read_corpus(corpus)
+        self.corpus = os.path.abspath(corpus)
+        self._fingerprint = _fingerprint(quotes)
+        self.total = len(quotes)
+        self.position = self.synthesized = self.already_cached = self.failed = 0
+        self.errors = {}
+        self.synth_seconds = 0.0
+        self.error = None
+        self._resume()
+        self.started_at = time.time()
+        self.state = "waiting"
+        self._task = asyncio.get_running_loop().create_task(
+            self._run(quotes, cache), name="prewarm"
+        )
+
+    async def stop(self) -> None:
+        """Stop prewarming; progress so far is kept for the next start."""
+        if self._task is None:
+            return
+        task, self._task = self._task, None
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        if self.state in ("waiting", "running"):
+            self.state = "stopped"
+
+    def _resume(self) -> None:
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable prewarm state {self.state_path}: {e}")
+            return
+        if saved.get("fingerprint") != self._fingerprint:
+            # A different or edited corpus; cached quotes are skipped anyway
+            return
+        self.position = min(saved.get("position", 0), self.total)
+        self.synthesized = saved.get("synthesized", 0)
+        self.already_cached = saved.get("already_cached", 0)
+        self.failed = saved.get("failed", 0)
+        self.errors = saved.get("errors", {})
+        self.synth_seconds = saved.get("synth_seconds", 0.0)
+        logger.info(f"Resuming prewarm of {self.corpus} at {self.position}")
+
+    def _save(self) -> None:
+        state = {
+            "corpus": self.corpus,
+            "fingerprint": self._fingerprint,
+            "position": self.position,
+            "synthesized": self.synthesized,
+            "already_cached": self.already_cached,
+            "failed": self.failed,
+            "errors": self.errors,
+            "synth_seconds": round(self.synth_seconds, 3),
+        }
+        try:
+            directory = os.path.dirname(os.path.abspath(self.state_path))
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            logger.warning(f"Could not save prewarm state: {e}")
+
+    def _is_cached(self, cache: AudioCache, quote: str) -> bool:
+        # get() rather than lookup(), to keep prewarming out of the hit rate
+        return any(cache.get(quote, model_token) for model_token, _ in YODA_MODELS)
+
+    async def _wait_for_turn(self, last_started: float) -> None:
+        """Sleep until no tool call has run for a while and the API has headroom."""
+        while True:
+            idle = env_float("YODA_PREWARM_IDLE", DEFAULT_IDLE)
+            interval = env_float("YODA_PREWARM_INTERVAL", DEFAULT_INTERVAL)
+            idle_for = get_metrics().idle_for()
+            if (
+                idle_for is not None
+                and idle_for >= idle
+                and time.monotonic() - last_started >= interval
+                and get_rate_limiter("post").headroom() >= 1
+            ):
+                return
+            await asyncio.sleep(CHECK_INTERVAL)
+
+    async def _run(self, quotes: list[str], cache: AudioCache) -> None:
+        last_started = -float("inf")
+        try:
+            while self.position < self.total:
+                quote = quotes[self.position]
+                if self._is_cached(cache, quote):
+                    self.already_cached += 1
+                else:
+                    self.state = "waiting"
+                    await self._wait_for_turn(last_started)
+                    self.state = "running"
+                    last_started = time.monotonic()
+                    await self._prewarm(quote, cache)
+                    self.synth_seconds += time.monotonic() - last_started
+                self.position += 1
+                self._save()
+        except Exception as e:
+            logger.exception("Prewarming failed")
+            self.state = "error"
+            self.error = str(e)
+            return
+        self.state = "finished"
+        logger.info(
+            f"Prewarmed {self.corpus}: {self.synthesized} synthesized, "
+            f"{self.already_cached} already cached, {self.failed} failed"
+        )
+
+    async def _prewarm(self, quote: str, cache: AudioCache) -> None:
+        try:
+            synthesis = await synthesize(quote, fallback=False)
+            await download_clip(quote, synthesis, cache)
+        except (SynthesisError, ClipDownloadError) as e:
+            logger.warning(f"Could not prewarm {quote!r}: {e}")
+            self.failed += 1
+            if len(self.errors) < MAX_ERRORS:
+                self.errors[quote] = str(e)
+            get_metrics().inc("yoda_prewarm_total", outcome="failed")
+            return
+        self.synthesized += 1
+        get_metrics().inc("yoda_prewarm_total", outcome="synthesized")
+
+    def status(self) -> dict:
+        """Return progress, counters and an estimate of the time left."""
+        done = self.synthesized + self.failed
+        remaining = self.total - self.position
+        status = {
+            "state": self.state,
+            "corpus": self.corpus,
+            "total": self.total,
+            "position": self.position,
+            "remaining": remaining,
+            "synthesized": self.synthesized,
+            "already_cached": self.already_cached,
+            "failed": self.failed,
+            "errors": dict(list(self.errors.items())[-5:]),
+        }
+        if done and remaining:
+            # Assumes the rest of the corpus is uncached
+            status["eta_seconds"] = round(self.synth_seconds / done * remaining)
+        if self.error:
+            status["error"] = self.error
+        return status
+
+
+_prewarmer: Prewarmer | None = None
+
+
+def get_prewarmer() -> Prewarmer:
+    """Return the process-wide prewarmer, saving its progress under the data dir."""
+    global _prewarmer
+    if _prewarmer is None:
+        state_path = env_str("YODA_PREWARM_STATE") or os.path.join(
+            data_dir("prewarm"), "state.json"
+        )
+        _prewarmer = Prewarmer(state_path)
+    return _prewarmer
+
+
+def reset_prewarmer() -> None:
+    """Forget the process-wide prewarmer (it should be stopped first)."""
+    global _prewarmer
+    _prewarmer = None
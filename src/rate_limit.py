@@ -0,0 +1,199 @@
+"""Client-side rate limiting of FakeYou API and CDN requests.
+
+Every request goes through a shared token bucket for its kind (``post`` for
+job submissions, ``poll`` for status polls, ``download`` for CDN fetches), so
+a burst of tool calls is spread out instead of tripping FakeYou's limits.
+Callers wait in FIFO order for a token.
+
+A 429 blocks the bucket for the server's ``Retry-After`` (or an exponential
+backoff when it sends none). That state is shared by every later caller,
+rather than each request discovering the limit on its own.
+
+Rates are requests per second from ``YODA_RATE_POST``, ``YODA_RATE_POLL`` and
+``YODA_RATE_DOWNLOAD``; ``0`` turns a bucket off. ``YODA_RATE_BURST_*`` sets
+how many requests may go out back to back. A rate-limited job submission is
+retried, with the same idempotency token, for up to ``YODA_RATE_MAX_WAIT``
+seconds before the model is given up on.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Callable
+
+from config import env_float, env_int
+
+logger = logging.getLogger(__name__)
+
+# Requests per second and burst size per bucket
+DEFAULT_LIMITS = {
+    "post": (1.0, 3),
+    "poll": (5.0, 10),
+    "download": (10.0, 10),
+}
+
+# Longest a job submission keeps waiting out 429s before the model is given up
+DEFAULT_MAX_WAIT = 30.0
+
+# Backoff after a 429 without Retry-After, doubled per consecutive 429
+BASE_BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+
+
+class RateLimiter:
+    """An async token bucket that honours server backoff."""
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            name: Bucket name, for logs and stats.
+            rate: Tokens added per second; ``0`` or less means unlimited.
+            burst: Most tokens the bucket holds.
+        """
+        self.name = name
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._clock = clock
+        self._tokens = float(self.burst)
+        self._updated = clock()
+        self._blocked_until = 0.0
+        self._strikes = 0
+        self._lock: asyncio.Lock | None = None
+        self._lock_loop: asyncio.AbstractEventLoop | None = None
+        self.waiting = 0
+        self.acquired = 0
+        self.rate_limited = 0
+        self.waited_seconds = 0.0
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rate <= 0
+
+    def _get_lock(self) -> asyncio.Lock:
+        # An asyncio.Lock belongs to the loop it was first used on
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lock_loop is not loop:
+            self._lock = asyncio.Lock()
+            self._lock_loop = loop
+        return self._lock
+
+    def _refill(self, now: float) -> None:
+        if self.unlimited:
+            self._tokens = float(self.burst)
+        else:
+            # Nothing accrues while blocked, so a 429 restarts from empty
+            accruing_since = max(self._updated, min(now, self._blocked_until))
+            elapsed = max(0.0, now - accruing_since)
+            self._tokens = min(float(self.burst), self._tokens + elapsed * self.rate)
+        self._updated = now
+
+    def _take(self) -> float:
+        """Take a token and return 0, or return the seconds until one is free."""
+        now = self._clock()
+        self._refill(now)
+        if now < self._blocked_until:
+            return self._blocked_until - now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    async def acquire(self) -> float:
+        """Wait for a token, behind anyone already waiting; return seconds waited."""
+        started = self._clock()
+        self.waiting += 1
+        try:
+            # asyncio.Lock hands itself to waiters in FIFO order
+            async with self._get_lock():
+                while (delay := self._take()) > 0:
+                    await asyncio.sleep(delay)
+        finally:
+            self.waiting -= 1
+        waited = self._clock() - started
+        self.acquired += 1
+        self.waited_seconds += waited
+        return waited
+
+    def penalize(self, retry_after: float | None = None) -> float:
+        """Record a 429 and block the bucket; return the delay imposed."""
+        self._strikes += 1
+        self.rate_limited += 1
+        if retry_after is None:
+            retry_after = min(MAX_BACKOFF, BASE_BACKOFF * 2 ** (self._strikes - 1))
+        now = self._clock()
+        self._refill(now)
+        self._tokens = 0.0
+        self._blocked_until = max(self._blocked_until, now + retry_after)
+        logger.warning(f"Rate limited on {self.name}, holding off {retry_after:.1f}s")
+        return retry_after
+
+    def succeeded(self) -> None:
+        """Record a request that was not rate limited, resetting the backoff."""
+        self._strikes = 0
+
+    def headroom(self) -> float:
+        """Tokens free right now for a caller that would not have to queue."""
+        now = self._clock()
+        self._refill(now)
+        if self.waiting or now < self._blocked_until:
+            return 0.0
+        return self._tokens
+
+    def stats(self) -> dict:
+        """Return the bucket's settings, state and counters."""
+        now = self._clock()
+        self._refill(now)
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "tokens": round(self._tokens, 2),
+            "blocked_for": round(max(0.0, self._blocked_until - now), 3),
+            "waiting": self.waiting,
+            "acquired": self.acquired,
+            "rate_limited": self.rate_limited,
+            "waited_seconds": round(self.waited_seconds, 3),
+        }
+
+
+def rate_limit_max_wait() -> float:
+    """Return ``YODA_RATE_MAX_WAIT``: seconds a POST may spend waiting out 429s."""
+    return env_float("YODA_RATE_MAX_WAIT", DEFAULT_MAX_WAIT)
+
+
+_limiters: dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(name: str) -> RateLimiter:
+    """Return the process-wide bucket ``name`` (``post``, ``poll`` or ``download``)."""
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            rate, burst = DEFAULT_LIMITS[name]
+            limiter = RateLimiter(
+                name,
+                env_float(f"YODA_RATE_{name.upper()}", rate),
+                env_int(f"YODA_RATE_BURST_{name.upper()}", burst),
+            )
+            _limiters[name] = limiter
+        return limiter
+
+
+def rate_limit_stats() -> dict:
+    """Return the stats of every bucket in use."""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.name: limiter.stats() for limiter in limiters}
+
+
+def reset_rate_limiters() -> None:
+    """Forget every bucket, so the next request re-reads the settings."""
+    with _limiters_lock:
+        _limiters.clear()
@@ -1,6 +1,12 @@
 from mcp.server.fastmcp import FastMCP
 
+from tools.audio_diagnostics import audio_diagnostics
+from tools.cache_stats import cache_stats
+from tools.playback_control import playback_flush, playback_skip, playback_status
+from tools.prewarm_control import prewarm_start, prewarm_status, prewarm_stop
+from tools.quote_batch import quote_batch
 from tools.quote_play import quote_play
+from tools.server_stats import server_stats
 
 
 def register_all_tools(mcp_server: FastMCP) -> None:
@@ -13,3 +19,13 @@ def register_all_tools(mcp_server: FastMCP) -> None:
 
     # Add more tools here as you create them
     mcp_server.tool()(quote_play)
+    mcp_server.tool()(quote_batch)
+    mcp_server.tool()(cache_stats)
+    mcp_server.tool()(playback_status)
+    mcp_server.tool()(playback_skip)
+    mcp_server.tool()(playback_flush)
+    mcp_server.tool()(audio_diagnostics)
+    mcp_server.tool()(server_stats)
+    mcp_server.tool()(prewarm_start)
+    mcp_server.tool()(prewarm_status)
+    mcp_server.tool()(prewarm_stop)
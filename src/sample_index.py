@@ -0,0 +1,256 @@
+"""Persistent index of the sampler's numbered clips.
+
+A samples directory holds ``N.wav`` clips and a ``transcript.txt`` of
+``samples/N.wav|text`` lines. This index sits next to them as
+``index.sqlite3`` and records each clip's text, model and duration. It hands
+out clip numbers, so the next number never needs a directory listing, and it
+finds a clip by its text without reading the transcript.
+
+SQLite does the locking. Several threads or processes can write into one
+samples directory at once without ever being given the same number, and a
+crash at any point leaves the index consistent.
+
+A clip's number is reserved before its audio is written and the clip is
+marked done once the audio is in place. A crash in between leaves only an
+unfinished reservation, and that number is never handed out again.
+"""
+
+import contextlib
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import wave
+from dataclasses import dataclass
+from typing import BinaryIO, Iterator
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = "index.sqlite3"
+TRANSCRIPT_NAME = "transcript.txt"
+# Seconds to wait for another process's write to finish
+BUSY_TIMEOUT = 30.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    text TEXT NOT NULL,
+    model_token TEXT,
+    model_name TEXT,
+    duration REAL,
+    created_at REAL NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS samples_text ON samples (text, done);
+"""
+
+
+@dataclass
+class Sample:
+    """One numbered clip."""
+
+    id: int
+    text: str
+    model_token: str | None
+    model_name: str | None
+    duration: float | None
+    created_at: float
+
+    @property
+    def name(self) -> str:
+        return f"{self.id}.wav"
+
+
+class SampleIndex:
+    """SQLite index of the clips in one samples directory."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(
+            path, timeout=BUSY_TIMEOUT, isolation_level=None, check_same_thread=False
+        )
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    @contextlib.contextmanager
+    def writing(self) -> Iterator[None]:
+        """Hold the index's write lock, against every thread and process.
+
+        Writes made in the block commit together at its end. Blocks nest; only
+        the outermost one commits.
+        """
+        with self._lock:
+            if self._db.in_transaction:
+                yield
+                return
+            # IMMEDIATE takes the write lock up front, so concurrent writers
+            # queue instead of failing halfway through
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def _write(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self.writing():
+            return self._db.execute(sql, params)
+
+    def reserve(
+        self,
+        text: str,
+        model_token: str | None = None,
+        model_name: str | None = None,
+    ) -> int:
+        """Allocate a new clip number for ``text``; no other caller gets it."""
+        cursor = self._write(
+            "INSERT INTO samples (text, model_token, model_name, created_at)"
+            " VALUES (?, ?, ?, ?)",
+            (text, model_token, model_name, time.time()),
+        )
+        return cursor.lastrowid
+
+    def complete(self, sample_id: int, duration: float | None = None) -> None:
+        """Mark a reserved clip as written."""
+        self._write(
+            "UPDATE samples SET done = 1, duration = ? WHERE id = ?",
+            (duration, sample_id),
+        )
+
+    def discard(self, sample_id: int) -> None:
+        """Drop a reservation whose clip was not written; its number stays used."""
+        self._write("DELETE FROM samples WHERE id = ? AND done = 0", (sample_id,))
+
+    def _query(self, sql: str, params: tuple = ()) -> list[Sample]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, text, model_token, model_name, duration, created_at"
+                f" FROM samples WHERE done = 1 {sql}",
+                params,
+            ).fetchall()
+        return [Sample(*row) for row in rows]
+
+    def find(self, text: str) -> Sample | None:
+        """Return the newest finished clip of exactly ``text``, if any."""
+        samples = self._query("AND text = ? ORDER BY id DESC LIMIT 1", (text,))
+        return samples[0] if samples else None
+
+    def get(self, sample_id: int) -> Sample | None:
+        samples = self._query("AND id = ?", (sample_id,))
+        return samples[0] if samples else None
+
+    def samples(self) -> list[Sample]:
+        """Return every finished clip, in number order."""
+        return self._query("ORDER BY id")
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM samples WHERE done = 1"
+            ).fetchone()[0]
+
+    def is_empty(self) -> bool:
+        """True if no number has ever been handed out or imported."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT seq FROM sqlite_sequence WHERE name = 'samples'"
+            ).fetchone()
+        return not row or not row[0]
+
+    def import_transcript(self, samples_dir: str) -> int:
+        """Index the clips listed in ``samples_dir``'s transcript.
+
+        Used once, for a samples directory made before it had an index.
+        Clips keep their numbers. Numbering continues after the highest
+        ``N.wav`` on disk, so an unlisted clip is never overwritten.
+        Returns the number of clips imported.
+        """
+        rows = []
+        highest = 0
+        for name in os.listdir(samples_dir):
+            stem, ext = os.path.splitext(name)
+            if ext == ".wav" and stem.isdigit():
+                highest = max(highest, int(stem))
+        transcript_path = os.path.join(samples_dir, TRANSCRIPT_NAME)
+        if os.path.exists(transcript_path):
+            with open(transcript_path, encoding="utf-8") as f:
+                for line in f:
+                    path, sep, text = line.rstrip("\n").partition("|")
+                    stem, ext = os.path.splitext(os.path.basename(path))
+                    wav_path = os.path.join(samples_dir, f"{stem}.wav")
+                    if sep and ext == ".wav" and stem.isdigit():
+                        if os.path.exists(wav_path):
+                            rows.append((int(stem), text, wav_duration(wav_path)))
+
+        with self.writing():
+            self._db.executemany(
+                "INSERT OR REPLACE INTO samples"
+                " (id, text, duration, created_at, done) VALUES (?, ?, ?, ?, 1)",
+                [(id, text, duration, time.time()) for id, text, duration in rows],
+            )
+            if highest:
+                # Also counts clips missing from the transcript
+                self._db.execute(
+                    "INSERT OR IGNORE INTO sqlite_sequence (name, seq)"
+                    " VALUES ('samples', 0)"
+                )
+                self._db.execute(
+                    "UPDATE sqlite_sequence SET seq = MAX(seq, ?)"
+                    " WHERE name = 'samples'",
+                    (highest,),
+                )
+        if rows:
+            logger.info(f"Imported {len(rows)} clips into {self.path}")
+        return len(rows)
+
+    def export_transcript(self, samples_dir: str) -> int:
+        """Rewrite ``samples_dir``'s transcript from the index, in number order.
+
+        Runs under the write lock, which writers also hold while they append
+        to the transcript, so no line is lost to the rewrite.
+
+        Returns the number of lines written.
+        """
+        transcript_path = os.path.join(samples_dir, TRANSCRIPT_NAME)
+        with self.writing():
+            samples = self.samples()
+            fd, tmp_path = tempfile.mkstemp(dir=samples_dir, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    for sample in samples:
+                        f.write(f"samples/{sample.name}|{sample.text}\n")
+                os.replace(tmp_path, transcript_path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        return len(samples)
+
+
+def wav_duration(path: str | BinaryIO) -> float | None:
+    """Return the length of a wav file in seconds, or None if it is unreadable."""
+    try:
+        with wave.open(path, "rb") as wav:
+            return wav.getnframes() / wav.getframerate()
+    except (OSError, EOFError, wave.Error):
+        return None
+
+
+def open_sample_index(samples_dir: str) -> SampleIndex:
+    """Open (creating if needed) the index of ``samples_dir``.
+
+    A directory that already has clips but no index has them imported first.
+    """
+    os.makedirs(samples_dir, exist_ok=True)
+    index = SampleIndex(os.path.join(samples_dir, INDEX_NAME))
+    if index.is_empty():
+        index.import_transcript(samples_dir)
+    return index
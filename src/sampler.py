@@ -2,11 +2,101 @@ import requests
 import uuid
 import time
 import os
-import simpleaudio as sa
 import io
 import wave
-import ffmpeg
 import sys
+import argparse
+import asyncio
+import json
+import logging
+import tempfile
+
+from audio_stream import WavCheck, convert_wav
+from clip_archive import CODECS, DEFAULT_CODEC, ClipArchive
+from sample_index import TRANSCRIPT_NAME, open_sample_index, wav_duration
+
+
+# Layout of the clips in samples/
+SAMPLE_CHANNELS = 1
+SAMPLE_WIDTH = 2
+SAMPLE_RATE = 22050
+
+# The one voice a dataset is built from: (model_token, model_name). Letting
+# synthesis fall back to another Yoda model would mix two voices in one set.
+SAMPLE_MODEL = ("weight_tqpbyrp6t9rmdez9c38zzvp0z", "Yoda (Version 2.0)")
+
+# Lines synthesized at the same time by `sampler.py build`
+DEFAULT_WORKERS = 4
+
+# Where a samples directory keeps its packed clips
+ARCHIVE_DIR = "archive"
+
+
+def _ffmpeg_to_sample_format(audio: bytes) -> bytes:
+    import ffmpeg
+
+    converted, _ = (
+        ffmpeg.input("pipe:0")
+        .output(
+            "pipe:1",
+            format="wav",
+            ac=SAMPLE_CHANNELS,
+            ar=SAMPLE_RATE,
+            sample_fmt="s16",
+        )
+        .run(input=audio, capture_stdout=True, quiet=True)
+    )
+    # Piped output has no length in its header
+    return convert_wav(converted, SAMPLE_CHANNELS, SAMPLE_WIDTH, SAMPLE_RATE)
+
+
+def to_sample_format(audio: bytes) -> bytes:
+    """Convert downloaded audio to a mono 22050 Hz s16 wav, in memory.
+
+    PCM wav is converted in-process, with a low-pass filtered resampler; ffmpeg
+    is only used for anything else (compressed or float audio, more than two
+    channels, or no audioop on Python 3.13+).
+    """
+    try:
+        return convert_wav(audio, SAMPLE_CHANNELS, SAMPLE_WIDTH, SAMPLE_RATE)
+    except (ValueError, ImportError):
+        return _ffmpeg_to_sample_format(audio)
+
+
+def download_audio(url: str) -> bytes:
+    """Download a wav clip, checking it as it streams in.
+
+    An error page, a clip over ``YODA_MAX_CLIP_BYTES`` or a truncated clip
+    raises :class:`audio_stream.InvalidAudioError` as soon as it is spotted.
+    """
+    from fakeyou import DOWNLOAD_CHUNK_SIZE, DOWNLOAD_TIMEOUT, max_clip_bytes
+
+    check = WavCheck(max_clip_bytes())
+    audio = io.BytesIO()
+    with requests.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT) as res:
+        res.raise_for_status()
+        check.check_length(res.headers.get("Content-Length"))
+        for chunk in res.iter_content(DOWNLOAD_CHUNK_SIZE):
+            audio.write(check.feed(chunk))
+    check.finish()
+    return audio.getvalue()
+
+
+def play_wav(data: bytes) -> None:
+    """Play a wav from memory with simpleaudio and wait for it to finish."""
+    import simpleaudio as sa
+
+    with wave.open(io.BytesIO(data), "rb") as wav_file:
+        audio_data = wav_file.readframes(wav_file.getnframes())
+        num_channels = wav_file.getnchannels()
+        bytes_per_sample = wav_file.getsampwidth()
+        sample_rate = wav_file.getframerate()
+    play_obj = sa.play_buffer(audio_data, num_channels, bytes_per_sample, sample_rate)
+    play_obj.wait_done()
+
+
+def default_samples_dir() -> str:
+    return os.path.join(os.path.dirname(os.path.dirname(__file__)), "samples")
 
 
 def yoda_tts(text: str) -> dict:
@@ -14,7 +104,7 @@ def yoda_tts(text: str) -> dict:
     GET_URL = "https://api.fakeyou.com/v1/model_inference/job_status/"
     post_body = {
         "uuid_idempotency_token": str(uuid.uuid4()),
-        "tts_model_token": "weight_tqpbyrp6t9rmdez9c38zzvp0z",
+        "tts_model_token": SAMPLE_MODEL[0],
         "inference_text": text,
     }
     try:
@@ -51,73 +141,32 @@ def yoda_tts(text: str) -> dict:
             and result["media_links"].get("cdn_url")
         ):
             audio_url = result["media_links"]["cdn_url"]
-            # Download the audio file
-            audio_res = requests.get(audio_url)
-            # Save the audio file to 'samples' directory
-            samples_dir = os.path.join(
-                os.path.dirname(os.path.dirname(__file__)), "samples"
-            )
-            os.makedirs(samples_dir, exist_ok=True)
-            filename = f"yoda_tts_{uuid.uuid4()}.wav"
-            file_path = os.path.join(samples_dir, filename)
-            with open(file_path, "wb") as f:
-                f.write(audio_res.content)
+            # Download the audio file into memory
+            audio = download_audio(audio_url)
+            # Convert the audio to mono, 22050 Hz, signed 16-bit PCM
             try:
-                # Determine the next available number for the filename in 'samples' directory
-                existing_files = [
-                    f
-                    for f in os.listdir(samples_dir)
-                    if f.endswith(".wav") and f.split(".")[0].isdigit()
-                ]
-                if existing_files:
-                    max_num = max([int(f.split(".")[0]) for f in existing_files])
-                    next_num = max_num + 1
-                else:
-                    next_num = 1
-                final_filename = f"{next_num}.wav"
-                converted_path = os.path.join(samples_dir, final_filename)
-                # Convert the audio file to mono, 22050 Hz, signed 16-bit PCM using ffmpeg
-                try:
-                    (
-                        ffmpeg.input(file_path)
-                        .output(converted_path, ac=1, ar=22050, sample_fmt="s16")
-                        .overwrite_output()
-                        .run(quiet=True)
-                    )
-                except Exception as ffmpeg_err:
-                    print(
-                        f"Audio saved at {file_path}, but ffmpeg conversion failed: {str(ffmpeg_err)}"
-                    )
-                    return {"isError": True}
-                # Play the converted audio file using simpleaudio, from memory
-                try:
-                    with open(converted_path, "rb") as f:
-                        audio_bytes = io.BytesIO(f.read())
-                    with wave.open(audio_bytes, "rb") as wav_file:
-                        audio_data = wav_file.readframes(wav_file.getnframes())
-                        num_channels = wav_file.getnchannels()
-                        bytes_per_sample = wav_file.getsampwidth()
-                        sample_rate = wav_file.getframerate()
-                    play_obj = sa.play_buffer(
-                        audio_data, num_channels, bytes_per_sample, sample_rate
-                    )
-                    play_obj.wait_done()
-                except Exception as play_err:
-                    print(
-                        f"Converted audio at {converted_path}. Error playing sound: {str(play_err)}"
-                    )
-                    return {"isError": True}
-                # Update transcript.txt with the filename and text
-                transcript_path = os.path.join(samples_dir, "transcript.txt")
-                with open(transcript_path, "a") as transcript_file:
-                    transcript_file.write(f"samples/{final_filename}|{text}\n")
-                print(
-                    f"Audio URL: {audio_url}\nSaved: {file_path}\nConverted: {converted_path}"
+                converted = to_sample_format(audio)
+            except Exception as convert_err:
+                print(f"Audio at {audio_url}, but conversion failed: {convert_err}")
+                return {"isError": True}
+            # Save it as the next numbered clip and list it in transcript.txt
+            writer = SampleWriter(default_samples_dir())
+            try:
+                converted_path = writer.add(
+                    text, converted, model_token=post_body["tts_model_token"]
                 )
-                return {"isError": False}
             finally:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
+                writer.close()
+            # Play the converted audio using simpleaudio, from memory
+            try:
+                play_wav(converted)
+            except Exception as play_err:
+                print(
+                    f"Converted audio at {converted_path}. Error playing sound: {str(play_err)}"
+                )
+                return {"isError": True}
+            print(f"Audio URL: {audio_url}\nSaved: {converted_path}")
+            return {"isError": False}
         else:
             print("No audio URL found, there is.")
             return {"isError": True}
@@ -126,7 +175,343 @@ def yoda_tts(text: str) -> dict:
         return {"isError": True}
 
 
+def read_lines(path: str) -> list[str]:
+    """Return the lines to speak from a text or JSONL file, without duplicates.
+
+    A text file has one line per clip; blank lines and ``#`` comments are
+    skipped. In a ``.jsonl`` file each line is an object with a ``text``
+    field, or a JSON string.
+    """
+    jsonl = path.endswith(".jsonl")
+    lines = []
+    seen = set()
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or (not jsonl and line.startswith("#")):
+                continue
+            if jsonl:
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    raise ValueError(f"{path}:{number}: {e}") from e
+                line = record.get("text") if isinstance(record, dict) else record
+                if not isinstance(line, str):
+                    raise ValueError(f"{path}:{number}: no text")
+            # One line per clip in transcript.txt
+            text = " ".join(line.split())
+            if text and text not in seen:
+                seen.add(text)
+                lines.append(text)
+    return lines
+
+
+class SampleWriter:
+    """Write numbered clips into a samples directory, with its transcript.
+
+    Numbers come from the directory's sample index, so clips can be added
+    from any thread, and several runs can share one directory. With an
+    ``archive_codec``, clips go into the directory's clip archive instead of
+    ``N.wav`` files.
+    """
+
+    def __init__(self, samples_dir: str, archive_codec: str | None = None):
+        self.samples_dir = samples_dir
+        self.transcript_path = os.path.join(samples_dir, TRANSCRIPT_NAME)
+        self.index = open_sample_index(samples_dir)
+        self.archive_codec = archive_codec
+        archive_dir = os.path.join(samples_dir, ARCHIVE_DIR)
+        # Open an existing archive too, so packed clips count as done
+        self.archive = (
+            ClipArchive(archive_dir, codec=archive_codec or DEFAULT_CODEC)
+            if archive_codec or os.path.isdir(archive_dir)
+            else None
+        )
+
+    def close(self) -> None:
+        self.index.close()
+        if self.archive is not None:
+            self.archive.close()
+
+    def sync_transcript(self) -> bool:
+        """Rewrite the transcript from the index if a crash left it short.
+
+        The count and the rewrite happen under the index's write lock, so
+        clips added meanwhile by other threads or runs are not lost.
+
+        Returns True if it was rewritten.
+        """
+        with self.index.writing():
+            try:
+                with open(self.transcript_path, "rb") as f:
+                    lines = sum(
+                        chunk.count(b"\n")
+                        for chunk in iter(lambda: f.read(1 << 20), b"")
+                    )
+            except FileNotFoundError:
+                lines = 0
+            if lines == self.index.count():
+                return False
+            self.index.export_transcript(self.samples_dir)
+        return True
+
+    def has(self, text: str) -> bool:
+        sample = self.index.find(text)
+        if sample is None:
+            return False
+        if self.archive is not None and sample.id in self.archive:
+            return True
+        return os.path.exists(os.path.join(self.samples_dir, sample.name))
+
+    def add(
+        self,
+        text: str,
+        wav: bytes,
+        model_token: str | None = None,
+        model_name: str | None = None,
+    ) -> str:
+        """Save ``wav`` as the next numbered clip for ``text``; say where.
+
+        The clip is in place before it is marked done in the index and listed
+        in the transcript, so a crash never leaves a line without audio.
+        """
+        sample_id = self.index.reserve(text, model_token, model_name)
+        try:
+            if self.archive_codec:
+                self.archive.add(sample_id, text, wav)
+                where = f"{sample_id}.wav in {self.archive.directory}"
+            else:
+                where = os.path.join(self.samples_dir, f"{sample_id}.wav")
+                write_atomic(where, wav)
+        except BaseException:
+            self.index.discard(sample_id)
+            raise
+        duration = wav_duration(io.BytesIO(wav))
+        # Under the write lock, so a transcript repair never drops the line
+        with self.index.writing():
+            self.index.complete(sample_id, duration)
+            # One O_APPEND write, so lines from concurrent runs never interleave
+            line = f"samples/{sample_id}.wav|{text}\n".encode("utf-8")
+            fd = os.open(
+                self.transcript_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644
+            )
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+        return where
+
+
+def write_atomic(path: str, data: bytes) -> None:
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def pack_samples(samples_dir: str, codec: str, keep: bool = False) -> dict:
+    """Move every ``N.wav`` clip in ``samples_dir`` into its clip archive.
+
+    With ``keep``, the wav files are left in place as well.
+
+    Returns:
+        Counts of ``packed`` clips, clips ``already`` archived and clips
+        ``missing`` from both.
+    """
+    writer = SampleWriter(samples_dir, archive_codec=codec)
+    summary = {"packed": 0, "already": 0, "missing": 0}
+    try:
+        for sample in writer.index.samples():
+            path = os.path.join(samples_dir, sample.name)
+            if sample.id in writer.archive:
+                summary["already"] += 1
+            else:
+                try:
+                    with open(path, "rb") as f:
+                        wav = f.read()
+                except FileNotFoundError:
+                    summary["missing"] += 1
+                    continue
+                writer.archive.add(sample.id, sample.text, wav)
+                summary["packed"] += 1
+            if not keep and os.path.exists(path):
+                os.unlink(path)
+    finally:
+        writer.close()
+    return summary
+
+
+def unpack_samples(samples_dir: str) -> int:
+    """Write every archived clip in ``samples_dir`` back out as ``N.wav``.
+
+    Returns the number of files written; existing files are left alone.
+    """
+    archive = ClipArchive(os.path.join(samples_dir, ARCHIVE_DIR))
+    written = 0
+    try:
+        for clip in archive.clips():
+            path = os.path.join(samples_dir, f"{clip.id}.wav")
+            if not os.path.exists(path):
+                write_atomic(path, archive.read_clip(clip))
+                written += 1
+    finally:
+        archive.close()
+    return written
+
+
+async def build_dataset(
+    lines: list[str],
+    samples_dir: str,
+    workers: int = DEFAULT_WORKERS,
+    play: bool = False,
+    archive_codec: str | None = None,
+    model: tuple[str, str] = SAMPLE_MODEL,
+) -> dict:
+    """Synthesize every line that has no clip yet into ``samples_dir``.
+
+    Up to ``workers`` lines are synthesized and downloaded at once, through
+    the server's rate limits, all with ``model`` so the dataset has a single
+    voice; a line that model fails is left for the next run. Clips are
+    numbered in the order they finish.
+    With ``play``, each clip is also played, one at a time. With
+    ``archive_codec``, clips are stored in the clip archive.
+
+    Returns:
+        Counts of ``total``, ``skipped``, ``written`` and ``failed`` lines.
+    """
+    from fakeyou import close_http_client, stream_download
+    from synthesis import synthesize
+
+    writer = SampleWriter(samples_dir, archive_codec=archive_codec)
+    await asyncio.to_thread(writer.sync_transcript)
+    todo = [text for text in lines if not writer.has(text)]
+    summary = {"total": len(lines), "skipped": len(lines) - len(todo)}
+    summary.update(written=0, failed=0)
+    semaphore = asyncio.Semaphore(max(1, workers))
+    playing = asyncio.Lock()
+
+    async def build(text: str) -> None:
+        try:
+            async with semaphore:
+                synthesis = await synthesize(text, [model], fallback=False)
+                audio = io.BytesIO()
+                await stream_download(synthesis.audio_url, audio)
+            converted = await asyncio.to_thread(to_sample_format, audio.getvalue())
+            path = await asyncio.to_thread(
+                writer.add,
+                text,
+                converted,
+                synthesis.model_token,
+                synthesis.model_name,
+            )
+        except Exception as err:
+            summary["failed"] += 1
+            print(f"Failed, {text!r} has: {err}")
+            return
+        summary["written"] += 1
+        done = summary["written"] + summary["failed"]
+        print(f"[{done}/{len(todo)}] Saved: {path}")
+        if play:
+            async with playing:
+                try:
+                    await asyncio.to_thread(play_wav, converted)
+                except Exception as play_err:
+                    print(f"Error playing sound: {play_err}")
+
+    try:
+        await asyncio.gather(*(build(text) for text in todo))
+    finally:
+        writer.close()
+        await close_http_client()
+    return summary
+
+
+def build_main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(
+        prog="sampler.py build",
+        description="Synthesize every line of a file into samples/N.wav clips.",
+    )
+    parser.add_argument("input", help="text file (one line per clip) or .jsonl")
+    parser.add_argument("--samples-dir", default=default_samples_dir())
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f"lines synthesized at once (default {DEFAULT_WORKERS})",
+    )
+    parser.add_argument("--play", action="store_true", help="play each clip")
+    parser.add_argument(
+        "--archive",
+        choices=CODECS,
+        metavar="CODEC",
+        help=f"store clips in the clip archive with CODEC ({', '.join(CODECS)})",
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    # Clips go to the samples directory, not the cache a server would resume
+    # these jobs into, so keep them out of the servers' job journals
+    os.environ.setdefault("YODA_JOB_JOURNAL_ENABLED", "0")
+
+    try:
+        lines = read_lines(args.input)
+    except (OSError, ValueError) as err:
+        print(f"Read the input, I could not: {err}")
+        return 1
+    summary = asyncio.run(
+        build_dataset(
+            lines,
+            args.samples_dir,
+            workers=args.workers,
+            play=args.play,
+            archive_codec=args.archive,
+        )
+    )
+    print(
+        f"Done, I am. {summary['written']} written, {summary['skipped']} "
+        f"already there, {summary['failed']} failed."
+    )
+    return 1 if summary["failed"] else 0
+
+
+def pack_main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(
+        prog="sampler.py pack",
+        description="Move samples/N.wav clips into the samples clip archive.",
+    )
+    parser.add_argument("--samples-dir", default=default_samples_dir())
+    parser.add_argument("--codec", choices=CODECS, default="zlib")
+    parser.add_argument("--keep", action="store_true", help="keep the wav files")
+    args = parser.parse_args(argv)
+    summary = pack_samples(args.samples_dir, args.codec, keep=args.keep)
+    print(
+        f"Packed, {summary['packed']} clips are. {summary['already']} were "
+        f"already, {summary['missing']} missing."
+    )
+    return 1 if summary["missing"] else 0
+
+
+def unpack_main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(
+        prog="sampler.py unpack",
+        description="Write archived clips back out as samples/N.wav files.",
+    )
+    parser.add_argument("--samples-dir", default=default_samples_dir())
+    args = parser.parse_args(argv)
+    written = unpack_samples(args.samples_dir)
+    print(f"Unpacked, {written} clips are.")
+    return 0
+
+
+COMMANDS = {"build": build_main, "pack": pack_main, "unpack": unpack_main}
+
+
 def main(text: str = None):
+    if text is None and sys.argv[1:2] and sys.argv[1] in COMMANDS:
+        sys.exit(COMMANDS[sys.argv[1]](sys.argv[2:]))
     if text is None:
         if len(sys.argv) > 1:
             text = " ".join(sys.argv[1:])
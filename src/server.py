@@ -1,8 +1,51 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from audio_backends import reset_audio_backends
+from clips import resume_journaled_jobs
+from config import env_str
+from fakeyou import close_http_client
+from job_journal import get_job_journal
 from mcp.server.fastmcp import FastMCP
+from prewarm import get_prewarmer
 from registry import register_all_tools
+from worker_pool import start_worker_pool, stop_worker_pool
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(server: FastMCP) -> AsyncIterator[None]:
+    """Keep shared resources open for the lifetime of the server."""
+    prewarmer = get_prewarmer()
+    corpus = env_str("YODA_PREWARM_CORPUS")
+    if corpus:
+        try:
+            prewarmer.start(corpus)
+        except (OSError, RuntimeError) as e:
+            logger.warning(f"Not prewarming the cache from {corpus}: {e}")
+    await start_worker_pool()
+    # Jobs still running when the last server stopped
+    resuming = asyncio.create_task(resume_journaled_jobs(), name="resume-jobs")
+    try:
+        yield
+    finally:
+        # Jobs cancelled from here on stay journaled for the next start
+        journal = get_job_journal()
+        if journal is not None:
+            journal.begin_shutdown()
+        resuming.cancel()
+        await asyncio.gather(resuming, return_exceptions=True)
+        await prewarmer.stop()
+        await stop_worker_pool()
+        await close_http_client()
+        reset_audio_backends()
+
 
 # Create an MCP server
-mcp = FastMCP("Website Snapshot")
+mcp = FastMCP("Website Snapshot", lifespan=lifespan)
 
 # Register all tools
 register_all_tools(mcp)
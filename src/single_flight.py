@@ -0,0 +1,95 @@
+"""Coalesce concurrent identical requests into one in-flight task.
+
+When several tool calls ask for the same thing at once (the same quote from
+the same model, or the same clip's audio), the first caller starts the work
+as a task and later callers attach to it rather than repeating it. Every
+caller gets the same result or exception. The task is only cancelled when
+every caller waiting on it has been cancelled; a caller that gives up does
+not take the others down with it.
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, TypeVar
+
+from metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class Flight:
+    """One shared piece of work and the callers waiting on it."""
+
+    def __init__(self, key: str, context: Any = None):
+        self.key = key
+        # Whatever the caller that started the flight handed over to share,
+        # e.g. the stream its download is written to
+        self.context = context
+        self.task: asyncio.Task | None = None
+        self.waiters = 0
+        self.joined = 0
+        self.abandoned = False
+
+
+class SingleFlight:
+    """Deduplicate concurrent calls by key, within one event loop."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: dict[str, Flight] = {}
+
+    def _reusable(self, flight: Flight | None) -> bool:
+        if flight is None or flight.abandoned or flight.task.done():
+            return False
+        # Tasks left over from an event loop that has since gone away
+        return flight.task.get_loop() is asyncio.get_running_loop()
+
+    def join(
+        self, key: str, make: Callable[[Any], Awaitable[T]], context: Any = None
+    ) -> Flight:
+        """Return the flight running for ``key``, or start ``make(context)`` as one.
+
+        ``context`` is only used when a new flight is started; a caller that
+        joins a running flight should use ``flight.context`` instead.
+        """
+        flight = self._flights.get(key)
+        if self._reusable(flight):
+            flight.joined += 1
+            get_metrics().inc("yoda_single_flight_joined_total", kind=self.name)
+            logger.info(f"Joining the {self.name} already in flight for {key[:12]}")
+            return flight
+
+        flight = Flight(key, context)
+        flight.task = asyncio.ensure_future(make(context))
+        flight.task.add_done_callback(lambda _: self._forget(flight))
+        self._flights[key] = flight
+        return flight
+
+    def _forget(self, flight: Flight) -> None:
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+
+    async def wait(self, flight: Flight) -> T:
+        """Wait for ``flight``'s result; cancel it if every waiter goes away."""
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.abandoned = True
+                flight.task.cancel()
+
+    async def do(self, key: str, make: Callable[[], Awaitable[T]]) -> T:
+        """Run ``make()`` for ``key``, or share the result of the run in flight."""
+        return await self.wait(self.join(key, lambda _: make()))
+
+    def running(self, key: str) -> bool:
+        """Whether a flight for ``key`` is running that a caller could join."""
+        return self._reusable(self._flights.get(key))
+
+    def in_flight(self) -> int:
+        """Number of flights currently running."""
+        return len(self._flights)
@@ -0,0 +1,527 @@
+"""Turn a quote into a FakeYou CDN URL, trying one or more Yoda models.
+
+By default models are tried strictly in order. Setting ``YODA_HEDGE_DELAY``
+enables hedged requests: the next model is submitted if the current one has not
+finished after that many seconds (``0`` submits to every model at once). The
+first model to reach ``complete_success`` wins and the others are cancelled.
+"""
+
+import asyncio
+import logging
+import math
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator
+
+import httpx
+
+from audio_cache import cache_key
+from config import env_float, env_str
+from engines import Engine, EngineError, RateLimited, get_engine
+from fakeyou import YODA_MODELS
+from job_journal import JournalEntry, get_job_journal
+from job_progress import QUEUED, STARTED, JobProgress, publish
+from metrics import get_metrics
+from model_health import get_model_health
+from polling import RUNNING_STATUSES, PollScheduler
+from rate_limit import RateLimiter, get_rate_limiter, rate_limit_max_wait
+from single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# FakeYou jobs in flight, keyed on the cache key of their quote and model
+_jobs = SingleFlight("job")
+
+
+class SynthesisError(Exception):
+    """A model, or every model, failed to produce audio.
+
+    The message is the user-facing reason reported back by the tool;
+    ``reason`` is a short machine-readable outcome used in metrics.
+    """
+
+    def __init__(self, message: str, reason: str = "error"):
+        super().__init__(message)
+        self.reason = reason
+
+
+@dataclass
+class Synthesis:
+    """A finished FakeYou job."""
+
+    model_token: str
+    model_name: str
+    audio_url: str
+    # Seconds spent per job status, plus "total"
+    timings: dict[str, float] = field(default_factory=dict)
+    polls: int = 0
+    # Engine that made it, to fetch the audio from
+    engine: str = "fakeyou"
+
+
+def hedge_delay_from_env() -> float:
+    """Return ``YODA_HEDGE_DELAY`` in seconds; infinity means sequential fallback."""
+    return max(0.0, env_float("YODA_HEDGE_DELAY", math.inf))
+
+
+async def synthesize_with_model(
+    quote: str, model_token: str, model_name: str, engine: str = "fakeyou"
+) -> Synthesis:
+    """Submit ``quote`` to one model and poll until its audio is ready.
+
+    Polls are paced by :class:`polling.PollScheduler`. The job's outcome and
+    latency are recorded per model in :mod:`metrics`. Concurrent calls for
+    the same normalized quote and model share a single job.
+
+    Raises:
+        SynthesisError: if the job is rejected, fails, stalls or times out.
+    """
+    return await _jobs.do(
+        cache_key(quote, model_token),
+        lambda: _synthesize_with_model(
+            quote, model_token, model_name, get_engine(engine)
+        ),
+    )
+
+
+async def _synthesize_with_model(
+    quote: str, model_token: str, model_name: str, engine: Engine
+) -> Synthesis:
+    metrics = get_metrics()
+    health = get_model_health()
+    health.started(model_token, model_name)
+    started = time.monotonic()
+    try:
+        synthesis = await _run_job(quote, model_token, model_name, engine)
+    except SynthesisError as e:
+        metrics.inc("yoda_jobs_total", model=model_name, outcome=e.reason)
+        health.record(model_token, model_name, e.reason, error=str(e))
+        raise
+    except asyncio.CancelledError:
+        metrics.inc("yoda_jobs_total", model=model_name, outcome="cancelled")
+        health.record(model_token, model_name, "cancelled")
+        raise
+    seconds = time.monotonic() - started
+    metrics.inc("yoda_jobs_total", model=model_name, outcome="success")
+    metrics.observe("yoda_job_seconds", seconds, model=model_name)
+    health.record(model_token, model_name, "success", seconds, synthesis.timings)
+    return synthesis
+
+
+@contextmanager
+def _job_errors(model_name: str) -> Iterator[None]:
+    """Turn anything a job raises into a :class:`SynthesisError`."""
+    try:
+        yield
+    except httpx.HTTPError as e:
+        logger.error(f"Network error with {model_name}: {e}")
+        raise SynthesisError(
+            f"Network error with {model_name}: {str(e)}", reason="network"
+        ) from e
+    except EngineError as e:
+        raise SynthesisError(str(e), reason=e.reason) from e
+    except SynthesisError:
+        raise
+    except Exception as e:
+        logger.error(f"Error with {model_name}: {e}")
+        raise SynthesisError(f"Error with {model_name}: {str(e)}") from e
+
+
+def _limiter(name: str | None) -> RateLimiter | None:
+    return None if name is None else get_rate_limiter(name)
+
+
+async def _run_job(
+    quote: str, model_token: str, model_name: str, engine: Engine
+) -> Synthesis:
+    metrics = get_metrics()
+    logger.info(f"Trying model: {model_name}")
+    idempotency_token = str(uuid.uuid4())
+
+    with _job_errors(model_name):
+        logger.info(f"Generating TTS for text: {quote}")
+        submit_limiter = _limiter(engine.submit_limit)
+        give_up_at = time.monotonic() + rate_limit_max_wait()
+        post_seconds = rate_limit_wait = 0.0
+        while True:
+            if submit_limiter is not None:
+                rate_limit_wait += await submit_limiter.acquire()
+            post_started = time.monotonic()
+            try:
+                job_token = await engine.submit(quote, model_token, idempotency_token)
+            except RateLimited as e:
+                post_seconds += time.monotonic() - post_started
+                # Rate limited: wait it out with the same idempotency token
+                metrics.inc("yoda_rate_limited_total", endpoint="post")
+                delay = (
+                    submit_limiter.penalize(e.retry_after)
+                    if submit_limiter is not None
+                    else e.retry_after or 0.0
+                )
+                if time.monotonic() + delay > give_up_at:
+                    logger.warning("Rate limited by API")
+                    raise SynthesisError(
+                        "Rate limited, the API is. Try again later, you must.",
+                        reason="rate_limited",
+                    )
+                if submit_limiter is None:
+                    await asyncio.sleep(delay)
+                continue
+            post_seconds += time.monotonic() - post_started
+            if submit_limiter is not None:
+                submit_limiter.succeeded()
+            break
+
+        logger.info(f"Job token received: {job_token}")
+
+    journal = get_job_journal() if engine.durable else None
+    if journal is not None:
+        await journal.add(job_token, quote, model_token, model_name)
+    publish(quote, JobProgress(QUEUED, model_name))
+    return await _follow_job(
+        quote,
+        job_token,
+        model_token,
+        model_name,
+        engine,
+        {"post": round(post_seconds, 3)},
+        rate_limit_wait,
+    )
+
+
+async def _follow_job(
+    quote: str,
+    job_token: str,
+    model_token: str,
+    model_name: str,
+    engine: Engine,
+    timings: dict[str, float],
+    rate_limit_wait: float = 0.0,
+) -> Synthesis:
+    """Poll a submitted job until it finishes, then drop it from the journal.
+
+    A durable job cancelled while the server shuts down stays in the journal,
+    to be resumed by the next server; cancelled at any other time, it is
+    dropped. Any other job that is cancelled or fails is cancelled on the
+    engine, so nothing it started is left behind.
+    """
+    try:
+        with _job_errors(model_name):
+            synthesis = await _poll_job(
+                quote,
+                job_token,
+                model_token,
+                model_name,
+                engine,
+                timings,
+                rate_limit_wait,
+            )
+    except SynthesisError:
+        if not engine.durable:
+            # A timed-out job may still be running
+            await engine.cancel(job_token)
+        await _forget_job(engine, job_token)
+        raise
+    except asyncio.CancelledError:
+        if not engine.durable:
+            await engine.cancel(job_token)
+        else:
+            journal = get_job_journal()
+            if journal is not None and not journal.shutting_down:
+                # A cancelled request or a hedge loser; no one wants the clip
+                await journal.remove(job_token)
+        raise
+    await _forget_job(engine, job_token)
+    return synthesis
+
+
+async def _forget_job(engine: Engine, job_token: str) -> None:
+    journal = get_job_journal() if engine.durable else None
+    if journal is not None:
+        await journal.remove(job_token)
+
+
+async def _poll_job(
+    quote: str,
+    job_token: str,
+    model_token: str,
+    model_name: str,
+    engine: Engine,
+    timings: dict[str, float],
+    rate_limit_wait: float,
+) -> Synthesis:
+    metrics = get_metrics()
+    poll_limiter = _limiter(engine.poll_limit)
+    job = None
+    scheduler = PollScheduler.from_env()
+
+    while True:
+        await asyncio.sleep(scheduler.next_delay())
+        if scheduler.expired():
+            logger.warning(f"Job timed out for {model_name}")
+            raise SynthesisError(
+                f"Waited too long for {model_name}, I have. "
+                f"Status was: {scheduler.status or 'unknown'}",
+                reason="timeout",
+            )
+
+        try:
+            if poll_limiter is not None:
+                rate_limit_wait += await poll_limiter.acquire()
+            metrics.inc("yoda_polls_total", model=model_name)
+            job = await engine.poll(job_token)
+        except RateLimited as e:
+            metrics.inc("yoda_rate_limited_total", endpoint="poll")
+            logger.warning(f"Status poll rate limited, retry after: {e.retry_after}")
+            # Other jobs' polls hold off too
+            scheduler.rate_limited(
+                poll_limiter.penalize(e.retry_after)
+                if poll_limiter is not None
+                else e.retry_after or 0.0
+            )
+            continue
+        except Exception as e:
+            logger.error(f"Error checking job status: {e}")
+            job = None
+            break
+        if poll_limiter is not None:
+            poll_limiter.succeeded()
+        if job is None:
+            break
+
+        scheduler.observe(job.status, job.attempt_count)
+        if job.status == "pending" or job.status in RUNNING_STATUSES:
+            stage = QUEUED if job.status == "pending" else STARTED
+            publish(
+                quote,
+                JobProgress(stage, model_name, job.attempt_count, job.queue_position),
+            )
+
+        logger.info(
+            f"Job status: {job.status} (attempt_count: {job.attempt_count}, "
+            f"poll: {scheduler.polls}, elapsed: {scheduler.elapsed():.1f}s)"
+        )
+
+        if job.status == "complete_success":
+            break
+        elif job.status == "failed":
+            logger.error(f"Job failed: {job.error}")
+            raise SynthesisError(
+                f"Failed with {model_name}: {job.error}", reason="failed"
+            )
+        elif job.status in RUNNING_STATUSES:
+            # Job is making progress
+            logger.info("Processing, the job is. Patient, we must be.")
+        elif scheduler.stuck():
+            logger.warning(f"Job stuck in pending for {model_name}")
+            raise SynthesisError(
+                f"In queue too long with {model_name}, the job was.",
+                reason="stuck",
+            )
+
+    timings = {**timings, **scheduler.finish()}
+    if rate_limit_wait:
+        timings["rate_limit_wait"] = round(rate_limit_wait, 3)
+    logger.info(f"Job phases for {model_name}: {timings} ({scheduler.polls} polls)")
+    if job is not None and job.status == "complete_success" and job.audio_url:
+        return Synthesis(
+            model_token,
+            model_name,
+            job.audio_url,
+            timings=timings,
+            polls=scheduler.polls,
+            engine=engine.name,
+        )
+    raise SynthesisError(
+        f"No result from {model_name}. Status was: {scheduler.status or 'unknown'}",
+        reason="no_result",
+    )
+
+
+async def resume_job(entry: JournalEntry) -> Synthesis:
+    """Poll a journaled job, submitted by an earlier server, to the end.
+
+    A request for the same quote and model made meanwhile shares it.
+
+    Raises:
+        SynthesisError: if the job fails or FakeYou no longer knows it.
+    """
+
+    async def follow() -> Synthesis:
+        logger.info(f"Resuming job {entry.job_token} for: {entry.quote}")
+        try:
+            synthesis = await _follow_job(
+                entry.quote,
+                entry.job_token,
+                entry.model_token,
+                entry.model_name,
+                get_engine("fakeyou"),
+                {},
+            )
+        except SynthesisError as e:
+            get_metrics().inc("yoda_jobs_resumed_total", outcome=e.reason)
+            raise
+        get_metrics().inc("yoda_jobs_resumed_total", outcome="success")
+        return synthesis
+
+    return await _jobs.do(cache_key(entry.quote, entry.model_token), follow)
+
+
+def local_fallback_after() -> float | None:
+    """Return ``YODA_LOCAL_FALLBACK_AFTER`` in seconds, or None when it is unset."""
+    if env_str("YODA_LOCAL_FALLBACK_AFTER") is None:
+        return None
+    return max(0.0, env_float("YODA_LOCAL_FALLBACK_AFTER", 0.0))
+
+
+async def synthesize(
+    quote: str,
+    models: list[tuple[str, str]] | None = None,
+    hedge_delay: float | None = None,
+    fallback: bool = True,
+) -> Synthesis:
+    """Synthesize ``quote`` with the first model that succeeds.
+
+    With ``YODA_LOCAL_FALLBACK_AFTER`` set and a local TTS program installed,
+    a quote FakeYou has not finished within that many seconds, or has failed,
+    is also given to the local engine. Whichever finishes first is used, so
+    a slow or broken FakeYou costs at most that delay plus a local run.
+
+    Args:
+        quote: Text to speak.
+        models: ``(model_token, model_name)`` pairs in order of preference.
+        hedge_delay: See :func:`synthesize_remote`.
+        fallback: ``False`` to only ever use FakeYou's Yoda voice.
+
+    Raises:
+        SynthesisError: with the last model's error if every model fails.
+    """
+    after = local_fallback_after() if fallback else None
+    local = get_engine("local")
+    if after is None or not local.available():
+        return await synthesize_remote(quote, models, hedge_delay)
+
+    remote = asyncio.create_task(synthesize_remote(quote, models, hedge_delay))
+    tasks = [remote]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=after)
+        if done and remote.exception() is None:
+            return remote.result()
+        reason = "failed" if done else "slow"
+        logger.warning(f"FakeYou {reason}, falling back to the local voice")
+        get_metrics().inc("yoda_local_fallbacks_total", reason=reason)
+        model_token, model_name = local.models()[0]
+        tasks.append(
+            asyncio.create_task(
+                synthesize_with_model(quote, model_token, model_name, local.name)
+            )
+        )
+        pending = set(tasks) - done
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            # FakeYou first, if both finish in the same step
+            for task in tasks:
+                if task in done and task.exception() is None:
+                    return task.result()
+        raise remote.exception()
+    finally:
+        unfinished = [task for task in tasks if not task.done()]
+        for task in unfinished:
+            task.cancel()
+        if unfinished:
+            await asyncio.gather(*unfinished, return_exceptions=True)
+
+
+async def synthesize_remote(
+    quote: str,
+    models: list[tuple[str, str]] | None = None,
+    hedge_delay: float | None = None,
+) -> Synthesis:
+    """Synthesize ``quote`` with the first FakeYou model that succeeds.
+
+    Args:
+        quote: Text to speak.
+        models: ``(model_token, model_name)`` pairs in order of preference;
+            by default every Yoda model, healthiest and fastest first (see
+            :mod:`model_health`).
+        hedge_delay: Seconds to wait on a model before also submitting to the
+            next one. ``0`` races all models at once; infinity (the default
+            unless ``YODA_HEDGE_DELAY`` is set) waits for each model to fail.
+
+    Raises:
+        SynthesisError: with the last model's error if every model fails.
+    """
+    if models is None:
+        models = get_model_health().order(YODA_MODELS)
+    # A job already running for this quote is joined, whichever model it is
+    # on, even if the order has changed since (a probe, a breaker) it started
+    models = sorted(
+        models, key=lambda model: not _jobs.running(cache_key(quote, model[0]))
+    )
+    if hedge_delay is None:
+        hedge_delay = hedge_delay_from_env()
+
+    loop = asyncio.get_running_loop()
+    launched: list[asyncio.Task] = []
+    pending: set[asyncio.Task] = set()
+    last_error = None
+
+    def settle(done: set[asyncio.Task]) -> Synthesis | None:
+        nonlocal last_error
+        # Prefer the earlier model when several finish in the same step
+        for task in sorted(done, key=launched.index):
+            error = task.exception()
+            if error is None:
+                return task.result()
+            last_error = str(error)
+        return None
+
+    try:
+        for index, (model_token, model_name) in enumerate(models):
+            task = asyncio.create_task(
+                synthesize_with_model(quote, model_token, model_name)
+            )
+            launched.append(task)
+            pending.add(task)
+            if index == len(models) - 1:
+                break
+
+            # Give the running models a head start before hedging to the next
+            deadline = loop.time() + hedge_delay
+            while pending:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    logger.info(f"Hedging, {model_name} is slow. Next model, we try.")
+                    get_metrics().inc("yoda_hedges_total")
+                    break
+                done, pending = await asyncio.wait(
+                    pending,
+                    timeout=None if math.isinf(timeout) else timeout,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                winner = settle(done)
+                if winner is not None:
+                    return winner
+            else:
+                # Every model so far failed
+                get_metrics().inc("yoda_fallbacks_total")
+
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            winner = settle(done)
+            if winner is not None:
+                return winner
+    finally:
+        # Stop polling on behalf of the losers
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    raise SynthesisError(last_error, reason="all_failed")
@@ -0,0 +1,16 @@
+import json
+
+from audio_backends import get_audio_backends
+
+
+def audio_diagnostics(reprobe: bool = False) -> dict:
+    """Show which audio backends work here, which one plays, and their latency.
+
+    Args:
+        reprobe: Probe every backend again, e.g. after plugging in a sound
+            device; this also clears demotions.
+    """
+    backends = get_audio_backends()
+    backends.probe(force=reprobe)
+    diagnostics = backends.diagnostics()
+    return {"content": [{"type": "text", "text": json.dumps(diagnostics, indent=2)}]}
@@ -0,0 +1,11 @@
+import json
+
+from audio_cache import get_audio_cache
+
+
+def cache_stats() -> dict:
+    """Report hit/miss counters and occupancy of the Yoda audio cache."""
+    cache = get_audio_cache()
+    if cache is None:
+        return {"content": [{"type": "text", "text": "Disabled, the audio cache is."}]}
+    return {"content": [{"type": "text", "text": json.dumps(cache.stats(), indent=2)}]}
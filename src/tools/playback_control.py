@@ -0,0 +1,29 @@
+import json
+
+from playback_queue import get_playback_queue
+
+
+def playback_status() -> dict:
+    """Show the clip playing now, the clips waiting to play and playback counters."""
+    status = get_playback_queue().status()
+    return {"content": [{"type": "text", "text": json.dumps(status, indent=2)}]}
+
+
+def playback_skip() -> dict:
+    """Stop the clip playing now and move on to the next queued clip."""
+    skipped = get_playback_queue().skip()
+    if skipped is None:
+        text = "Playing, nothing is. Skip, I cannot."
+    else:
+        text = f"Skipped, the clip is: {skipped['label']}"
+    return {"content": [{"type": "text", "text": text}]}
+
+
+def playback_flush() -> dict:
+    """Drop every clip still waiting to play; the clip playing now finishes."""
+    dropped = get_playback_queue().flush()
+    return {
+        "content": [
+            {"type": "text", "text": f"Cleared, the queue is. Dropped {dropped} clips."}
+        ]
+    }
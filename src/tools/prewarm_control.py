@@ -0,0 +1,58 @@
+import json
+
+from config import env_str
+from prewarm import get_prewarmer
+
+
+def prewarm_status() -> dict:
+    """Show how far the background cache prewarming has got through its corpus."""
+    status = get_prewarmer().status()
+    return {"content": [{"type": "text", "text": json.dumps(status, indent=2)}]}
+
+
+def prewarm_start(corpus: str = "") -> dict:
+    """Fill the audio cache in the background from a file of likely quotes.
+
+    Quotes are synthesized one at a time while the server is otherwise idle,
+    and a run that was stopped or interrupted picks up where it left off.
+
+    Args:
+        corpus: Path of a text file with one quote per line. Defaults to
+            YODA_PREWARM_CORPUS.
+    """
+    path = corpus or env_str("YODA_PREWARM_CORPUS")
+    if not path:
+        return {
+            "content": [{"type": "text", "text": "A corpus file, you must give."}],
+            "isError": True,
+        }
+    prewarmer = get_prewarmer()
+    try:
+        prewarmer.start(path)
+    except (OSError, RuntimeError) as e:
+        return {
+            "content": [{"type": "text", "text": f"Prewarm, I cannot: {e}"}],
+            "isError": True,
+        }
+    status = prewarmer.status()
+    return {
+        "content": [
+            {
+                "type": "text",
+                "text": f"Prewarming, I am. {status['remaining']} of {status['total']} quotes remain.",
+            }
+        ]
+    }
+
+
+async def prewarm_stop() -> dict:
+    """Stop background prewarming; its progress is kept for the next start."""
+    prewarmer = get_prewarmer()
+    was_running = prewarmer.running
+    await prewarmer.stop()
+    text = (
+        f"Stopped, prewarming is, at {prewarmer.position} of {prewarmer.total}."
+        if was_running
+        else "Prewarming, nothing is."
+    )
+    return {"content": [{"type": "text", "text": text}]}
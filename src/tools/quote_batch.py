@@ -0,0 +1,146 @@
+import asyncio
+import json
+import logging
+import time
+
+from clips import Clip, ClipDownloadError, fetch_clip
+from config import env_int
+from mcp.server.fastmcp import Context
+from metrics import get_metrics
+from playback_queue import get_playback_queue
+from synthesis import SynthesisError
+
+logger = logging.getLogger(__name__)
+
+# Quotes synthesized at once when YODA_BATCH_CONCURRENCY is not set
+DEFAULT_CONCURRENCY = 4
+
+
+async def _synthesize_item(
+    index: int, quote: str, semaphore: asyncio.Semaphore
+) -> tuple[dict, Clip | None]:
+    """Fetch one quote's clip and describe the outcome.
+
+    Only cancellation propagates; any other failure becomes the item's error,
+    so one quote cannot abort the rest of the batch.
+    """
+    item = {"index": index, "quote": quote}
+    span = get_metrics().span("quote_batch_item")
+    outcome = "error"
+    started = time.monotonic()
+    try:
+        try:
+            async with semaphore:
+                span.record("batch_wait", time.monotonic() - started)
+                clip = await fetch_clip(quote)
+        except SynthesisError as e:
+            item.update(status="failed", error=str(e))
+            clip = None
+        except ClipDownloadError as e:
+            item.update(
+                status="download_failed",
+                model=e.synthesis.model_name,
+                audio_url=e.synthesis.audio_url,
+                error=str(e),
+            )
+            clip = None
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        except Exception as e:
+            logger.exception(f"Unexpected error synthesizing {quote!r}")
+            item.update(status="error", error=f"{type(e).__name__}: {e}")
+            clip = None
+        if clip is not None:
+            item.update(
+                status="cached" if clip.cached else "synthesized",
+                model=clip.model_name,
+                audio_url=clip.audio_url,
+                path=clip.path,
+            )
+        item["timings"] = {
+            **(clip.timings if clip is not None else {}),
+            "total": round(time.monotonic() - started, 3),
+        }
+        span.record_all(item["timings"])
+        outcome = item["status"]
+        return item, clip
+    finally:
+        # Unfinished spans would keep the server from ever looking idle
+        span.finish(outcome)
+
+
+async def quote_batch(
+    quotes: list[str], play: bool = False, ctx: Context = None
+) -> dict:
+    """Convert many quotes to Yoda's voice concurrently in a single call.
+
+    Quotes are synthesized at most YODA_BATCH_CONCURRENCY at a time. Each
+    result is sent to the client as a log message as soon as it completes; the
+    final result lists every quote in input order with its status, audio URL,
+    cached path and timings.
+
+    Args:
+        quotes: The texts to convert to Yoda's voice.
+        play: Also queue the clips for local playback, in input order, as they
+            become ready. The call returns without waiting for playback.
+    """
+    if not quotes:
+        return {
+            "content": [{"type": "text", "text": "Quotes, you gave me none."}],
+            "isError": True,
+        }
+
+    started = time.monotonic()
+    semaphore = asyncio.Semaphore(
+        max(1, env_int("YODA_BATCH_CONCURRENCY", DEFAULT_CONCURRENCY))
+    )
+    tasks = [
+        asyncio.create_task(_synthesize_item(index, quote, semaphore))
+        for index, quote in enumerate(quotes)
+    ]
+    items: list[dict | None] = [None] * len(quotes)
+    clips: list[Clip | None] = [None] * len(quotes)
+    ready = [asyncio.Event() for _ in quotes]
+
+    async def enqueue_in_order() -> None:
+        queue = get_playback_queue()
+        for index, event in enumerate(ready):
+            await event.wait()
+            clip = clips[index]
+            if clip is not None:
+                logger.info(f"Queueing audio: {clip.path or 'in memory'}")
+                item = queue.enqueue(clip.source, label=clip.quote)
+                items[index]["playback_id"] = item.id
+
+    player = asyncio.create_task(enqueue_in_order()) if play else None
+    try:
+        for completed, next_done in enumerate(asyncio.as_completed(tasks), start=1):
+            item, clip = await next_done
+            index = item["index"]
+            item["completed_order"] = completed
+            items[index], clips[index] = item, clip
+            ready[index].set()
+            if ctx is not None:
+                await ctx.info(json.dumps(item))
+                await ctx.report_progress(completed, len(quotes))
+        if player is not None:
+            await player
+    finally:
+        for task in tasks:
+            task.cancel()
+        if player is not None:
+            player.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    succeeded = sum(1 for item in items if item["status"] in ("cached", "synthesized"))
+    summary = {
+        "succeeded": succeeded,
+        "failed": len(items) - succeeded,
+        "wall_time": round(time.monotonic() - started, 3),
+        "results": items,
+    }
+    return {
+        "content": [{"type": "text", "text": json.dumps(summary, indent=2)}],
+        "isError": succeeded == 0,
+    }
@@ -1,330 +1,263 @@
 # server.py
+import asyncio
+import json
 import logging
-import os
-import subprocess
-import sys
-import tempfile
-import time
-import uuid
-
-import requests
-import simpleaudio as sa
-from mcp.server.fastmcp import FastMCP
-
-# Set up logging for debugging
-logging.basicConfig(level=logging.INFO)
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from audio_cache import get_audio_cache
+from audio_stream import AudioStream
+from chunking import chunk_quote, fetch_chunks
+from clips import ClipDownloadError, lookup_clip, start_download
+from config import env_bool
+from job_progress import PLAYING, STAGES, JobProgress, watch
+from mcp.server.fastmcp import Context
+from metrics import Span, get_metrics
+from playback_queue import PlaybackItem, get_playback_queue
+from synthesis import SynthesisError, synthesize
+from worker_pool import get_worker_pool
+
 logger = logging.getLogger(__name__)
 
-# Try to import pygame
-try:
-    import pygame
 
-    try:
-        pygame.mixer.init()
-        PYGAME_AVAILABLE = True
-        logger.info("Pygame initialized successfully")
-    except pygame.error as e:
-        PYGAME_AVAILABLE = False
-        logger.warning(f"Pygame mixer initialization failed: {e}")
-        logger.info("Will use fallback audio methods")
-except ImportError:
-    PYGAME_AVAILABLE = False
-    logger.warning("Pygame not available, using fallback audio methods")
-
-# Create an MCP server
-mcp = FastMCP("Yoda TTS")
-
-
-def play_audio_pygame(file_path: str) -> bool:
-    """Play audio using pygame."""
-    if not PYGAME_AVAILABLE:
-        logger.debug("Pygame not available, skipping pygame playback")
-        return False
-    try:
-        pygame.mixer.music.load(file_path)
-        pygame.mixer.music.play()
-        while pygame.mixer.music.get_busy():
-            time.sleep(0.1)
-        return True
-    except Exception as e:
-        logger.error(f"Pygame playback failed: {e}")
-        return False
-
-
-def play_audio_simpleaudio(file_path: str) -> bool:
-    """Play audio using simpleaudio."""
-    try:
-        wave_obj = sa.WaveObject.from_wave_file(file_path)
-        play_obj = wave_obj.play()
-        play_obj.wait_done()
-        return True
-    except Exception as e:
-        logger.error(f"Simpleaudio playback failed: {e}")
-        return False
+def _queued_result(model_name: str, audio_url: str, position: int) -> dict:
+    """Build the tool result for audio handed to the playback queue."""
+    ahead = f" Ahead of it, {position} clips wait." if position else ""
+    return {
+        "content": [
+            {
+                "type": "text",
+                "text": f"Queued with {model_name}, the words are.{ahead}\nAudio URL, you seek: {audio_url}",
+            }
+        ]
+    }
 
 
-def play_audio_system(file_path: str) -> bool:
-    """Play audio using system command."""
-    try:
-        system = sys.platform
-        if system == "darwin":  # macOS
-            subprocess.run(["afplay", file_path], check=True)
-        elif system == "linux":
-            # Try multiple Linux audio players
-            for cmd in [
-                ["aplay", file_path],
-                ["paplay", file_path],
-                ["ffplay", "-nodisp", "-autoexit", file_path],
-            ]:
-                try:
-                    subprocess.run(cmd, check=True, stderr=subprocess.DEVNULL)
-                    return True
-                except (subprocess.CalledProcessError, FileNotFoundError):
-                    continue
-        elif system == "win32":  # Windows
-            subprocess.run(
-                [
-                    "powershell",
-                    "-c",
-                    f"(New-Object Media.SoundPlayer '{file_path}').PlaySync()",
-                ],
-                check=True,
-            )
-        else:
-            return False
-        return True
-    except Exception as e:
-        logger.error(f"System playback failed: {e}")
-        return False
-
-
-def play_audio(file_path: str) -> bool:
-    """Try multiple methods to play audio file."""
-    logger.info(f"Attempting to play audio file: {file_path}")
-
-    # Try pygame first if available
-    if PYGAME_AVAILABLE:
-        logger.info("Trying pygame...")
-        if play_audio_pygame(file_path):
-            return True
-
-    # Try simpleaudio
-    logger.info("Trying simpleaudio...")
-    if play_audio_simpleaudio(file_path):
-        return True
-
-    # Try system command as last resort
-    logger.info("Trying system command...")
-    if play_audio_system(file_path):
-        return True
-
-    logger.error("All audio playback methods failed")
-    return False
-
-
-def quote_play(quote: str) -> dict:
-    POST_URL = "https://api.fakeyou.com/tts/inference"
-    GET_URL = "https://api.fakeyou.com/v1/model_inference/job_status/"
-
-    # Add headers that might be required
-    headers = {
-        "Accept": "application/json",
-        "Content-Type": "application/json",
-        "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36",
+def _failed_result(error) -> dict:
+    """Build the tool result for a quote no model could synthesize."""
+    return {
+        "content": [
+            {
+                "type": "text",
+                "text": f"Failed, all voice models have. Patience with the Force, you must have.\n\nLast error: {error}\n\nBusy or down, the TTS service might be. Try again later, you should.",
+            }
+        ],
+        "isError": True,
     }
 
-    # List of Yoda models to try in order of preference
-    yoda_models = [
-        ("weight_8ye42btvd3ybnc6srbghr2ap2", "Yoda (Version 1.0)"),
-        ("weight_tqpbyrp6t9rmdez9c38zzvp0z", "Yoda (Version 2.0)"),
-    ]
 
-    last_error = None
+def _download_failed_result(error: ClipDownloadError) -> dict:
+    """Build the tool result for audio that was synthesized but not retrieved."""
+    synthesis = error.synthesis
+    return {
+        "content": [
+            {
+                "type": "text",
+                "text": f"Generated audio URL with {synthesis.model_name}: {synthesis.audio_url}\nBut retrieve it, I could not. Error: {str(error)}",
+            }
+        ],
+        "isError": False,
+    }
 
-    for model_token, model_name in yoda_models:
-        logger.info(f"Trying model: {model_name}")
 
-        post_body = {
-            "uuid_idempotency_token": str(uuid.uuid4()),
-            "tts_model_token": model_token,
-            "inference_text": quote,
+def _playback_result(model_name: str, audio_url: str, played: bool) -> dict:
+    """Build the tool result for audio that was fetched and (maybe) played."""
+    if played:
+        return {
+            "content": [
+                {
+                    "type": "text",
+                    "text": f"Spoken with {model_name}, the words have been.\nAudio URL, you seek: {audio_url}",
+                }
+            ]
         }
-
-        try:
-            logger.info(f"Generating TTS for text: {quote}")
-            post_res = requests.post(
-                POST_URL, json=post_body, headers=headers, timeout=10
-            )
-
-            # Check for rate limiting
-            if post_res.status_code == 429:
-                logger.warning("Rate limited by API")
-                last_error = "Rate limited, the API is. Try again later, you must."
-                continue
-
-            post_res.raise_for_status()
-            post_data = post_res.json()
-
-            if not post_data.get("success"):
-                logger.error(f"POST response: {post_data}")
-                last_error = post_data.get("error_reason", "Unknown error")
-                continue
-
-            job_token = post_data["inference_job_token"]
-            logger.info(f"Job token received: {job_token}")
-
-            done = False
-            result = None
-            attempts = 0
-            last_status = "unknown"
-            no_progress_count = 0
-
-            # Wait up to 60 seconds for the job to complete
-            while not done and attempts < 30:
-                time.sleep(2)
-                attempts += 1
-
-                try:
-                    get_res = requests.get(
-                        f"{GET_URL}{job_token}", headers=headers, timeout=10
-                    )
-                    get_res.raise_for_status()
-                    get_data = get_res.json()
-
-                    if not get_data.get("success"):
-                        logger.error(f"Job status check failed: {get_data}")
-                        break
-
-                    state = get_data.get("state", {})
-                    status_info = state.get("status", {})
-                    status = status_info.get("status", "unknown")
-                    attempt_count = status_info.get("attempt_count", 0)
-
-                    logger.info(
-                        f"Job status: {status} (attempt_count: {attempt_count}, poll: {attempts}/30)"
-                    )
-
-                    if status == "complete_success":
-                        done = True
-                        result = state.get("maybe_result")
-                        break
-                    elif status == "failed":
-                        error_info = state.get(
-                            "error",
-                            status_info.get(
-                                "maybe_extra_status_description", "Unknown error"
-                            ),
-                        )
-                        logger.error(f"Job failed: {error_info}")
-                        last_error = f"Failed with {model_name}: {error_info}"
-                        break
-                    elif status in ["started", "processing"]:
-                        # Job is making progress
-                        no_progress_count = 0
-                        logger.info("Processing, the job is. Patient, we must be.")
-                    elif status == "pending" and attempt_count == 0:
-                        # Still in queue
-                        no_progress_count += 1
-                        if no_progress_count >= 10:  # 20 seconds of no progress
-                            logger.warning(f"Job stuck in pending for {model_name}")
-                            last_error = (
-                                f"In queue too long with {model_name}, the job was."
-                            )
-                            break
-
-                    last_status = status
-
-                except Exception as e:
-                    logger.error(f"Error checking job status: {e}")
-                    break
-
-            if (
-                done
-                and result
-                and result.get("media_links")
-                and result["media_links"].get("cdn_url")
-            ):
-                audio_url = result["media_links"]["cdn_url"]
-                logger.info(f"Success! Downloading audio from: {audio_url}")
-
-                try:
-                    # Download the audio file
-                    audio_res = requests.get(audio_url, timeout=30)
-                    audio_res.raise_for_status()
-
-                    # Save to temporary file
-                    with tempfile.NamedTemporaryFile(
-                        suffix=".wav", delete=False
-                    ) as tmp_file:
-                        tmp_file.write(audio_res.content)
-                        tmp_file_path = tmp_file.name
-
-                    try:
-                        # Play the audio file
-                        logger.info(f"Playing audio file: {tmp_file_path}")
-                        success = play_audio(tmp_file_path)
-
-                        if success:
-                            return {
-                                "content": [
-                                    {
-                                        "type": "text",
-                                        "text": f"Spoken with {model_name}, the words have been.\nAudio URL, you seek: {audio_url}",
-                                    }
-                                ]
-                            }
-                        else:
-                            return {
-                                "content": [
-                                    {
-                                        "type": "text",
-                                        "text": f"Audio URL from {model_name}, you seek: {audio_url}\nBut play the sound, I could not. Download and play manually, you must.",
-                                    }
-                                ],
-                                "isError": False,
-                            }
-                    finally:
-                        # Clean up temporary file
-                        try:
-                            os.unlink(tmp_file_path)
-                        except Exception as e:
-                            logger.warning(f"Could not delete temporary file: {e}")
-
-                except Exception as e:
-                    logger.error(f"Error downloading/playing audio: {e}")
-                    return {
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": f"Generated audio URL with {model_name}: {audio_url}\nBut retrieve it, I could not. Error: {str(e)}",
-                            }
-                        ],
-                        "isError": False,
-                    }
-            else:
-                # This model didn't work, try the next one
-                if not result:
-                    last_error = (
-                        f"No result from {model_name}. Status was: {last_status}"
-                    )
-                continue
-
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Network error with {model_name}: {e}")
-            last_error = f"Network error with {model_name}: {str(e)}"
-            continue
-        except Exception as e:
-            logger.error(f"Error with {model_name}: {e}")
-            last_error = f"Error with {model_name}: {str(e)}"
-            continue
-
-    # All models failed
     return {
         "content": [
             {
                 "type": "text",
-                "text": f"Failed, all voice models have. Patience with the Force, you must have.\n\nLast error: {last_error}\n\nBusy or down, the TTS service might be. Try again later, you should.",
+                "text": f"Audio URL from {model_name}, you seek: {audio_url}\nBut play the sound, I could not. Download and play manually, you must.",
             }
         ],
-        "isError": True,
+        "isError": False,
     }
+
+
+class _ProgressReporter:
+    """Pass a quote's progress on to the MCP client, in order, as it happens.
+
+    Every change is sent as a JSON log message; each new stage is also a
+    progress notification, numbered by its place in :data:`STAGES`.
+    """
+
+    def __init__(self, ctx: Context | None):
+        self._ctx = ctx
+        self._updates: asyncio.Queue[JobProgress] = asyncio.Queue()
+        self._stage = 0
+        self._last: dict | None = None
+
+    def __call__(self, progress: JobProgress) -> None:
+        if self._ctx is not None:
+            self._updates.put_nowait(progress)
+
+    @asynccontextmanager
+    async def watching(self, quotes: list[str]) -> AsyncIterator[None]:
+        """Report the progress of the jobs for ``quotes`` meanwhile."""
+        if self._ctx is None:
+            yield
+            return
+        sender = asyncio.create_task(self._send_all())
+        try:
+            with watch(quotes, self):
+                yield
+            # Whatever is still queued goes out before the result
+            await self._updates.join()
+        finally:
+            sender.cancel()
+            await asyncio.gather(sender, return_exceptions=True)
+
+    async def _send_all(self) -> None:
+        while True:
+            progress = await self._updates.get()
+            try:
+                await self._send(progress)
+            finally:
+                self._updates.task_done()
+
+    async def _send(self, progress: JobProgress) -> None:
+        info = progress.describe()
+        if info == self._last:
+            return
+        self._last = info
+        try:
+            await self._ctx.info(json.dumps(info))
+            stage = STAGES.index(progress.stage) + 1
+            if stage > self._stage:
+                self._stage = stage
+                await self._ctx.report_progress(stage, len(STAGES))
+        except Exception as e:
+            logger.warning(f"Could not send progress to the client: {e}")
+
+
+async def quote_play(quote: str, ctx: Context = None) -> dict:
+    """Speak a quote in Yoda's voice and queue it for playback.
+
+    While FakeYou works on the quote, progress notifications follow it
+    through the stages queued, started, downloading and playing. Log
+    messages carry FakeYou's attempt count and queue position when it
+    reports them. If the client cancels the call, polling stops at once.
+
+    Args:
+        quote: The text to speak.
+    """
+    span = get_metrics().span("quote_play")
+    outcome = "error"
+    progress = _ProgressReporter(ctx)
+    try:
+        async with progress.watching([quote, *chunk_quote(quote)]):
+            result, outcome = await _speak(quote, span, progress)
+        return result
+    except asyncio.CancelledError:
+        logger.info(f"Cancelled by the client, the quote was: {quote}")
+        outcome = "cancelled"
+        raise
+    finally:
+        span.finish(outcome)
+
+
+async def _speak(
+    quote: str, span: Span, progress: _ProgressReporter
+) -> tuple[dict, str]:
+    """Fetch and queue ``quote``; return the tool result and its outcome."""
+    queue = get_playback_queue()
+    with span.phase("cache_lookup"):
+        clip = lookup_clip(quote)
+    if clip is not None:
+        outcome = "cached"
+        item = queue.enqueue(clip.path, label=quote)
+    elif len(chunks := chunk_quote(quote)) > 1:
+        return await _speak_chunks(quote, chunks, span, progress)
+    elif get_worker_pool() is not None:
+        return await _speak_on_worker(quote, span, progress)
+    else:
+        outcome = "synthesized"
+        try:
+            synthesis = await synthesize(quote)
+        except SynthesisError as e:
+            # All models failed
+            return _failed_result(e), "failed"
+        span.attrs["model"] = synthesis.model_name
+        span.record_all(synthesis.timings)
+
+        # Queue the clip before downloading it so playback starts while it streams
+        pending = start_download(quote, synthesis, get_audio_cache())
+        item = queue.enqueue(pending.stream, label=quote)
+        try:
+            with span.phase("download"):
+                clip = await pending.wait()
+        except ClipDownloadError as e:
+            logger.error(f"Error downloading/playing audio: {e}")
+            return _download_failed_result(e), "download_failed"
+
+    result = await _finish(item, clip.model_name, clip.audio_url, span, progress)
+    return result, outcome
+
+
+async def _speak_on_worker(
+    quote: str, span: Span, progress: _ProgressReporter
+) -> tuple[dict, str]:
+    """Have a worker process synthesize and download ``quote``, then queue it."""
+    try:
+        with span.phase("worker"):
+            clip = await get_worker_pool().fetch_clip(quote)
+    except SynthesisError as e:
+        return _failed_result(e), "failed"
+    except ClipDownloadError as e:
+        logger.error(f"Error downloading/playing audio: {e}")
+        return _download_failed_result(e), "download_failed"
+    span.attrs["model"] = clip.model_name
+    span.record_all(clip.timings)
+    item = get_playback_queue().enqueue(clip.source, label=quote)
+    result = await _finish(item, clip.model_name, clip.audio_url, span, progress)
+    return result, "synthesized"
+
+
+async def _finish(
+    item: PlaybackItem,
+    model_name: str,
+    audio_url: str,
+    span: Span,
+    progress: _ProgressReporter,
+) -> dict:
+    """Wait for playback if configured to, and build the tool result."""
+    position = get_playback_queue().position(item)
+    progress(JobProgress(PLAYING, model_name, playback_position=position))
+    if env_bool("YODA_PLAYBACK_WAIT", False):
+        with span.phase("playback"):
+            played = await asyncio.wrap_future(item.future)
+        return _playback_result(model_name, audio_url, played)
+    return _queued_result(model_name, audio_url, get_playback_queue().position(item))
+
+
+async def _speak_chunks(
+    quote: str, chunks: list[str], span: Span, progress: _ProgressReporter
+) -> tuple[dict, str]:
+    """Speak a long quote sentence by sentence, as one gapless clip."""
+    span.attrs["chunks"] = len(chunks)
+    # Queued first, it starts playing as soon as the first chunk arrives
+    stream = AudioStream()
+    item = get_playback_queue().enqueue(stream, label=quote)
+    with span.phase("chunks"):
+        results = await fetch_chunks(chunks, stream)
+    spoken = [result for result in results if result.clip is not None]
+    if not spoken:
+        return _failed_result(results[-1].error), "failed"
+    if results[0].clip is not None:
+        span.record("first_chunk", results[0].ready_after)
+    span.attrs["model"] = spoken[0].clip.model_name
+    audio_urls = "\n".join(result.clip.audio_url for result in spoken)
+    result = await _finish(item, spoken[0].clip.model_name, audio_urls, span, progress)
+    if len(spoken) < len(chunks):
+        lost = ", ".join(str(part.index + 1) for part in results if part.clip is None)
+        result["content"][0]["text"] += f"\nLost, parts {lost} of {len(chunks)} were."
+        return result, "partial"
+    return result, "synthesized"
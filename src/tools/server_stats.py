@@ -0,0 +1,43 @@
+import json
+
+from metrics import get_metrics
+from model_health import get_model_health
+from rate_limit import rate_limit_stats
+from worker_pool import get_worker_pool
+
+
+def server_stats(format: str = "json") -> dict:
+    """Report where request time goes.
+
+    The JSON report has:
+
+    - latency percentiles per phase, and outcome counters
+    - rate limiter state
+    - per-model health
+    - worker queue depths, when worker processes are running
+    - the most recent requests
+
+    Args:
+        format: "json" for the report above, or "prometheus" for the
+            Prometheus text format.
+    """
+    metrics = get_metrics()
+    if format == "prometheus":
+        return {"content": [{"type": "text", "text": metrics.prometheus()}]}
+    if format != "json":
+        return {
+            "content": [
+                {"type": "text", "text": f"Unknown format '{format}', this is."}
+            ],
+            "isError": True,
+        }
+    snapshot = {
+        **metrics.snapshot(),
+        "rate_limits": rate_limit_stats(),
+        "models": get_model_health().stats(),
+    }
+    pool = get_worker_pool()
+    if pool is not None:
+        snapshot["workers"] = pool.stats()
+    text = json.dumps(snapshot, indent=2)
+    return {"content": [{"type": "text", "text": text}]}
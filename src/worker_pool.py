@@ -0,0 +1,387 @@
+"""Synthesis and downloads in worker processes, for ``YODA_WORKERS`` > 0.
+
+By default one server process polls FakeYou, downloads and decodes every
+clip. With ``YODA_WORKERS=N`` that process only speaks MCP and plays audio,
+and hands each quote that misses the cache to one of N worker processes.
+The worker synthesizes the quote, downloads it into the shared on-disk audio
+cache and replies with where the clip is. A clip that is not cached (with the
+cache disabled, or from the local voice) comes back in the reply instead.
+
+Each quote goes to the worker with the fewest jobs in flight. Concurrent
+requests for the same quote share one job, as they do without workers (see
+:mod:`single_flight`), so they cannot reach FakeYou twice through two
+workers. The front process keeps each worker's queue depth, peak depth and job counts for
+``server_stats``. Workers pass on the progress of their jobs (see
+:mod:`job_progress`) to the front process.
+
+Workers split the ``YODA_RATE_*`` budgets between them, so together they
+stay within FakeYou's limits. Like any process, each keeps its own job
+journal (see :mod:`job_journal`), and a starting worker resumes the jobs of
+processes that have died. A worker that dies fails its jobs in flight and
+gets no new ones.
+"""
+
+import asyncio
+import logging
+import math
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass
+
+from audio_cache import normalize_text
+from audio_stream import AudioStream
+from clips import Clip, ClipDownloadError
+from config import env_float, env_int
+from job_progress import JobProgress, publish, watch
+from metrics import get_metrics
+from rate_limit import DEFAULT_LIMITS
+from single_flight import SingleFlight
+from synthesis import Synthesis, SynthesisError
+
+logger = logging.getLogger(__name__)
+
+# Seconds a stopping worker gets to exit before it is killed
+STOP_TIMEOUT = 5.0
+
+
+class WorkerError(SynthesisError):
+    """A worker process died, or failed a job in an unexpected way."""
+
+    def __init__(self, message: str):
+        super().__init__(message, reason="worker_failed")
+
+
+def worker_env(index: int, size: int) -> dict[str, str]:
+    """Return the settings worker ``index`` of ``size`` runs with.
+
+    Each worker gets its share of every rate limit.
+    """
+    env = {}
+    for name, (rate, burst) in DEFAULT_LIMITS.items():
+        key = name.upper()
+        env[f"YODA_RATE_{key}"] = str(env_float(f"YODA_RATE_{key}", rate) / size)
+        env[f"YODA_RATE_BURST_{key}"] = str(
+            math.ceil(env_int(f"YODA_RATE_BURST_{key}", burst) / size)
+        )
+    # The front process keeps the pool; workers never start one of their own
+    env["YODA_WORKERS"] = "0"
+    return env
+
+
+@dataclass
+class WorkerStats:
+    """Queue depth and job counts for one worker."""
+
+    in_flight: int = 0
+    peak_in_flight: int = 0
+    completed: int = 0
+    failed: int = 0
+    busy_seconds: float = 0.0
+
+
+class Worker:
+    """One worker process and the jobs the front process is waiting on."""
+
+    def __init__(self, index: int, size: int, context):
+        self.index = index
+        self.stats = WorkerStats()
+        self._conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=worker_main,
+            args=(child_conn, worker_env(index, size)),
+            name=f"yoda-worker-{index}",
+            daemon=True,
+        )
+        self._child_conn = child_conn
+        self._jobs: dict[int, asyncio.Future] = {}
+        self._next_job = 0
+        self._send_lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self.alive = False
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self.process.start()
+        # The child has its own copy now
+        self._child_conn.close()
+        self.alive = True
+        threading.Thread(
+            target=self._read_replies, name=f"{self.process.name}-replies", daemon=True
+        ).start()
+
+    def _send(self, message: tuple) -> None:
+        with self._send_lock:
+            self._conn.send(message)
+
+    def _read_replies(self) -> None:
+        while True:
+            try:
+                reply = self._conn.recv()
+            except (EOFError, OSError):
+                break
+            self._call_soon(self._resolve, reply)
+        self._call_soon(self._died)
+
+    def _call_soon(self, callback, *args) -> None:
+        try:
+            self._loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            # The event loop has closed; nobody is waiting any more
+            pass
+
+    def _resolve(self, reply: tuple) -> None:
+        if reply[1] == "progress":
+            _, _, quote, fields = reply
+            publish(quote, JobProgress(**fields))
+            return
+        future = self._jobs.pop(reply[0], None)
+        if future is not None and not future.done():
+            future.set_result(reply[1:])
+
+    def _died(self) -> None:
+        if self.alive:
+            logger.error(f"Worker {self.index} exited")
+        self.alive = False
+        for future in self._jobs.values():
+            if not future.done():
+                future.set_exception(WorkerError(f"Worker {self.index} exited"))
+        self._jobs.clear()
+
+    async def fetch_clip(self, quote: str) -> Clip:
+        """Have the worker fetch ``quote``; see :func:`clips.fetch_clip`."""
+        job_id = self._next_job
+        self._next_job += 1
+        future = self._loop.create_future()
+        self._jobs[job_id] = future
+        stats = self.stats
+        stats.in_flight += 1
+        stats.peak_in_flight = max(stats.peak_in_flight, stats.in_flight)
+        started = time.monotonic()
+        outcome = "error"
+        try:
+            await asyncio.to_thread(self._send, ("fetch", job_id, quote))
+            kind, *payload = await future
+            outcome = kind
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            self._jobs.pop(job_id, None)
+            if self.alive:
+                await asyncio.to_thread(self._send, ("cancel", job_id))
+            raise
+        except OSError as e:
+            raise WorkerError(f"Worker {self.index} is gone: {e}") from e
+        finally:
+            stats.in_flight -= 1
+            stats.busy_seconds += time.monotonic() - started
+            if outcome == "ok":
+                stats.completed += 1
+            else:
+                stats.failed += 1
+            get_metrics().inc(
+                "yoda_worker_jobs_total", worker=str(self.index), outcome=outcome
+            )
+        return _unpack_reply(quote, kind, payload)
+
+    async def stop(self) -> None:
+        if self.alive:
+            self.alive = False
+            try:
+                await asyncio.to_thread(self._send, ("stop",))
+            except OSError:
+                pass
+        await asyncio.to_thread(self.process.join, STOP_TIMEOUT)
+        if self.process.is_alive():
+            self.process.kill()
+            await asyncio.to_thread(self.process.join)
+        self._conn.close()
+
+    def describe(self) -> dict:
+        stats = self.stats
+        jobs = stats.completed + stats.failed
+        return {
+            "pid": self.process.pid,
+            "alive": self.alive,
+            "in_flight": stats.in_flight,
+            "peak_in_flight": stats.peak_in_flight,
+            "completed": stats.completed,
+            "failed": stats.failed,
+            "mean_seconds": round(stats.busy_seconds / jobs, 3) if jobs else None,
+        }
+
+
+def _unpack_reply(quote: str, kind: str, payload: list) -> Clip:
+    """Turn a worker's reply into a clip, or raise the error it reports."""
+    if kind == "ok":
+        fields, audio = payload
+        clip = Clip(quote=quote, **fields)
+        if audio is not None:
+            clip.stream = AudioStream(audio)
+        return clip
+    if kind == "synthesis_error":
+        message, reason = payload
+        raise SynthesisError(message, reason)
+    if kind == "download_error":
+        message, synthesis = payload
+        raise ClipDownloadError(Synthesis(*synthesis), Exception(message))
+    raise WorkerError(payload[0])
+
+
+class WorkerPool:
+    """Worker processes, and which of them gets the next quote."""
+
+    def __init__(self, size: int):
+        context = multiprocessing.get_context("spawn")
+        self.workers = [Worker(index, size, context) for index in range(size)]
+        self._fetches = SingleFlight("worker")
+
+    async def start(self) -> None:
+        for worker in self.workers:
+            worker.start()
+        logger.info(f"Started {len(self.workers)} worker processes")
+
+    async def fetch_clip(self, quote: str) -> Clip:
+        """Fetch ``quote`` on the least busy worker, or join its fetch in flight.
+
+        Raises:
+            SynthesisError: if every model fails.
+            ClipDownloadError: if the audio could not be downloaded.
+            WorkerError: if no worker is left, or the worker dies.
+        """
+        return await self._fetches.do(
+            normalize_text(quote), lambda: self._dispatch(quote)
+        )
+
+    async def _dispatch(self, quote: str) -> Clip:
+        alive = [worker for worker in self.workers if worker.alive]
+        if not alive:
+            raise WorkerError("No worker processes are running")
+        worker = min(alive, key=lambda worker: worker.stats.in_flight)
+        return await worker.fetch_clip(quote)
+
+    async def stop(self) -> None:
+        await asyncio.gather(*(worker.stop() for worker in self.workers))
+
+    def stats(self) -> dict:
+        return {str(worker.index): worker.describe() for worker in self.workers}
+
+
+def worker_main(conn, env: dict[str, str]) -> None:
+    """Entry point of a worker process: serve jobs from ``conn`` until told to stop."""
+    os.environ.update(env)
+    # Stdout may be the MCP transport; nothing else may write to it
+    sys.stdout = sys.stderr
+    logging.basicConfig(
+        level=logging.WARNING,
+        format=f"%(asctime)s worker {os.getpid()} %(levelname)s %(name)s: %(message)s",
+    )
+    asyncio.run(_serve(conn))
+
+
+async def _serve(conn) -> None:
+    from clips import fetch_clip, resume_journaled_jobs
+    from fakeyou import close_http_client
+    from job_journal import get_job_journal
+
+    send_lock = threading.Lock()
+    tasks: dict[int, asyncio.Task] = {}
+
+    def send(message: tuple) -> None:
+        with send_lock:
+            conn.send(message)
+
+    def receive() -> tuple | None:
+        try:
+            return conn.recv()
+        except (EOFError, OSError):
+            return None
+
+    def forward(job_id: int, quote: str, progress: JobProgress) -> None:
+        try:
+            send((job_id, "progress", quote, progress.describe()))
+        except OSError:
+            pass
+
+    async def run(job_id: int, quote: str) -> None:
+        try:
+            with watch([quote], lambda progress: forward(job_id, quote, progress)):
+                clip = await fetch_clip(quote)
+            fields = {
+                "model_token": clip.model_token,
+                "model_name": clip.model_name,
+                "audio_url": clip.audio_url,
+                "path": clip.path,
+                "cached": clip.cached,
+                "timings": clip.timings,
+            }
+            # Uncached audio has nowhere to be read from but the reply
+            audio = clip.stream.getvalue() if clip.path is None else None
+            reply = (job_id, "ok", fields, audio)
+        except SynthesisError as e:
+            reply = (job_id, "synthesis_error", str(e), e.reason)
+        except ClipDownloadError as e:
+            s = e.synthesis
+            synthesis = (s.model_token, s.model_name, s.audio_url)
+            reply = (job_id, "download_error", str(e), synthesis)
+        except Exception as e:
+            logger.exception(f"Job for {quote!r} failed")
+            reply = (job_id, "error", f"{type(e).__name__}: {e}")
+        finally:
+            tasks.pop(job_id, None)
+        try:
+            await asyncio.to_thread(send, reply)
+        except OSError:
+            pass
+
+    resuming = asyncio.create_task(resume_journaled_jobs())
+    try:
+        while True:
+            message = await asyncio.to_thread(receive)
+            if message is None or message[0] == "stop":
+                break
+            if message[0] == "cancel":
+                task = tasks.get(message[1])
+                if task is not None:
+                    task.cancel()
+                continue
+            _, job_id, quote = message
+            tasks[job_id] = asyncio.create_task(run(job_id, quote))
+    finally:
+        # Jobs cancelled from here on stay journaled for the next start
+        journal = get_job_journal()
+        if journal is not None:
+            journal.begin_shutdown()
+        pending = [resuming, *tasks.values()]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        await close_http_client()
+
+
+_pool: WorkerPool | None = None
+
+
+def get_worker_pool() -> WorkerPool | None:
+    """Return the running worker pool, or None when quotes are fetched in-process."""
+    return _pool
+
+
+async def start_worker_pool() -> WorkerPool | None:
+    """Start ``YODA_WORKERS`` worker processes; None if it is 0 or unset."""
+    global _pool
+    size = env_int("YODA_WORKERS", 0)
+    if size <= 0 or _pool is not None:
+        return _pool
+    _pool = WorkerPool(size)
+    await _pool.start()
+    return _pool
+
+
+async def stop_worker_pool() -> None:
+    """Stop the worker processes, failing any jobs still in flight."""
+    global _pool
+    pool, _pool = _pool, None
+    if pool is not None:
+        await pool.stop()
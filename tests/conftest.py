@@ -0,0 +1,144 @@
+import json
+import os
+import sys
+
+import httpx
+import pytest
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from audio_backends import reset_audio_backends
+from audio_cache import reset_audio_cache
+from engines import reset_engines
+from job_journal import reset_job_journal
+from metrics import reset_metrics
+from model_health import reset_model_health
+from playback_queue import reset_playback_queue
+from prewarm import reset_prewarmer
+from rate_limit import reset_rate_limiters
+
+
+class FakeContext:
+    """Records what a tool sends back to the MCP client"""
+
+    def __init__(self):
+        self.messages = []
+        self.progress = []
+
+    async def info(self, message):
+        self.messages.append(json.loads(message))
+
+    async def report_progress(self, progress, total=None):
+        self.progress.append((progress, total))
+
+
+@pytest.fixture
+def make_context():
+    """Build fake MCP contexts for tools that report progress"""
+    return FakeContext
+
+
+class FakeClock:
+    """A clock that only moves when a test moves it"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    """A fake clock to hand to anything that takes a clock argument"""
+    return FakeClock()
+
+
+def _job_status(status, audio_url=None, **fields):
+    state = {"status": {"status": status, **fields}}
+    if audio_url:
+        state["maybe_result"] = {"media_links": {"cdn_url": audio_url}}
+    return httpx.Response(200, json={"success": True, "state": state})
+
+
+@pytest.fixture
+def job_status():
+    """Build FakeYou job status responses; extra fields go into the status object"""
+    return _job_status
+
+
+@pytest.fixture
+def fast_polling(monkeypatch):
+    """Poll FakeYou jobs without waiting between polls"""
+    monkeypatch.setenv("YODA_POLL_MIN_INTERVAL", "0.01")
+    monkeypatch.setenv("YODA_POLL_MAX_INTERVAL", "0.01")
+    monkeypatch.setenv("YODA_POLL_FAST_INTERVAL", "0.01")
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    """Point the audio cache at a per-test directory so tests never share clips"""
+    monkeypatch.setenv("YODA_CACHE_DIR", str(tmp_path / "cache"))
+    reset_audio_cache()
+    yield tmp_path / "cache"
+    reset_audio_cache()
+
+
+@pytest.fixture(autouse=True)
+def isolated_playback_queue():
+    """Give each test its own playback queue"""
+    reset_playback_queue()
+    yield
+    reset_playback_queue()
+
+
+@pytest.fixture(autouse=True)
+def silent_audio(monkeypatch):
+    """Discard audio so tests never open a sound device"""
+    monkeypatch.setenv("YODA_AUDIO_BACKEND", "null")
+    reset_audio_backends()
+    yield
+    reset_audio_backends()
+
+
+@pytest.fixture(autouse=True)
+def fresh_metrics():
+    """Start every test with empty metrics and model health"""
+    reset_metrics()
+    reset_model_health()
+    yield
+
+
+@pytest.fixture(autouse=True)
+def fresh_rate_limiters():
+    """Give each test full token buckets"""
+    reset_rate_limiters()
+    yield
+    reset_rate_limiters()
+
+
+@pytest.fixture(autouse=True)
+def isolated_prewarm(tmp_path, monkeypatch):
+    """Keep prewarm progress in a per-test file"""
+    monkeypatch.setenv("YODA_PREWARM_STATE", str(tmp_path / "prewarm.json"))
+    reset_prewarmer()
+    yield
+    reset_prewarmer()
+
+
+@pytest.fixture(autouse=True)
+def isolated_job_journal(tmp_path, monkeypatch):
+    """Keep the journal of submitted jobs in a per-test file"""
+    monkeypatch.setenv("YODA_JOB_JOURNAL", str(tmp_path / "jobs.json"))
+    reset_job_journal()
+    yield tmp_path / "jobs.json"
+    reset_job_journal()
+
+
+@pytest.fixture(autouse=True)
+def fresh_engines():
+    """Give each test its own TTS engines"""
+    reset_engines()
+    yield
+    reset_engines()
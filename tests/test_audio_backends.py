@@ -0,0 +1,232 @@
+import json
+import os
+import sys
+import threading
+import time
+from unittest.mock import Mock
+
+import pytest
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from audio_backends import (
+    AudioBackend,
+    AudioBackends,
+    CommandBackend,
+    FileSinkBackend,
+    PcmPipeBackend,
+    PygameBackend,
+    SimpleaudioBackend,
+)
+from audio_stream import AudioStream
+from test_audio_stream import make_wav
+from tools.audio_diagnostics import audio_diagnostics
+
+
+class FakeBackend(AudioBackend):
+    """Backend that records what it played and fails on demand"""
+
+    def __init__(self, name, available=True, fail=False):
+        super().__init__()
+        self.name = name
+        self.available = available
+        self.fail = fail
+        self.probes = 0
+        self.played = []
+
+    def probe(self):
+        self.probes += 1
+        if not self.available:
+            raise ImportError(f"No module named {self.name}")
+
+    def play_file(self, path):
+        if self.fail:
+            raise RuntimeError("no sound device")
+        self._mark_started()
+        self.played.append(path)
+
+
+class TestAudioBackends:
+    """Test backend probing, fallback and demotion"""
+
+    def test_probes_once_and_skips_unavailable(self):
+        missing, working = FakeBackend("missing", available=False), FakeBackend("ok")
+        backends = AudioBackends([missing, working])
+
+        assert backends.play("a.wav")
+        assert backends.play("b.wav")
+
+        assert (missing.probes, working.probes) == (1, 1)
+        assert working.played == ["a.wav", "b.wav"]
+        info = backends.diagnostics()
+        assert info["active"] == "ok"
+        assert info["backends"][0]["probe_error"] == "No module named missing"
+        assert info["backends"][1]["plays"] == 2
+        assert info["backends"][1]["mean_start_latency"] is not None
+
+    def test_failing_backend_is_demoted(self):
+        broken, working = FakeBackend("broken", fail=True), FakeBackend("ok")
+        backends = AudioBackends([broken, working], max_failures=2)
+
+        for clip in ("a.wav", "b.wav", "c.wav"):
+            assert backends.play(clip)
+
+        stats = backends.stats["broken"]
+        # Tried for the first two clips, then moved behind the working one
+        assert stats.failures == 2
+        assert stats.demoted
+        assert backends.diagnostics()["active"] == "ok"
+        assert working.played == ["a.wav", "b.wav", "c.wav"]
+
+    def test_reprobe_clears_demotion(self):
+        broken = FakeBackend("broken", fail=True)
+        backends = AudioBackends([broken], max_failures=1)
+        assert not backends.play("a.wav")
+        assert backends.stats["broken"].demoted
+
+        backends.probe(force=True)
+
+        assert not backends.stats["broken"].demoted
+        assert broken.probes == 2
+
+    def test_failed_download_is_not_blamed_on_backend(self):
+        backend = FakeBackend("ok")
+        backends = AudioBackends([backend])
+        stream = AudioStream()
+        stream.close(ConnectionError("reset"))
+
+        assert not backends.play(stream)
+        assert backends.stats["ok"].failures == 0
+
+    def test_from_env_ignores_unknown_names(self, monkeypatch):
+        monkeypatch.setenv("YODA_AUDIO_BACKEND", "bogus, null")
+
+        backends = AudioBackends.from_env()
+
+        assert [backend.name for backend in backends.backends] == ["null"]
+
+    def test_diagnostics_tool(self):
+        info = json.loads(audio_diagnostics()["content"][0]["text"])
+
+        assert info["probed"] is True
+        assert info["active"] == "null"
+
+
+class TestPygameBackend:
+    """Test playback through the pygame mixer"""
+
+    def test_plays_file_with_music_player(self):
+        backend = PygameBackend()
+        backend._mixer = Mock()
+        backend._mixer.music.get_busy.side_effect = [True, True, False]
+
+        backend.play("test.wav")
+
+        backend._mixer.music.load.assert_called_once_with("test.wav")
+        backend._mixer.music.play.assert_called_once()
+
+    def test_reopens_mixer_only_for_new_format(self):
+        backend = PygameBackend()
+        backend._mixer = Mock()
+        backend._mixer.get_init.return_value = (16000, -16, 1)
+        channel = backend._mixer.find_channel.return_value
+        channel.get_queue.return_value = None
+        channel.get_busy.return_value = False
+
+        backend.play(AudioStream(make_wav(frames=8000)))
+
+        backend._mixer.init.assert_not_called()
+        # Half a second of audio goes out in quarter-second buffers
+        assert backend._mixer.Sound.call_count == 2
+        channel.play.assert_called()
+
+
+class TestSimpleaudioBackend:
+    """Test playback through simpleaudio"""
+
+    def test_plays_stream_from_memory(self):
+        backend = SimpleaudioBackend()
+        backend._sa = Mock()
+        data = make_wav(frames=100)
+
+        backend.play(AudioStream(data))
+
+        backend._sa.play_buffer.assert_called_once_with(data[44:], 1, 2, 16000)
+        backend._sa.play_buffer.return_value.wait_done.assert_called_once()
+
+    def test_load_failure_raises(self):
+        backend = SimpleaudioBackend()
+        backend._sa = Mock()
+        backend._sa.WaveObject.from_wave_file.side_effect = Exception("Failed to load")
+
+        with pytest.raises(Exception):
+            backend.play("test.wav")
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Needs POSIX tools")
+class TestSystemBackends:
+    """Test the subprocess-based backends with stand-in commands"""
+
+    def test_pipe_player_stays_warm_between_clips(self):
+        backend = PcmPipeBackend("cat", lambda *args: ["cat"], {2: "s16"})
+        try:
+            backend.play(AudioStream(make_wav(frames=160)))
+            first = backend._process
+            backend.play(AudioStream(make_wav(frames=160)))
+
+            assert backend._process is first
+            assert first.poll() is None
+        finally:
+            backend.close()
+        assert first.poll() is not None
+
+    def test_pipe_player_restarts_for_new_format(self):
+        backend = PcmPipeBackend("cat", lambda *args: ["cat"], {2: "s16"})
+        try:
+            backend.play(AudioStream(make_wav(frames=160)))
+            first = backend._process
+            backend.play(AudioStream(make_wav(frames=160, channels=2)))
+
+            assert backend._process is not first
+        finally:
+            backend.close()
+
+    def test_stop_interrupts_pipe_player(self):
+        backend = PcmPipeBackend("cat", lambda *args: ["cat"], {2: "s16"})
+        # Ten seconds of audio
+        stream = AudioStream(make_wav(frames=160000))
+        threading.Timer(0.2, backend.stop).start()
+        started = time.monotonic()
+
+        backend.play(stream)
+
+        assert time.monotonic() - started < 5
+        assert backend._process is None
+
+    def test_command_player_exit_status(self):
+        assert CommandBackend("true", lambda path: ["true"]).play("a.wav") is None
+        with pytest.raises(OSError):
+            CommandBackend("false", lambda path: ["false"]).play("a.wav")
+
+    def test_command_player_removes_stream_temp_file(self):
+        seen = []
+
+        def command(path):
+            seen.append(path)
+            return ["test", "-s", path]
+
+        CommandBackend("test", command).play(AudioStream(make_wav()))
+
+        assert not os.path.exists(seen[0])
+
+
+def test_file_sink_writes_clips(tmp_path):
+    backend = FileSinkBackend(str(tmp_path / "played"))
+    backend.probe()
+    data = make_wav()
+
+    backend.play(AudioStream(data))
+
+    (played,) = (tmp_path / "played").iterdir()
+    assert played.read_bytes() == data
@@ -0,0 +1,156 @@
+import os
+import sys
+import time
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from audio_cache import AudioCache, cache_key, get_audio_cache, normalize_text
+
+MODEL_A = "weight_model_a"
+MODEL_B = "weight_model_b"
+
+
+def put(cache, text, model=MODEL_A, audio=b"RIFF-audio"):
+    return cache.put(
+        text, model, audio, model_name="Yoda (Test)", audio_url="https://cdn/x.wav"
+    )
+
+
+class TestKeys:
+    """Test quote normalization and content addressing"""
+
+    def test_normalize_collapses_whitespace(self):
+        assert normalize_text("  Do   or do not.\n") == "Do or do not."
+
+    def test_key_depends_on_model(self):
+        assert cache_key("Hello", MODEL_A) != cache_key("Hello", MODEL_B)
+
+    def test_key_ignores_whitespace_differences(self):
+        assert cache_key("Do or  do not", MODEL_A) == cache_key(
+            " Do or do not ", MODEL_A
+        )
+
+
+class TestAudioCache:
+    """Test storage, lookup and eviction"""
+
+    def test_put_then_get(self, tmp_path):
+        cache = AudioCache(str(tmp_path))
+        put(cache, "Do or do not.")
+
+        entry = cache.get("Do  or do not.", MODEL_A)
+        assert entry is not None
+        assert entry.audio_url == "https://cdn/x.wav"
+        assert entry.model_name == "Yoda (Test)"
+        with open(entry.path, "rb") as f:
+            assert f.read() == b"RIFF-audio"
+
+    def test_lookup_counts_one_hit_or_miss(self, tmp_path):
+        cache = AudioCache(str(tmp_path))
+        models = [(MODEL_A, "A"), (MODEL_B, "B")]
+        put(cache, "Hmm.", model=MODEL_B)
+
+        assert cache.lookup("Hmm.", models).model_token == MODEL_B
+        assert cache.lookup("Other.", models) is None
+
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["entries"] == 1
+
+    def test_persists_across_instances(self, tmp_path):
+        put(AudioCache(str(tmp_path)), "Patience.")
+        assert AudioCache(str(tmp_path)).get("Patience.", MODEL_A) is not None
+
+    def test_sees_clips_another_process_added(self, tmp_path):
+        reader = AudioCache(str(tmp_path))
+        assert reader.get("Patience.", MODEL_A) is None
+        put(AudioCache(str(tmp_path)), "Patience.")
+
+        assert reader.get("Patience.", MODEL_A) is not None
+        assert reader.stats()["entries"] == 1
+
+    def test_lru_eviction_over_size_limit(self, tmp_path):
+        cache = AudioCache(str(tmp_path), max_bytes=25)
+        put(cache, "one", audio=b"x" * 10)
+        put(cache, "two", audio=b"x" * 10)
+        # Touch "one" so "two" becomes least recently used
+        assert cache.get("one", MODEL_A) is not None
+        put(cache, "three", audio=b"x" * 10)
+
+        assert cache.get("one", MODEL_A) is not None
+        assert cache.get("two", MODEL_A) is None
+        assert cache.get("three", MODEL_A) is not None
+        assert cache.stats()["evictions"] == 1
+
+    def test_expired_entries_are_dropped(self, tmp_path):
+        cache = AudioCache(str(tmp_path), max_age=60)
+        put(cache, "Old, I am.")
+        cache._index[cache_key("Old, I am.", MODEL_A)][2] = time.time() - 120
+
+        assert cache.get("Old, I am.", MODEL_A) is None
+        assert not any(name.endswith(".wav") for name in os.listdir(tmp_path))
+
+    def test_missing_file_is_a_miss(self, tmp_path):
+        cache = AudioCache(str(tmp_path))
+        entry = put(cache, "Gone.")
+        os.unlink(entry.path)
+
+        assert cache.get("Gone.", MODEL_A) is None
+
+    def test_clear(self, tmp_path):
+        cache = AudioCache(str(tmp_path))
+        put(cache, "a")
+        put(cache, "b")
+        cache.clear()
+        assert cache.stats()["entries"] == 0
+
+
+def test_cache_can_be_disabled(monkeypatch):
+    monkeypatch.setenv("YODA_CACHE_ENABLED", "0")
+    assert get_audio_cache() is None
+
+
+def test_interrupted_writes_are_cleaned_up(tmp_path):
+    (tmp_path / "abc.tmp").write_bytes(b"partial")
+    stale = time.time() - 2 * 60 * 60
+    os.utime(tmp_path / "abc.tmp", (stale, stale))
+    # Another process sharing the directory is still writing this one
+    (tmp_path / "def.tmp").write_bytes(b"partial")
+
+    AudioCache(str(tmp_path))
+
+    assert not (tmp_path / "abc.tmp").exists()
+    assert (tmp_path / "def.tmp").exists()
+
+
+def test_clip_still_being_written_is_left_alone(tmp_path):
+    (tmp_path / "old.wav").write_bytes(b"RIFF")
+    stale = time.time() - 2 * 60 * 60
+    os.utime(tmp_path / "old.wav", (stale, stale))
+    # Another process has put the clip in place but not its metadata yet
+    (tmp_path / "new.wav").write_bytes(b"RIFF")
+
+    AudioCache(str(tmp_path))
+
+    assert not (tmp_path / "old.wav").exists()
+    assert (tmp_path / "new.wav").exists()
+
+
+def test_size_limit_covers_every_process(tmp_path):
+    first = AudioCache(str(tmp_path), max_bytes=25)
+    second = AudioCache(str(tmp_path), max_bytes=25)
+    put(first, "one", audio=b"x" * 10)
+    put(second, "two", audio=b"x" * 10)
+    put(first, "three", audio=b"x" * 10)
+
+    sizes = [
+        os.path.getsize(tmp_path / name)
+        for name in os.listdir(tmp_path)
+        if name.endswith(".wav")
+    ]
+    assert sum(sizes) <= 25
+    # The oldest clip went, though another process wrote it
+    assert second.get("one", MODEL_A) is None
+    assert first.get("two", MODEL_A) is not None
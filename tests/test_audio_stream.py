@@ -0,0 +1,256 @@
+import io
+import math
+import os
+import struct
+import sys
+import threading
+import wave
+
+import httpx
+import pytest
+import respx
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from audio_cache import get_audio_cache
+from audio_stream import (
+    AudioStream,
+    InvalidAudioError,
+    WavCheck,
+    convert_wav,
+    parse_wav_header,
+    wav_header,
+)
+from clips import ClipDownloadError, download_clip
+from metrics import get_metrics
+from synthesis import Synthesis
+
+
+def make_wav(frames=1000, channels=1, sample_width=2, frame_rate=16000):
+    """Build an in-memory 16-bit wav file"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(sample_width)
+        wav.setframerate(frame_rate)
+        wav.writeframes(b"\x01" * frames * channels * sample_width)
+    return buffer.getvalue()
+
+
+class TestParseWavHeader:
+    """Test incremental wav header parsing"""
+
+    def test_parses_complete_header(self):
+        fmt = parse_wav_header(make_wav(channels=2, frame_rate=22050))
+
+        assert (fmt.channels, fmt.sample_width, fmt.frame_rate) == (2, 2, 22050)
+        assert fmt.data_offset == 44
+        assert fmt.data_size == 4000
+
+    def test_needs_more_bytes(self):
+        assert parse_wav_header(make_wav()[:30]) is None
+
+    @pytest.mark.parametrize("data", [b"ID3\x03", b"<html><body>not found"])
+    def test_rejects_non_wav(self, data):
+        with pytest.raises(ValueError):
+            parse_wav_header(data)
+
+
+class TestConvertWav:
+    """Test in-memory conversion to the sampler's layout"""
+
+    def read(self, data):
+        with wave.open(io.BytesIO(data), "rb") as wav:
+            layout = (wav.getnchannels(), wav.getsampwidth(), wav.getframerate())
+            return layout, wav.readframes(wav.getnframes())
+
+    def test_downmix_and_resample(self):
+        data = make_wav(frames=44100, channels=2, frame_rate=44100)
+
+        layout, frames = self.read(convert_wav(data, 1, 2, 22050))
+
+        assert layout == (1, 2, 22050)
+        assert len(frames) // 2 == pytest.approx(22050, abs=2)
+
+    def test_resampling_filters_out_what_the_new_rate_cannot_hold(self):
+        def tone(freq, rate=44100):
+            samples = [
+                int(8000 * math.sin(2 * math.pi * freq * i / rate)) for i in range(rate)
+            ]
+            pcm = struct.pack(f"<{rate}h", *samples)
+            return wav_header(1, 2, rate, len(pcm)) + pcm
+
+        def level(data):
+            _, frames = self.read(data)
+            samples = struct.unpack(f"<{len(frames) // 2}h", frames)
+            return math.sqrt(sum(s * s for s in samples) / len(samples))
+
+        # 15 kHz is above 22050 Hz's Nyquist; unfiltered it aliases to 7050 Hz
+        assert level(convert_wav(tone(15000), 1, 2, 22050)) < 0.01 * level(tone(15000))
+        assert level(convert_wav(tone(1000), 1, 2, 22050)) == pytest.approx(
+            level(tone(1000)), rel=0.01
+        )
+
+    def test_sample_width(self):
+        data = make_wav(frames=100, sample_width=1, frame_rate=22050)
+
+        layout, frames = self.read(convert_wav(data, 1, 2, 22050))
+
+        assert layout == (1, 2, 22050)
+        assert len(frames) == 200
+
+    def test_same_layout_is_unchanged(self):
+        data = make_wav(frames=10, frame_rate=22050)
+        assert self.read(convert_wav(data, 1, 2, 22050)) == self.read(data)
+
+    def test_rejects_non_wav(self):
+        with pytest.raises(ValueError):
+            convert_wav(b"ID3 not a wav file at all", 1, 2, 22050)
+
+
+class TestWavCheck:
+    """Test validating a wav download as it arrives"""
+
+    def test_holds_back_header_until_it_parses(self):
+        data = make_wav(frames=10)
+        check = WavCheck()
+
+        assert check.feed(data[:20]) == b""
+        assert check.feed(data[20:50]) == data[:50]
+        assert check.feed(data[50:]) == data[50:]
+        check.finish()
+        assert check.format.frame_rate == 16000
+
+    @pytest.mark.parametrize(
+        "chunks, reason",
+        [
+            ([b"<!DOCTYPE html><html>"], "not_wav"),
+            ([make_wav(frames=10)[:20]], "truncated"),
+            ([make_wav(frames=10)[:-4]], "truncated"),
+            ([], "empty"),
+            ([make_wav(frames=100)[:60], b"x" * 100], "too_large"),
+        ],
+    )
+    def test_rejects(self, chunks, reason):
+        check = WavCheck(max_bytes=150)
+        with pytest.raises(InvalidAudioError) as error:
+            for chunk in chunks:
+                check.feed(chunk)
+            check.finish()
+        assert error.value.reason == reason
+
+    def test_content_length_over_limit(self):
+        check = WavCheck(max_bytes=100)
+        check.check_length("100")
+        with pytest.raises(InvalidAudioError):
+            check.check_length("101")
+
+
+class TestAudioStream:
+    """Test the growing in-memory buffer shared with the playback thread"""
+
+    def test_reader_receives_pcm_while_writing(self):
+        data = make_wav(frames=1000)
+        stream = AudioStream()
+        chunks = []
+        reader = threading.Thread(
+            target=lambda: chunks.extend(stream.iter_pcm(512)), daemon=True
+        )
+        reader.start()
+        for start in range(0, len(data), 300):
+            stream.write(data[start : start + 300])
+        stream.close()
+        reader.join(5)
+
+        assert b"".join(chunks) == data[44:]
+        assert all(len(chunk) % 2 == 0 for chunk in chunks)
+        assert stream.complete
+
+    def test_pcm_from_complete_buffer(self):
+        data = make_wav(frames=10, channels=2)
+        stream = AudioStream(data)
+
+        assert stream.pcm() == data[44:]
+        assert stream.getvalue() == data
+
+    def test_failed_download_wakes_reader(self):
+        stream = AudioStream()
+        errors = []
+
+        def read():
+            try:
+                stream.format()
+            except IOError as e:
+                errors.append(e)
+
+        reader = threading.Thread(target=read, daemon=True)
+        reader.start()
+        stream.write(b"RIFF")
+        stream.close(ConnectionError("reset"))
+        reader.join(5)
+
+        assert len(errors) == 1
+        assert not stream.complete
+
+    def test_truncated_header(self):
+        stream = AudioStream(make_wav()[:20])
+
+        with pytest.raises(ValueError):
+            stream.format()
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_download_without_cache_stays_in_memory():
+    """Test that with the cache disabled a clip never touches the disk"""
+    data = make_wav()
+    audio_url = "https://example.com/audio.wav"
+    respx.get(audio_url).mock(return_value=httpx.Response(200, content=data))
+    synthesis = Synthesis("token", "Yoda (Version 1.0)", audio_url)
+
+    clip = await download_clip("Test quote", synthesis, None)
+
+    assert clip.path is None
+    assert clip.source is clip.stream
+    assert clip.stream.complete
+    assert clip.stream.getvalue() == data
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_error_page_is_never_cached_or_played():
+    audio_url = "https://example.com/audio.wav"
+    respx.get(audio_url).mock(
+        return_value=httpx.Response(200, content=b"<html>Not found</html>" * 100)
+    )
+    synthesis = Synthesis("token", "Yoda (Version 1.0)", audio_url)
+    stream = AudioStream()
+    cache = get_audio_cache()
+
+    with pytest.raises(ClipDownloadError):
+        await download_clip("Test quote", synthesis, cache, stream=stream)
+
+    # Rejected before a byte reached the player or the cache
+    assert len(stream) == 0
+    with pytest.raises(IOError):
+        stream.getvalue()
+    assert cache.stats()["entries"] == 0
+    assert get_metrics().counter("yoda_downloads_rejected_total", reason="not_wav") == 1
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_oversized_download_is_dropped(monkeypatch):
+    monkeypatch.setenv("YODA_MAX_CLIP_BYTES", "1000")
+    audio_url = "https://example.com/audio.wav"
+    route = respx.get(audio_url).mock(
+        return_value=httpx.Response(200, content=make_wav(frames=1000))
+    )
+    synthesis = Synthesis("token", "Yoda (Version 1.0)", audio_url)
+
+    with pytest.raises(ClipDownloadError) as error:
+        await download_clip("Test quote", synthesis, None)
+
+    assert isinstance(error.value.__cause__, InvalidAudioError)
+    assert route.call_count == 1
@@ -0,0 +1,92 @@
+import asyncio
+import os
+import sys
+
+import httpx
+import pytest
+
+# Add the src and benchmarks directories to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+import bench
+from audio_stream import parse_wav_header
+from fakeyou_stub import FakeYouStub, StubConfig
+from synthesis import SynthesisError, synthesize_with_model
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    """Run the FakeYou stand-in and point the server at it"""
+    monkeypatch.setenv("YODA_POLL_MIN_INTERVAL", "0.01")
+    monkeypatch.setenv("YODA_POLL_FAST_INTERVAL", "0.01")
+    with FakeYouStub(StubConfig(queue_delay=0.05, synth_delay=0.05, seed=1)) as stub:
+        monkeypatch.setenv("YODA_FAKEYOU_API_URL", stub.url)
+        yield stub
+
+
+class TestFakeYouStub:
+    """Test the local FakeYou stand-in against the real client code"""
+
+    def test_job_walks_through_statuses(self, stub):
+        async def run():
+            return await synthesize_with_model("Hello", "token", "Yoda (Version 1.0)")
+
+        synthesis = asyncio.run(run())
+
+        assert synthesis.audio_url.startswith(stub.url)
+        assert "pending" in synthesis.timings
+        assert "started" in synthesis.timings
+        assert stub.stats.posts == 1
+        assert stub.stats.completed == 1
+
+        clip = httpx.get(synthesis.audio_url).content
+        assert parse_wav_header(clip).frame_rate == 22050
+
+    def test_failed_jobs(self, stub):
+        stub.config.fail_rate = 1.0
+
+        async def run():
+            return await synthesize_with_model("Hello", "token", "Yoda (Version 1.0)")
+
+        with pytest.raises(SynthesisError, match="Failed with"):
+            asyncio.run(run())
+
+    def test_rate_limited_post(self, stub):
+        stub.config.post_429_rate = 1.0
+
+        response = httpx.post(f"{stub.url}/tts/inference", json={})
+
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "1"
+
+
+def test_percentile():
+    assert bench.percentile([3, 1, 2, 4], 50) == 2.5
+    assert bench.percentile([1, 2, 3], 100) == 3
+    assert bench.percentile([], 99) == 0.0
+
+
+def test_bench_runs_offline(monkeypatch):
+    monkeypatch.setenv("YODA_FAKEYOU_API_URL", "")
+    monkeypatch.setenv("YODA_CACHE_ENABLED", "0")
+    monkeypatch.setenv("YODA_POLL_MIN_INTERVAL", "0.01")
+    monkeypatch.setenv("YODA_POLL_FAST_INTERVAL", "0.01")
+
+    results = bench.main(
+        [
+            "--concurrency",
+            "1,2",
+            "--requests",
+            "2",
+            "--queue-delay",
+            "0.02",
+            "--synth-delay",
+            "0.02",
+        ]  # fmt: skip
+    )
+
+    assert [row["concurrency"] for row in results] == [1, 2]
+    assert all(row["errors"] == 0 for row in results)
+    assert all(row["p50"] <= row["p99"] for row in results)
+    assert all(row["polls_per_job"] >= 1 for row in results)
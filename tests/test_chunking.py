@@ -0,0 +1,174 @@
+import io
+import json
+import os
+import struct
+import sys
+import threading
+import wave
+from unittest.mock import patch
+
+import httpx
+import pytest
+import respx
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from audio_stream import AudioStream, concat_streams
+from chunking import split_text
+from fakeyou import GET_URL, POST_URL
+from tools.quote_play import quote_play
+
+PLAY = "audio_backends.AudioBackends.play"
+
+LONG_QUOTE = (
+    "Do or do not, there is no try. "
+    "Luminous beings are we, not this crude matter. "
+    "Judge me by my size, do you? And well you should not."
+)
+
+
+def make_wav(samples, frame_rate=16000, channels=1):
+    """Build an in-memory 16-bit wav of the given samples"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(frame_rate)
+        wav.writeframes(struct.pack(f"<{len(samples)}h", *samples))
+    return buffer.getvalue()
+
+
+class TestSplitText:
+    """Test splitting long quotes at natural boundaries"""
+
+    def test_short_text_is_one_chunk(self):
+        assert split_text("  Hmm.  Yes. ", 200) == ["Hmm. Yes."]
+        assert split_text(LONG_QUOTE, 0) == [LONG_QUOTE]
+
+    def test_splits_at_sentences(self):
+        assert split_text(LONG_QUOTE, 60) == [
+            "Do or do not, there is no try.",
+            "Luminous beings are we, not this crude matter.",
+            "Judge me by my size, do you? And well you should not.",
+        ]
+
+    def test_long_sentences_split_at_phrases_then_words(self):
+        sentence = "Fear leads to anger, anger leads to hate, hate leads to suffering"
+        assert split_text(sentence, 25) == [
+            "Fear leads to anger,",
+            "anger leads to hate,",
+            "hate leads to suffering",
+        ]
+        chunks = split_text("word " * 30, 20)
+        assert all(len(chunk) <= 20 for chunk in chunks)
+        assert " ".join(chunks) == ("word " * 30).strip()
+
+
+class TestConcatStreams:
+    """Test joining wav streams into one gapless stream"""
+
+    def test_joins_pcm_in_order(self):
+        parts = [AudioStream(make_wav([1, 2, 3])), AudioStream(make_wav([4, 5]))]
+        out = AudioStream()
+
+        concat_streams(parts, out)
+
+        assert out.format().data_size is None
+        assert out.pcm() == struct.pack("<5h", 1, 2, 3, 4, 5)
+
+    def test_waits_for_parts_still_downloading(self):
+        second = AudioStream()
+        out = AudioStream()
+        parts = [AudioStream(make_wav([1])), second]
+        joiner = threading.Thread(target=concat_streams, args=(parts, out))
+        joiner.start()
+
+        second.write(make_wav([2, 3]))
+        second.close()
+        joiner.join(5)
+
+        assert out.pcm() == struct.pack("<3h", 1, 2, 3)
+
+    def test_converts_other_formats_and_skips_failures(self):
+        failed = AudioStream()
+        failed.close(IOError("gone"))
+        parts = [
+            AudioStream(make_wav([100] * 10, frame_rate=8000)),
+            failed,
+            AudioStream(make_wav([200] * 40, frame_rate=16000, channels=2)),
+        ]
+        out = AudioStream()
+
+        concat_streams(parts, out)
+
+        fmt = out.format()
+        assert (fmt.channels, fmt.frame_rate) == (1, 8000)
+        # 10 frames as they were, plus 20 stereo 16 kHz frames as 10 mono 8 kHz ones
+        assert len(out.pcm()) // 2 == pytest.approx(20, abs=1)
+
+    def test_fails_when_every_part_failed(self):
+        failed = AudioStream()
+        failed.close(IOError("gone"))
+        out = AudioStream()
+
+        concat_streams([failed], out)
+
+        with pytest.raises(IOError):
+            out.getvalue()
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_long_quote_is_spoken_in_chunks(monkeypatch):
+    monkeypatch.setenv("YODA_CHUNK_CHARS", "60")
+    monkeypatch.setenv("YODA_PLAYBACK_WAIT", "1")
+    monkeypatch.setenv("YODA_POLL_MIN_INTERVAL", "0")
+    monkeypatch.setenv("YODA_POLL_MAX_INTERVAL", "0")
+    texts = []
+
+    def submit(request):
+        texts.append(json.loads(request.content)["inference_text"])
+        job = f"job{len(texts)}"
+        return httpx.Response(200, json={"success": True, "inference_job_token": job})
+
+    def status(request, job):
+        done = {"status": {"status": "complete_success"}}
+        done["maybe_result"] = {
+            "media_links": {"cdn_url": f"https://cdn.example.com/{job}.wav"}
+        }
+        return httpx.Response(200, json={"success": True, "state": done})
+
+    def audio(request, job):
+        # Each chunk's samples are its job number, to check the order
+        return httpx.Response(200, content=make_wav([int(job[3:])] * 4))
+
+    respx.post(POST_URL).mock(side_effect=submit)
+    respx.get(url__regex=rf"{GET_URL}(?P<job>\w+)").mock(side_effect=status)
+    respx.get(url__regex=r"https://cdn.example.com/(?P<job>\w+)\.wav").mock(
+        side_effect=audio
+    )
+
+    with patch(PLAY, return_value=True) as mock_play:
+        result = await quote_play(LONG_QUOTE)
+
+    assert not result.get("isError")
+    assert sorted(texts) == sorted(split_text(LONG_QUOTE, 60))
+    assert result["content"][0]["text"].count("https://cdn.example.com/") == 3
+    # One clip, the chunks joined in quote order
+    (stream,) = mock_play.call_args.args
+    samples = struct.unpack(f"<{len(stream.pcm()) // 2}h", stream.pcm())
+    by_chunk = [texts.index(text) + 1 for text in split_text(LONG_QUOTE, 60)]
+    assert list(samples) == [job for job in by_chunk for _ in range(4)]
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_failed_chunks_are_reported(monkeypatch):
+    monkeypatch.setenv("YODA_CHUNK_CHARS", "60")
+    respx.post(POST_URL).mock(return_value=httpx.Response(500))
+
+    result = await quote_play(LONG_QUOTE)
+
+    assert result["isError"] is True
+    assert "Failed, all voice models have" in result["content"][0]["text"]
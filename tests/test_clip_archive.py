@@ -0,0 +1,100 @@
+import io
+import math
+import os
+import struct
+import sys
+import wave
+
+import pytest
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from clip_archive import LOSSLESS_CODECS, ClipArchive
+
+
+def tone(frames=2205, channels=1):
+    samples = [
+        int(8000 * math.sin(2 * math.pi * 440 * i / 22050))
+        for i in range(frames)
+        for _ in range(channels)
+    ]
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(22050)
+        wav.writeframes(struct.pack(f"<{len(samples)}h", *samples))
+    return buffer.getvalue()
+
+
+def samples_of(wav):
+    with wave.open(io.BytesIO(wav), "rb") as f:
+        frames = f.readframes(f.getnframes())
+        layout = (f.getnchannels(), f.getsampwidth(), f.getframerate())
+    return layout, struct.unpack(f"<{len(frames) // 2}h", frames)
+
+
+@pytest.mark.parametrize("codec", LOSSLESS_CODECS)
+def test_lossless_codecs_round_trip(tmp_path, codec):
+    archive = ClipArchive(str(tmp_path), codec=codec)
+    wav = tone()
+    clip = archive.add(7, "Do or do not.", wav)
+    assert archive.read(7) == wav
+    if codec != "none":
+        assert clip.length < len(wav)
+
+
+@pytest.mark.parametrize("codec,ratio", [("ulaw", 0.5), ("adpcm", 0.25)])
+def test_lossy_codecs(tmp_path, codec, ratio):
+    archive = ClipArchive(str(tmp_path), codec=codec)
+    wav = tone(frames=2205)
+    clip = archive.add(1, "Hmm.", wav)
+    assert clip.length < len(wav) * ratio + 32
+
+    layout, decoded = samples_of(archive.read(1))
+    _, original = samples_of(wav)
+    assert layout == (1, 2, 22050)
+    assert len(decoded) == len(original)
+    # ADPCM takes a few samples to adapt, so compare the average error
+    error = sum(abs(a - b) for a, b in zip(decoded, original)) / len(original)
+    assert error < 200
+
+
+def test_lossy_codecs_refuse_what_they_cannot_store(tmp_path):
+    archive = ClipArchive(str(tmp_path), codec="adpcm")
+    with pytest.raises(ValueError):
+        archive.add(1, "Hmm.", tone(channels=2))
+    # Another codec can be picked per clip
+    archive.add(1, "Hmm.", tone(channels=2), codec="ulaw")
+    assert samples_of(archive.read(1))[0] == (2, 2, 22050)
+
+
+def test_random_access_by_id_and_text(tmp_path):
+    archive = ClipArchive(str(tmp_path), segment_bytes=10_000)
+    wavs = {n: tone(frames=1000 + n) for n in range(1, 11)}
+    for n, wav in wavs.items():
+        archive.add(n, f"Line  {n}", wav, codec="none")
+
+    # Clips roll over into new segments rather than growing one past its size
+    assert archive.stats()["segments"] > 1
+    assert archive.stats()["clips"] == 10
+    for n in (3, 10, 1):
+        assert archive.read(n) == wavs[n]
+    # Text is matched after normalizing whitespace
+    assert archive.read_text("Line 4") == wavs[4]
+    assert archive.read_text("Line 11") is None
+    assert archive.read(11) is None
+    assert 5 in archive and 11 not in archive
+
+
+def test_reads_clips_appended_by_another_writer(tmp_path):
+    reader = ClipArchive(str(tmp_path))
+    writer = ClipArchive(str(tmp_path))
+    writer.add(1, "Do or do not.", tone(frames=100))
+    assert reader.read(1) == tone(frames=100)
+    # The segment grew after the reader mapped it
+    writer.add(2, "There is no try.", tone(frames=200))
+    assert reader.read(2) == tone(frames=200)
+    writer.close()
+    reader.close()
@@ -0,0 +1,138 @@
+import io
+import os
+import shlex
+import sys
+
+import httpx
+import pytest
+import respx
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from audio_cache import get_audio_cache
+from audio_stream import parse_wav_header
+from engines import LocalEngine, get_engine
+from fakeyou import GET_URL, POST_URL
+from metrics import get_metrics
+from synthesis import SynthesisError, synthesize, synthesize_with_model
+from tools.quote_play import quote_play
+
+# Writes a short wav of its first argument's length to stdout
+FAKE_TTS = """
+import struct, sys, wave
+with wave.open(sys.stdout.buffer, "wb") as wav:
+    wav.setnchannels(1)
+    wav.setsampwidth(2)
+    wav.setframerate(16000)
+    wav.writeframes(struct.pack("<h", 1) * len(sys.argv[1]))
+"""
+
+
+@pytest.fixture
+def local_tts(tmp_path, monkeypatch):
+    """Use a Python script as the local TTS program"""
+    script = tmp_path / "fake_tts.py"
+    script.write_text(FAKE_TTS)
+    command = f"{shlex.quote(sys.executable)} {shlex.quote(str(script))} {{text}}"
+    monkeypatch.setenv("YODA_LOCAL_TTS", command)
+    monkeypatch.setenv("YODA_POLL_MIN_INTERVAL", "0.01")
+    monkeypatch.setenv("YODA_POLL_MAX_INTERVAL", "0.01")
+
+
+def queue_forever():
+    """FakeYou accepts every job and never gets to it"""
+    respx.post(POST_URL).mock(
+        return_value=httpx.Response(
+            200, json={"success": True, "inference_job_token": "job"}
+        )
+    )
+    respx.get(f"{GET_URL}job").mock(
+        return_value=httpx.Response(
+            200, json={"success": True, "state": {"status": {"status": "pending"}}}
+        )
+    )
+
+
+@pytest.mark.asyncio
+async def test_local_engine_job(local_tts):
+    engine = get_engine("local")
+    assert engine.available()
+    ((model_token, model_name),) = engine.models()
+
+    synthesis = await synthesize_with_model(
+        "Hmm.", model_token, model_name, engine="local"
+    )
+
+    assert synthesis.engine == "local"
+    assert model_name == f"Local voice ({os.path.basename(sys.executable)})"
+    audio = io.BytesIO()
+    await engine.fetch(synthesis.audio_url, audio)
+    assert parse_wav_header(audio.getvalue()).frame_rate == 16000
+
+
+@pytest.mark.asyncio
+async def test_local_engine_failure(tmp_path, monkeypatch):
+    monkeypatch.setenv("YODA_LOCAL_TTS", f"{shlex.quote(sys.executable)} -c 'exit(3)'")
+    monkeypatch.setenv("YODA_POLL_MIN_INTERVAL", "0.01")
+
+    with pytest.raises(SynthesisError) as error:
+        await synthesize_with_model("Hmm.", "local", "Local voice", engine="local")
+    assert error.value.reason == "failed"
+
+
+@pytest.mark.asyncio
+async def test_timed_out_local_job_is_stopped(monkeypatch):
+    sleep = f"{shlex.quote(sys.executable)} -c 'import time; time.sleep(30)'"
+    monkeypatch.setenv("YODA_LOCAL_TTS", sleep)
+    monkeypatch.setenv("YODA_POLL_MIN_INTERVAL", "0.01")
+    monkeypatch.setenv("YODA_POLL_FAST_INTERVAL", "0.01")
+    monkeypatch.setenv("YODA_POLL_TIMEOUT", "0.2")
+
+    with pytest.raises(SynthesisError) as error:
+        await synthesize_with_model("Hmm.", "local", "Local voice", engine="local")
+
+    assert error.value.reason == "timeout"
+    assert get_engine("local")._processes == {}
+
+
+def test_local_engine_unavailable(monkeypatch):
+    monkeypatch.setenv("YODA_LOCAL_TTS", "no-such-tts-program {text}")
+    assert not LocalEngine().available()
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_slow_fakeyou_falls_back_to_local_voice(local_tts, monkeypatch):
+    monkeypatch.setenv("YODA_LOCAL_FALLBACK_AFTER", "0.1")
+    monkeypatch.setenv("YODA_PLAYBACK_WAIT", "1")
+    queue_forever()
+
+    result = await quote_play("Do or do not.")
+
+    assert not result.get("isError")
+    assert "Local voice" in result["content"][0]["text"]
+    # The stand-in voice is not cached, so FakeYou is tried again next time
+    assert get_audio_cache().stats()["entries"] == 0
+    assert get_metrics().counter("yoda_local_fallbacks_total", reason="slow") == 1
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_failed_fakeyou_falls_back_at_once(local_tts, monkeypatch):
+    monkeypatch.setenv("YODA_LOCAL_FALLBACK_AFTER", "60")
+    respx.post(POST_URL).mock(return_value=httpx.Response(500))
+
+    synthesis = await synthesize("Do or do not.")
+
+    assert synthesis.engine == "local"
+    assert get_metrics().counter("yoda_local_fallbacks_total", reason="failed") == 1
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_no_fallback_unless_configured(local_tts):
+    respx.post(POST_URL).mock(return_value=httpx.Response(500))
+
+    with pytest.raises(SynthesisError):
+        await synthesize("Do or do not.")
@@ -0,0 +1,176 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+
+import httpx
+import pytest
+import respx
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from audio_cache import get_audio_cache
+from audio_stream import wav_header
+from clips import resume_journaled_jobs
+from fakeyou import GET_URL, POST_URL, YODA_MODELS
+from job_journal import JobJournal, get_job_journal
+from metrics import get_metrics
+from synthesis import synthesize_with_model
+
+# A tiny but valid wav clip
+AUDIO = wav_header(1, 2, 16000, 4) + b"\x00" * 4
+MODEL_TOKEN, MODEL_NAME = YODA_MODELS[0]
+
+
+pytestmark = pytest.mark.usefixtures("fast_polling")
+
+
+@pytest.mark.asyncio
+async def test_journal_persists(isolated_job_journal):
+    journal = JobJournal(str(isolated_job_journal))
+    await journal.add("job1", "Do or do not.", MODEL_TOKEN, MODEL_NAME)
+    await journal.add("job2", "There is no try.", MODEL_TOKEN, MODEL_NAME)
+    await journal.remove("job1")
+
+    reloaded = JobJournal(str(isolated_job_journal))
+    assert [entry.job_token for entry in reloaded.entries()] == ["job2"]
+    assert reloaded.entries()[0].quote == "There is no try."
+
+
+@pytest.mark.asyncio
+async def test_journal_is_written_off_the_event_loop(isolated_job_journal, monkeypatch):
+    writers = []
+
+    def replace(src, dst):
+        writers.append(threading.current_thread())
+        os.rename(src, dst)
+
+    monkeypatch.setattr("job_journal.os.replace", replace)
+    journal = JobJournal(str(isolated_job_journal))
+    tokens = [f"job{n}" for n in range(20)]
+    await asyncio.gather(
+        *(journal.add(token, "Hmm.", MODEL_TOKEN, MODEL_NAME) for token in tokens)
+    )
+
+    assert writers and threading.main_thread() not in writers
+    # Adds made while a save was under way are written together
+    assert len(writers) < len(tokens)
+    saved = json.loads(isolated_job_journal.read_text())
+    assert sorted(job["job_token"] for job in saved["jobs"]) == sorted(tokens)
+
+
+@pytest.mark.asyncio
+async def test_processes_keep_separate_journals(isolated_job_journal):
+    first = JobJournal(str(isolated_job_journal), pid=1)
+    second = JobJournal(str(isolated_job_journal), pid=2)
+
+    await first.add("job1", "Do or do not.", MODEL_TOKEN, MODEL_NAME)
+    await second.add("job2", "There is no try.", MODEL_TOKEN, MODEL_NAME)
+
+    assert first.path != second.path
+    assert [job.job_token for job in JobJournal(first.path).entries()] == ["job1"]
+    assert [job.job_token for job in JobJournal(second.path).entries()] == ["job2"]
+
+
+@pytest.mark.asyncio
+async def test_only_stopped_servers_journals_are_adopted(isolated_job_journal):
+    running = JobJournal(str(isolated_job_journal), pid=1)
+    stopped = JobJournal(str(isolated_job_journal), pid=2)
+    await running.add("polled", "Do or do not.", MODEL_TOKEN, MODEL_NAME)
+    await stopped.add("left", "There is no try.", MODEL_TOKEN, MODEL_NAME)
+    stopped.close()
+    journal = get_job_journal()
+
+    assert await asyncio.to_thread(journal.adopt_orphans) == 1
+
+    assert [job.job_token for job in journal.entries()] == ["left"]
+    assert not os.path.exists(stopped.path)
+    assert [job.job_token for job in JobJournal(running.path).entries()] == ["polled"]
+    running.close()
+
+
+def test_no_journal_without_cache(monkeypatch):
+    monkeypatch.setenv("YODA_CACHE_ENABLED", "0")
+    assert get_job_journal() is None
+
+
+def test_journal_can_be_turned_off(monkeypatch):
+    # As `sampler.py build` does
+    monkeypatch.setenv("YODA_JOB_JOURNAL_ENABLED", "0")
+    assert get_job_journal() is None
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_job_is_journaled_while_polled(isolated_job_journal, job_status):
+    respx.post(POST_URL).mock(
+        return_value=httpx.Response(
+            200, json={"success": True, "inference_job_token": "job1"}
+        )
+    )
+    respx.get(f"{GET_URL}job1").mock(return_value=job_status("pending"))
+
+    task = asyncio.create_task(
+        synthesize_with_model("Do or do not.", MODEL_TOKEN, MODEL_NAME)
+    )
+    path = get_job_journal().path
+    for _ in range(100):
+        await asyncio.sleep(0.01)
+        if os.path.exists(path):
+            break
+    # As when the server shuts down mid-request
+    get_job_journal().begin_shutdown()
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+    with open(path) as f:
+        saved = json.load(f)
+    assert [job["job_token"] for job in saved["jobs"]] == ["job1"]
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_finished_jobs_leave_the_journal(job_status):
+    respx.post(POST_URL).mock(
+        return_value=httpx.Response(
+            200, json={"success": True, "inference_job_token": "job1"}
+        )
+    )
+    respx.get(f"{GET_URL}job1").mock(
+        return_value=job_status("complete_success", "https://cdn.example.com/1.wav")
+    )
+
+    await synthesize_with_model("Do or do not.", MODEL_TOKEN, MODEL_NAME)
+
+    assert get_job_journal().entries() == []
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_resume_puts_journaled_jobs_in_cache(job_status):
+    journal = get_job_journal()
+    await journal.add("done", "Do or do not.", MODEL_TOKEN, MODEL_NAME)
+    await journal.add("lost", "There is no try.", MODEL_TOKEN, MODEL_NAME)
+    await journal.add("old", "Hmm.", MODEL_TOKEN, MODEL_NAME)
+    journal.entries()[-1].submitted_at = time.time() - 2 * 60 * 60
+    post = respx.post(POST_URL)
+    respx.get(f"{GET_URL}done").mock(
+        return_value=job_status("complete_success", "https://cdn.example.com/1.wav")
+    )
+    respx.get(f"{GET_URL}lost").mock(return_value=httpx.Response(404))
+    respx.get("https://cdn.example.com/1.wav").mock(
+        return_value=httpx.Response(200, content=AUDIO)
+    )
+
+    assert await resume_journaled_jobs() == 1
+
+    # Resumed without submitting anything again
+    assert post.call_count == 0
+    assert get_audio_cache().get("Do or do not.", MODEL_TOKEN) is not None
+    assert get_job_journal().entries() == []
+    metrics = get_metrics()
+    assert metrics.counter("yoda_jobs_resumed_total", outcome="success") == 1
+    assert metrics.counter("yoda_jobs_resumed_total", outcome="expired") == 1
@@ -0,0 +1,118 @@
+import asyncio
+import os
+import sys
+
+import httpx
+import pytest
+import respx
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from audio_stream import wav_header
+from fakeyou import GET_URL, POST_URL
+from job_journal import get_job_journal
+from tools.quote_play import quote_play
+
+AUDIO = wav_header(1, 2, 16000, 4) + b"\x00" * 4
+AUDIO_URL = "https://cdn.example.com/a.wav"
+
+
+pytestmark = pytest.mark.usefixtures("fast_polling")
+
+
+def accept_jobs():
+    return respx.post(POST_URL).mock(
+        return_value=httpx.Response(
+            200, json={"success": True, "inference_job_token": "job"}
+        )
+    )
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_progress_follows_the_job(make_context, job_status):
+    accept_jobs()
+    respx.get(f"{GET_URL}job").mock(
+        side_effect=[
+            job_status("pending", maybe_queue_position=7),
+            job_status("pending", maybe_queue_position=3),
+            job_status("started", attempt_count=1),
+            job_status("complete_success", AUDIO_URL, attempt_count=1),
+        ]
+    )
+    respx.get(AUDIO_URL).mock(return_value=httpx.Response(200, content=AUDIO))
+    ctx = make_context()
+
+    result = await quote_play("Do or do not.", ctx)
+
+    assert not result.get("isError")
+    assert ctx.progress == [(1, 4), (2, 4), (3, 4), (4, 4)]
+    stages = [(m["stage"], m.get("queue_position")) for m in ctx.messages]
+    assert stages == [
+        ("queued", None),
+        ("queued", 7),
+        ("queued", 3),
+        ("started", None),
+        ("downloading", None),
+        ("playing", None),
+    ]
+    assert ctx.messages[3]["attempt_count"] == 1
+    assert ctx.messages[-1]["playback_position"] == 0
+    assert all("model_name" in message for message in ctx.messages)
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_a_caller_sharing_the_job_hears_its_progress(make_context, job_status):
+    post = accept_jobs()
+    respx.get(f"{GET_URL}job").mock(
+        side_effect=[job_status("pending")] * 5
+        + [job_status("complete_success", AUDIO_URL, attempt_count=1)]
+    )
+    respx.get(AUDIO_URL).mock(return_value=httpx.Response(200, content=AUDIO))
+    first, second = make_context(), make_context()
+
+    first_play = asyncio.create_task(quote_play("Hmm.", first))
+    await asyncio.sleep(0.02)
+    await asyncio.gather(first_play, quote_play("Hmm.", second))
+
+    assert post.call_count == 1
+    assert second.progress[-2:] == [(3, 4), (4, 4)]
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_cached_quote_goes_straight_to_playing(make_context, job_status):
+    accept_jobs()
+    respx.get(f"{GET_URL}job").mock(
+        return_value=job_status("complete_success", AUDIO_URL, attempt_count=1)
+    )
+    respx.get(AUDIO_URL).mock(return_value=httpx.Response(200, content=AUDIO))
+    await quote_play("Patience.")
+    ctx = make_context()
+
+    await quote_play("Patience.", ctx)
+
+    assert ctx.progress == [(4, 4)]
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_cancelled_call_stops_polling(make_context, job_status):
+    accept_jobs()
+    polls = respx.get(f"{GET_URL}job").mock(return_value=job_status("pending"))
+    ctx = make_context()
+
+    play = asyncio.create_task(quote_play("Wait, I will not.", ctx))
+    while polls.call_count < 2:
+        await asyncio.sleep(0.01)
+    play.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await play
+    polled = polls.call_count
+    await asyncio.sleep(0.1)
+
+    assert polls.call_count == polled
+    # Nobody wants the clip any more, so it is not resumed either
+    assert get_job_journal().entries() == []
@@ -0,0 +1,114 @@
+import json
+import os
+import sys
+
+import httpx
+import pytest
+import respx
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from audio_stream import wav_header
+from fakeyou import GET_URL, POST_URL
+from metrics import Metrics, get_metrics
+from tools.quote_play import quote_play
+from tools.server_stats import server_stats
+
+# A tiny but valid wav clip
+AUDIO = wav_header(1, 2, 16000, 4) + b"\x00" * 4
+
+
+class TestMetrics:
+    """Test counters, histograms and spans"""
+
+    def test_span_feeds_histograms_and_counters(self):
+        metrics = Metrics()
+        span = metrics.span("quote_play", model="Yoda")
+        span.record("post", 0.2)
+        span.record_all({"pending": 1.5, "total": 9.0})
+        span.finish("synthesized")
+        span.finish("failed")
+
+        snapshot = metrics.snapshot()
+        phases = snapshot["latency"]["yoda_phase_seconds"]
+        assert set(phases) == {'{phase="post"}', '{phase="pending"}'}
+        assert phases['{phase="pending"}']["p50"] == 1.5
+        requests = snapshot["counters"]["yoda_requests_total"]
+        assert requests == {'{outcome="synthesized",tool="quote_play"}': 1}
+        assert snapshot["recent"][0]["model"] == "Yoda"
+
+    def test_prometheus_text(self):
+        metrics = Metrics()
+        metrics.inc("yoda_rate_limited_total", endpoint="poll")
+        metrics.inc("yoda_jobs_total", model='Yoda "1"', outcome="success")
+        for seconds in (0.02, 0.3, 100):
+            metrics.observe("yoda_job_seconds", seconds, model="v1")
+
+        text = metrics.prometheus()
+
+        assert "# TYPE yoda_rate_limited_total counter" in text
+        assert 'yoda_rate_limited_total{endpoint="poll"} 1' in text
+        assert 'model="Yoda \\"1\\""' in text
+        assert "# TYPE yoda_job_seconds histogram" in text
+        assert 'yoda_job_seconds_bucket{model="v1",le="0.05"} 1' in text
+        assert 'yoda_job_seconds_bucket{model="v1",le="0.5"} 2' in text
+        assert 'yoda_job_seconds_bucket{model="v1",le="+Inf"} 3' in text
+        assert 'yoda_job_seconds_count{model="v1"} 3' in text
+        assert "yoda_cache_misses_total 0" in text
+
+    def test_metrics_file(self, tmp_path, monkeypatch):
+        path = tmp_path / "yoda.prom"
+        monkeypatch.setenv("YODA_METRICS_FILE", str(path))
+        metrics = Metrics()
+
+        metrics.span("quote_play").finish("cached")
+
+        assert 'yoda_requests_total{outcome="cached"' in path.read_text()
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_quote_play_records_phases_and_counters(monkeypatch):
+    monkeypatch.setenv("YODA_POLL_MIN_INTERVAL", "0")
+    monkeypatch.setenv("YODA_POLL_MAX_INTERVAL", "0")
+    audio_url = "https://example.com/audio.wav"
+    respx.post(POST_URL).mock(
+        return_value=httpx.Response(
+            200, json={"success": True, "inference_job_token": "job"}
+        )
+    )
+    done = {"status": {"status": "complete_success"}}
+    done["maybe_result"] = {"media_links": {"cdn_url": audio_url}}
+    respx.get(f"{GET_URL}job").mock(
+        side_effect=[
+            httpx.Response(429, headers={"Retry-After": "0"}),
+            httpx.Response(200, json={"success": True, "state": done}),
+        ]
+    )
+    respx.get(audio_url).mock(return_value=httpx.Response(200, content=AUDIO))
+
+    await quote_play("Test quote")
+    await quote_play("Test quote")
+
+    metrics = get_metrics()
+    assert metrics.counter("yoda_rate_limited_total", endpoint="poll") == 1
+    assert metrics.counter("yoda_polls_total", model="Yoda (Version 1.0)") == 2
+    assert (
+        metrics.counter(
+            "yoda_jobs_total", model="Yoda (Version 1.0)", outcome="success"
+        )
+        == 1
+    )
+    stats = json.loads(server_stats()["content"][0]["text"])
+    first, second = stats["recent"]
+    assert first["outcome"] == "synthesized"
+    assert {"cache_lookup", "post", "complete_success", "download"} <= set(
+        first["phases"]
+    )
+    assert second["outcome"] == "cached"
+    assert "yoda_cache_hits_total 1" in server_stats("prometheus")["content"][0]["text"]
+
+
+def test_unknown_format():
+    assert server_stats("xml")["isError"] is True
@@ -0,0 +1,197 @@
+import asyncio
+import json
+import os
+import sys
+
+import httpx
+import pytest
+import respx
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from fakeyou import GET_URL, POST_URL, YODA_MODELS
+from model_health import ModelHealthTracker, get_model_health
+from synthesis import synthesize
+from tools.server_stats import server_stats
+
+V1, V2 = YODA_MODELS
+
+
+@pytest.fixture
+def tracker(clock):
+    return ModelHealthTracker(failures=3, cooldown=30.0, clock=clock)
+
+
+def fail(tracker, model, times=1, reason="timeout"):
+    for _ in range(times):
+        tracker.record(*model, reason)
+
+
+class TestModelHealthTracker:
+    """Test rolling health stats and the circuit breaker"""
+
+    def test_orders_by_expected_latency(self, tracker):
+        assert tracker.order(YODA_MODELS) == [V1, V2]
+        tracker.record(*V1, "success", 10.0)
+        tracker.record(*V2, "success", 4.0)
+        assert tracker.order(YODA_MODELS) == [V2, V1]
+
+        # Failures count against a model's expected latency
+        fail(tracker, V2, 2)
+        assert tracker.order(YODA_MODELS) == [V1, V2]
+
+    def test_unmeasured_models_are_probed(self, tracker):
+        tracker.record(*V1, "success", 4.0)
+        # V2 has never run, so the next request measures it
+        assert tracker.order(YODA_MODELS) == [V2, V1]
+        tracker.started(*V2)
+        # Only one request probes at a time
+        assert tracker.order(YODA_MODELS) == [V1, V2]
+
+        tracker.record(*V2, "success", 20.0)
+        assert tracker.order(YODA_MODELS) == [V1, V2]
+
+    def test_models_are_probed_again_after_the_interval(self, clock):
+        tracker = ModelHealthTracker(probe_interval=100.0, clock=clock)
+        tracker.record(*V1, "success", 4.0)
+        tracker.record(*V2, "success", 20.0)
+        assert tracker.order(YODA_MODELS) == [V1, V2]
+
+        clock.now = 90.0
+        tracker.record(*V1, "success", 4.0)
+        clock.now = 101.0
+        # V2 has not run in 100 s; its old latency may be out of date
+        assert tracker.order(YODA_MODELS) == [V2, V1]
+        tracker.started(*V2)
+        tracker.record(*V2, "success", 20.0)
+        assert tracker.order(YODA_MODELS) == [V1, V2]
+
+    def test_breaker_opens_and_probes_after_cooldown(self, tracker, clock):
+        fail(tracker, V1, 3)
+        assert tracker.stats()[V1[1]]["state"] == "open"
+        assert tracker.order(YODA_MODELS) == [V2, V1]
+
+        clock.now = 31.0
+        # Half-open: the next request probes it first, and only that one
+        assert tracker.order(YODA_MODELS) == [V1, V2]
+        tracker.started(*V1)
+        assert tracker.order(YODA_MODELS) == [V2, V1]
+
+        # A failed probe opens it for another cooldown
+        fail(tracker, V1)
+        clock.now = 40.0
+        assert tracker.stats()[V1[1]]["state"] == "open"
+
+        clock.now = 62.0
+        tracker.started(*V1)
+        tracker.record(*V1, "success", 1.0)
+        assert tracker.stats()[V1[1]]["state"] == "closed"
+        assert tracker.stats()[V1[1]]["consecutive_failures"] == 0
+
+    def test_rate_limits_and_cancellations_are_ignored(self, tracker):
+        fail(tracker, V1, 3, reason="rate_limited")
+        fail(tracker, V1, 3, reason="cancelled")
+        stats = tracker.stats()[V1[1]]
+        assert (stats["state"], stats["jobs"]) == ("closed", 0)
+
+    def test_stats(self, tracker):
+        tracker.record(*V1, "success", 4.0, {"pending": 3.0, "started": 1.0})
+        tracker.record(*V1, "success", 6.0, {"pending": 5.0})
+        fail(tracker, V1, reason="stuck")
+        stats = tracker.stats()[V1[1]]
+        assert stats["success_rate"] == pytest.approx(0.667, abs=0.001)
+        assert stats["median_seconds"] == 5.0
+        assert stats["median_queue_seconds"] == 4.0
+        assert stats["last_error"] == "stuck"
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_failing_model_is_not_tried_first(monkeypatch):
+    monkeypatch.setenv("YODA_POLL_MIN_INTERVAL", "0")
+    monkeypatch.setenv("YODA_POLL_MAX_INTERVAL", "0")
+    submitted = []
+
+    def submit(request):
+        model_token = json.loads(request.content)["tts_model_token"]
+        submitted.append(model_token)
+        if model_token == V1[0]:
+            return httpx.Response(500)
+        return httpx.Response(200, json={"success": True, "inference_job_token": "job"})
+
+    respx.post(POST_URL).mock(side_effect=submit)
+    done = {"status": {"status": "complete_success"}}
+    done["maybe_result"] = {"media_links": {"cdn_url": "https://cdn.example.com/a"}}
+    respx.get(f"{GET_URL}job").mock(
+        return_value=httpx.Response(200, json={"success": True, "state": done})
+    )
+
+    assert (await synthesize("Hmm.")).model_token == V2[0]
+    assert submitted == [V1[0], V2[0]]
+
+    # From then on the working model is tried first
+    submitted.clear()
+    for _ in range(3):
+        assert (await synthesize("Hmm.")).model_token == V2[0]
+    assert submitted == [V2[0]] * 3
+
+    stats = json.loads(server_stats()["content"][0]["text"])["models"]
+    assert stats[V1[1]]["success_rate"] == 0.0
+    assert stats[V2[1]]["success_rate"] == 1.0
+    assert get_model_health().order(YODA_MODELS) == [V2, V1]
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_second_model_is_measured_while_the_first_succeeds(monkeypatch):
+    monkeypatch.setenv("YODA_POLL_MIN_INTERVAL", "0")
+    monkeypatch.setenv("YODA_POLL_MAX_INTERVAL", "0")
+    submitted = []
+
+    def submit(request):
+        submitted.append(json.loads(request.content)["tts_model_token"])
+        return httpx.Response(200, json={"success": True, "inference_job_token": "job"})
+
+    respx.post(POST_URL).mock(side_effect=submit)
+    done = {"status": {"status": "complete_success"}}
+    done["maybe_result"] = {"media_links": {"cdn_url": "https://cdn.example.com/a"}}
+    respx.get(f"{GET_URL}job").mock(
+        return_value=httpx.Response(200, json={"success": True, "state": done})
+    )
+
+    for quote in ("Hmm.", "Patience.", "Do or do not."):
+        await synthesize(quote)
+
+    # Each model ran once before either was preferred
+    assert submitted[:2] == [V1[0], V2[0]]
+    stats = get_model_health().stats()
+    assert stats[V1[1]]["jobs"] >= 1 and stats[V2[1]]["jobs"] >= 1
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_a_probe_is_joined_by_identical_requests(monkeypatch):
+    monkeypatch.setenv("YODA_POLL_MIN_INTERVAL", "0.01")
+    monkeypatch.setenv("YODA_POLL_MAX_INTERVAL", "0.01")
+    get_model_health().record(*V1, "success", 1.0)
+    post = respx.post(POST_URL).mock(
+        return_value=httpx.Response(
+            200, json={"success": True, "inference_job_token": "job"}
+        )
+    )
+    pending = {"status": {"status": "pending"}}
+    done = {"status": {"status": "complete_success"}}
+    done["maybe_result"] = {"media_links": {"cdn_url": "https://cdn.example.com/a"}}
+    respx.get(f"{GET_URL}job").mock(
+        side_effect=[httpx.Response(200, json={"success": True, "state": pending})] * 3
+        + [httpx.Response(200, json={"success": True, "state": done})]
+    )
+
+    # The first request probes V2; the second joins it rather than using V1
+    first = asyncio.create_task(synthesize("Hmm."))
+    await asyncio.sleep(0.01)
+    results = await asyncio.gather(first, synthesize("Hmm."))
+
+    assert post.call_count == 1
+    assert {result.model_token for result in results} == {V2[0]}
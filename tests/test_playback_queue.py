@@ -0,0 +1,128 @@
+import os
+import sys
+import threading
+import time
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from playback_queue import PlaybackQueue
+
+
+class RecordingPlayer:
+    """Blocking fake player that records order and detects overlap"""
+
+    def __init__(self, duration=0.01):
+        self.duration = duration
+        self.played = []
+        self.playing = 0
+        self.overlapped = False
+        self.stop = threading.Event()
+
+    def __call__(self, path):
+        self.playing += 1
+        self.overlapped |= self.playing > 1
+        self.stop.wait(self.duration)
+        self.stop.clear()
+        self.playing -= 1
+        self.played.append(path)
+        return path != "bad.wav"
+
+
+class TestPlaybackQueue:
+    """Test the background FIFO playback worker"""
+
+    def test_plays_in_order_without_overlap(self):
+        player = RecordingPlayer()
+        queue = PlaybackQueue(player)
+        for name in ["a.wav", "b.wav", "c.wav"]:
+            queue.enqueue(name)
+
+        assert queue.wait_idle(timeout=5)
+        assert player.played == ["a.wav", "b.wav", "c.wav"]
+        assert not player.overlapped
+        assert queue.status()["played"] == 3
+
+    def test_enqueue_returns_before_playback(self):
+        player = RecordingPlayer(duration=0.2)
+        queue = PlaybackQueue(player)
+
+        started = time.monotonic()
+        item = queue.enqueue("a.wav")
+        assert time.monotonic() - started < 0.1
+        assert not item.future.done()
+        assert item.future.result(timeout=5) is True
+
+    def test_on_done_runs_after_playback_and_failures_are_counted(self):
+        player = RecordingPlayer()
+        queue = PlaybackQueue(player)
+        done = []
+        queue.enqueue("bad.wav", on_done=lambda: done.append("bad.wav"))
+
+        assert queue.wait_idle(timeout=5)
+        assert done == ["bad.wav"]
+        assert queue.status()["failed"] == 1
+
+    def test_flush_drops_waiting_clips(self):
+        player = RecordingPlayer(duration=5)
+        queue = PlaybackQueue(player, stopper=player.stop.set)
+        queue.enqueue("a.wav")
+        waiting = queue.enqueue("b.wav")
+        while queue.status()["playing"] is None:
+            time.sleep(0.01)
+
+        assert queue.flush() == 1
+        assert waiting.future.result(timeout=1) is False
+        assert queue.skip()["path"] == "a.wav"
+        assert queue.wait_idle(timeout=5)
+        assert player.played == ["a.wav"]
+        assert queue.status()["skipped"] == 1
+
+    def test_status_lists_waiting_clips(self):
+        player = RecordingPlayer(duration=5)
+        queue = PlaybackQueue(player, stopper=player.stop.set)
+        first = queue.enqueue("a.wav", label="first")
+        second = queue.enqueue("b.wav", label="second")
+        while queue.status()["playing"] is None:
+            time.sleep(0.01)
+
+        status = queue.status()
+        assert status["playing"]["label"] == "first"
+        assert [item["label"] for item in status["queued"]] == ["second"]
+        assert queue.position(first) == 0
+        assert queue.position(second) == 1
+        queue.flush()
+        queue.skip()
+        assert queue.wait_idle(timeout=5)
+
+    def test_skip_with_nothing_playing(self):
+        assert PlaybackQueue(RecordingPlayer()).skip() is None
+
+    def test_skip_never_stops_the_next_clip(self):
+        first_ends = threading.Event()
+        stop = threading.Event()
+        interrupted = []
+
+        def player(path):
+            # Like the real backends, a new clip forgets earlier stops
+            stop.clear()
+            if path == "a.wav":
+                return first_ends.wait(5)
+            interrupted.append(stop.wait(0.2))
+            return True
+
+        def stopper():
+            # The first clip ends on its own just as the skip lands
+            first_ends.set()
+            time.sleep(0.05)
+            stop.set()
+
+        queue = PlaybackQueue(player, stopper)
+        queue.enqueue("a.wav")
+        queue.enqueue("b.wav")
+        while queue.status()["playing"] is None:
+            time.sleep(0.01)
+
+        assert queue.skip()["path"] == "a.wav"
+        assert queue.wait_idle(timeout=5)
+        assert interrupted == [False]
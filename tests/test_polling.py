@@ -0,0 +1,92 @@
+import os
+import sys
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from polling import PollScheduler, parse_retry_after
+
+
+def make_scheduler(clock, **kwargs):
+    # rng of 0.5 means "no jitter"
+    return PollScheduler(clock=clock, rng=lambda: 0.5, **kwargs)
+
+
+class TestPollScheduler:
+    """Test adaptive poll intervals, deadlines and phase timings"""
+
+    def test_pending_backs_off_exponentially_up_to_cap(self, clock):
+        scheduler = make_scheduler(clock, min_interval=0.5, max_interval=2.0)
+
+        delays = []
+        for _ in range(6):
+            delays.append(scheduler.next_delay())
+            scheduler.observe("pending")
+
+        assert delays[0] == 0.5
+        assert delays == sorted(delays)
+        assert delays[-1] == 2.0
+
+    def test_started_polls_fast(self, clock):
+        scheduler = make_scheduler(clock, fast_interval=0.25, max_interval=4.0)
+        for _ in range(5):
+            scheduler.observe("pending")
+        scheduler.observe("started")
+
+        assert scheduler.next_delay() == 0.25
+
+    def test_jitter_stays_within_bounds(self, clock):
+        low = PollScheduler(clock=clock, rng=lambda: 0.0, min_interval=1.0)
+        high = PollScheduler(clock=clock, rng=lambda: 1.0, min_interval=1.0)
+        assert 0.75 <= low.next_delay() < 1.0
+        assert 1.0 < high.next_delay() <= 1.25
+
+    def test_retry_after_overrides_backoff_once(self, clock):
+        scheduler = make_scheduler(clock, min_interval=0.5)
+        scheduler.rate_limited(3.0)
+
+        assert scheduler.next_delay() == 3.0
+        assert scheduler.next_delay() < 3.0
+
+    def test_delay_never_exceeds_deadline(self, clock):
+        scheduler = make_scheduler(clock, deadline=10.0)
+        clock.now += 9.9
+        scheduler.rate_limited(30.0)
+
+        assert abs(scheduler.next_delay() - 0.1) < 1e-9
+        clock.now += 0.1
+        assert scheduler.expired()
+
+    def test_stuck_only_when_pending_without_attempts(self, clock):
+        scheduler = make_scheduler(clock, pending_timeout=20.0)
+        scheduler.observe("pending", 0)
+        clock.now += 19
+        assert not scheduler.stuck()
+        clock.now += 1
+        assert scheduler.stuck()
+
+        # A new attempt from FakeYou counts as progress
+        scheduler.observe("pending", 1)
+        assert not scheduler.stuck()
+
+    def test_phase_timings(self, clock):
+        scheduler = make_scheduler(clock)
+        clock.now += 1
+        scheduler.observe("pending")
+        clock.now += 4
+        scheduler.observe("started")
+        clock.now += 2
+        scheduler.observe("complete_success")
+
+        timings = scheduler.finish()
+        assert timings["pending"] == 5.0
+        assert timings["started"] == 2.0
+        assert timings["total"] == 7.0
+        assert scheduler.polls == 3
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("5") == 5.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:10 GMT", now=1445412480) == 10.0
@@ -0,0 +1,156 @@
+import asyncio
+import json
+import os
+import sys
+
+import httpx
+import pytest
+import respx
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from audio_stream import wav_header
+from audio_cache import get_audio_cache
+from fakeyou import GET_URL, POST_URL, YODA_MODELS
+from metrics import get_metrics
+from prewarm import get_prewarmer, read_corpus
+from tools.prewarm_control import prewarm_start, prewarm_status, prewarm_stop
+
+# A tiny but valid wav clip
+AUDIO = wav_header(1, 2, 16000, 4) + b"\x00" * 4
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    path = tmp_path / "corpus.txt"
+    path.write_text(
+        "# Likely quotes\n"
+        "Do or do not.\n"
+        "\n"
+        "samples/1.wav|There is no try.\n"
+        "Do or do not.\n"
+        "Judge me by my size, do you?\n"
+    )
+    return path
+
+
+@pytest.fixture
+def fake_api(monkeypatch):
+    """Serve every job straight away, with one audio URL per job"""
+    monkeypatch.setenv("YODA_PREWARM_IDLE", "0")
+    monkeypatch.setenv("YODA_PREWARM_INTERVAL", "0")
+    monkeypatch.setenv("YODA_POLL_MIN_INTERVAL", "0")
+    monkeypatch.setenv("YODA_POLL_MAX_INTERVAL", "0")
+    with respx.mock:
+        jobs = iter(range(1000))
+
+        def submit(request):
+            job = f"job{next(jobs)}"
+            return httpx.Response(
+                200, json={"success": True, "inference_job_token": job}
+            )
+
+        def status(request, job):
+            done = {"status": {"status": "complete_success"}}
+            done["maybe_result"] = {
+                "media_links": {"cdn_url": f"https://cdn.example.com/{job}.wav"}
+            }
+            return httpx.Response(200, json={"success": True, "state": done})
+
+        post = respx.post(POST_URL).mock(side_effect=submit)
+        respx.get(url__regex=rf"{GET_URL}(?P<job>\w+)").mock(side_effect=status)
+        respx.get(url__startswith="https://cdn.example.com/").mock(
+            return_value=httpx.Response(200, content=AUDIO)
+        )
+        yield post
+
+
+async def wait_until_done(prewarmer):
+    for _ in range(200):
+        if not prewarmer.running:
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"Prewarming did not finish: {prewarmer.status()}")
+
+
+def test_read_corpus(corpus):
+    assert read_corpus(str(corpus)) == [
+        "Do or do not.",
+        "There is no try.",
+        "Judge me by my size, do you?",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_prewarm_fills_cache(corpus, fake_api):
+    cache = get_audio_cache()
+    model_token, model_name = YODA_MODELS[0]
+    cache.put(
+        "There is no try.", model_token, b"old", model_name=model_name, audio_url="u"
+    )
+
+    prewarmer = get_prewarmer()
+    prewarmer.start(str(corpus))
+    await wait_until_done(prewarmer)
+
+    status = prewarmer.status()
+    assert status["state"] == "finished"
+    assert (status["synthesized"], status["already_cached"]) == (2, 1)
+    assert fake_api.call_count == 2
+    # From whichever model was tried first, probes included
+    assert any(
+        cache.get("Judge me by my size, do you?", token) is not None
+        for token, _ in YODA_MODELS
+    )
+    # Prewarming does not count towards the hit rate
+    assert cache.stats()["hits"] == cache.stats()["misses"] == 0
+    saved = json.loads(open(prewarmer.state_path).read())
+    assert saved["position"] == 3
+
+
+@pytest.mark.asyncio
+async def test_prewarm_resumes(corpus, fake_api, tmp_path):
+    prewarmer = get_prewarmer()
+    prewarmer.start(str(corpus))
+    await wait_until_done(prewarmer)
+    fake_api.reset()
+
+    # Started again with the same corpus, nothing is left to do
+    prewarmer.start(str(corpus))
+    await wait_until_done(prewarmer)
+
+    assert fake_api.call_count == 0
+    assert prewarmer.status()["synthesized"] == 3
+
+
+@pytest.mark.asyncio
+async def test_prewarm_waits_for_idle_time(corpus, fake_api, monkeypatch):
+    monkeypatch.setattr("prewarm.CHECK_INTERVAL", 0.01)
+    span = get_metrics().span("quote_play")
+
+    prewarmer = get_prewarmer()
+    prewarmer.start(str(corpus))
+    await asyncio.sleep(0.1)
+    assert prewarmer.status()["state"] == "waiting"
+    assert fake_api.call_count == 0
+
+    span.finish("synthesized")
+    await wait_until_done(prewarmer)
+    assert fake_api.call_count == 3
+
+
+@pytest.mark.asyncio
+async def test_prewarm_tools(corpus, fake_api, monkeypatch):
+    monkeypatch.setenv("YODA_PREWARM_IDLE", "60")
+    assert prewarm_start()["isError"] is True
+
+    result = prewarm_start(str(corpus))
+    assert "3 of 3 quotes remain" in result["content"][0]["text"]
+    assert prewarm_start(str(corpus))["isError"] is True
+    status = json.loads(prewarm_status()["content"][0]["text"])
+    assert status["state"] == "waiting"
+
+    result = await prewarm_stop()
+    assert "Stopped" in result["content"][0]["text"]
+    assert get_prewarmer().status()["state"] == "stopped"
@@ -0,0 +1,141 @@
+import asyncio
+import json
+import os
+import sys
+from unittest.mock import patch
+
+import pytest
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from clips import Clip, ClipDownloadError
+from metrics import get_metrics
+from playback_queue import PlaybackQueue
+from synthesis import Synthesis, SynthesisError
+from tools.quote_batch import quote_batch
+
+
+def fake_fetch(delays, failures=(), in_flight=None):
+    """Fake fetch_clip where each quote takes delays[quote] seconds"""
+    in_flight = in_flight if in_flight is not None else {"now": 0, "max": 0}
+
+    async def fetch(quote):
+        in_flight["now"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        try:
+            await asyncio.sleep(delays[quote])
+        finally:
+            in_flight["now"] -= 1
+        if quote in failures:
+            raise SynthesisError(f"No result for {quote}")
+        return Clip(
+            quote=quote,
+            model_token="token",
+            model_name="Yoda (Version 1.0)",
+            audio_url=f"https://cdn/{quote}.wav",
+            path=f"/cache/{quote}.wav",
+            timings={"total": delays[quote]},
+        )
+
+    return fetch
+
+
+def parse(result):
+    return json.loads(result["content"][0]["text"])
+
+
+class TestQuoteBatch:
+    """Test the batch synthesis tool"""
+
+    @pytest.mark.asyncio
+    async def test_results_in_input_order_with_completion_order(self):
+        delays = {"slow": 0.05, "fast": 0.0}
+        with patch("tools.quote_batch.fetch_clip", fake_fetch(delays)):
+            result = await quote_batch(["slow", "fast"])
+
+        summary = parse(result)
+        assert result["isError"] is False
+        assert summary["succeeded"] == 2
+        assert [item["quote"] for item in summary["results"]] == ["slow", "fast"]
+        assert summary["results"][0]["completed_order"] == 2
+        assert summary["results"][1]["completed_order"] == 1
+        assert summary["results"][0]["path"] == "/cache/slow.wav"
+        assert summary["results"][0]["status"] == "synthesized"
+
+    @pytest.mark.asyncio
+    async def test_runs_concurrently_under_limit(self, monkeypatch):
+        monkeypatch.setenv("YODA_BATCH_CONCURRENCY", "2")
+        quotes = [f"q{i}" for i in range(6)]
+        in_flight = {"now": 0, "max": 0}
+        fetch = fake_fetch({q: 0.02 for q in quotes}, in_flight=in_flight)
+        with patch("tools.quote_batch.fetch_clip", fetch):
+            summary = parse(await quote_batch(quotes))
+
+        assert in_flight["max"] == 2
+        assert summary["succeeded"] == 6
+
+    @pytest.mark.asyncio
+    async def test_failures_are_reported_per_item(self):
+        delays = {"good": 0, "bad": 0}
+        with patch("tools.quote_batch.fetch_clip", fake_fetch(delays, {"bad"})):
+            summary = parse(await quote_batch(["good", "bad"]))
+
+        assert summary["succeeded"] == 1
+        assert summary["results"][1]["status"] == "failed"
+        assert "No result for bad" in summary["results"][1]["error"]
+
+    @pytest.mark.asyncio
+    async def test_download_failure_keeps_audio_url(self):
+        async def fetch(quote):
+            synthesis = Synthesis("token", "Yoda (Version 2.0)", "https://cdn/x.wav")
+            raise ClipDownloadError(synthesis, RuntimeError("404"))
+
+        with patch("tools.quote_batch.fetch_clip", fetch):
+            result = await quote_batch(["x"])
+
+        item = parse(result)["results"][0]
+        assert result["isError"] is True
+        assert item["status"] == "download_failed"
+        assert item["audio_url"] == "https://cdn/x.wav"
+
+    @pytest.mark.asyncio
+    async def test_playback_is_in_input_order(self):
+        delays = {"first": 0.05, "second": 0.0, "third": 0.01}
+        played = []
+
+        def record(path):
+            played.append(path)
+            return True
+
+        queue = PlaybackQueue(record)
+        with patch("tools.quote_batch.fetch_clip", fake_fetch(delays)):
+            with patch("tools.quote_batch.get_playback_queue", return_value=queue):
+                summary = parse(await quote_batch(list(delays), play=True))
+
+        assert queue.wait_idle(timeout=5)
+        assert played == ["/cache/first.wav", "/cache/second.wav", "/cache/third.wav"]
+        assert [item["playback_id"] for item in summary["results"]] == [1, 2, 3]
+
+    @pytest.mark.asyncio
+    async def test_empty_batch(self):
+        result = await quote_batch([])
+        assert result["isError"] is True
+
+    @pytest.mark.asyncio
+    async def test_unexpected_error_fails_only_its_quote(self):
+        fetch = fake_fetch({"good": 0.01})
+
+        async def flaky(quote):
+            if quote == "bad":
+                raise BrokenPipeError("worker pipe closed")
+            return await fetch(quote)
+
+        with patch("tools.quote_batch.fetch_clip", flaky):
+            summary = parse(await quote_batch(["good", "bad"]))
+
+        assert summary["succeeded"] == 1
+        assert summary["results"][1]["status"] == "error"
+        assert "BrokenPipeError" in summary["results"][1]["error"]
+        # Every span finished, so the server counts as idle again
+        assert get_metrics().idle_for() is not None
@@ -0,0 +1,156 @@
+import asyncio
+import io
+import json
+import os
+import sys
+
+import httpx
+import pytest
+import respx
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from audio_stream import wav_header
+from fakeyou import POST_URL, stream_download
+from metrics import get_metrics
+from rate_limit import RateLimiter, get_rate_limiter
+from synthesis import SynthesisError, synthesize_with_model
+from tools.server_stats import server_stats
+
+# A tiny but valid wav clip
+AUDIO = wav_header(1, 2, 16000, 4) + b"\x00" * 4
+
+
+@pytest.fixture
+def clock(clock, monkeypatch):
+    """The shared fake clock, moved on only when the limiter sleeps"""
+    real_sleep = asyncio.sleep
+
+    async def sleep(delay):
+        clock.now += delay
+        await real_sleep(0)
+
+    monkeypatch.setattr("rate_limit.asyncio.sleep", sleep)
+    return clock
+
+
+class TestRateLimiter:
+    """Test the token bucket"""
+
+    @pytest.mark.asyncio
+    async def test_burst_then_paced(self, clock):
+        limiter = RateLimiter("post", rate=2.0, burst=3, clock=clock)
+
+        waits = [await limiter.acquire() for _ in range(5)]
+
+        assert waits == [0.0, 0.0, 0.0, 0.5, 0.5]
+        assert limiter.stats()["acquired"] == 5
+
+    @pytest.mark.asyncio
+    async def test_waiters_served_in_order(self, clock):
+        limiter = RateLimiter("poll", rate=1.0, burst=1, clock=clock)
+        order = []
+
+        async def take(index):
+            await limiter.acquire()
+            order.append(index)
+
+        await asyncio.gather(*(take(index) for index in range(5)))
+
+        assert order == [0, 1, 2, 3, 4]
+        assert clock.now == 4.0
+
+    @pytest.mark.asyncio
+    async def test_penalize_blocks_every_caller(self, clock):
+        limiter = RateLimiter("poll", rate=10.0, burst=5, clock=clock)
+
+        assert limiter.penalize(3.0) == 3.0
+        assert limiter.stats()["blocked_for"] == 3.0
+        assert await limiter.acquire() == pytest.approx(3.1)
+
+    def test_backoff_without_retry_after(self, clock):
+        limiter = RateLimiter("post", rate=1.0, clock=clock)
+
+        assert [limiter.penalize() for _ in range(3)] == [1.0, 2.0, 4.0]
+        limiter.succeeded()
+        assert limiter.penalize() == 1.0
+
+    @pytest.mark.asyncio
+    async def test_zero_rate_is_unlimited(self, monkeypatch):
+        monkeypatch.setenv("YODA_RATE_POLL", "0")
+        limiter = get_rate_limiter("poll")
+
+        for _ in range(50):
+            assert await limiter.acquire() < 0.1
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_rate_limited_post_is_retried(monkeypatch):
+    monkeypatch.setenv("YODA_POLL_MIN_INTERVAL", "0")
+    monkeypatch.setenv("YODA_POLL_MAX_INTERVAL", "0")
+    post = respx.post(POST_URL).mock(
+        side_effect=[
+            httpx.Response(429, headers={"Retry-After": "0"}),
+            httpx.Response(200, json={"success": True, "inference_job_token": "job"}),
+        ]
+    )
+    done = {"status": {"status": "complete_success"}}
+    done["maybe_result"] = {"media_links": {"cdn_url": "https://cdn/a.wav"}}
+    respx.get(url__regex=r".*/job_status/job").mock(
+        return_value=httpx.Response(200, json={"success": True, "state": done})
+    )
+
+    result = await synthesize_with_model("Hmm", "token_v1", "Yoda (Version 1.0)")
+
+    assert post.call_count == 2
+    # Both attempts carry the same idempotency token
+    tokens = {
+        json.loads(call.request.content)["uuid_idempotency_token"]
+        for call in post.calls
+    }
+    assert len(tokens) == 1
+    assert result.audio_url == "https://cdn/a.wav"
+    assert get_metrics().counter("yoda_rate_limited_total", endpoint="post") == 1
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_rate_limited_post_gives_up_past_max_wait(monkeypatch):
+    monkeypatch.setenv("YODA_RATE_MAX_WAIT", "5")
+    post = respx.post(POST_URL).mock(
+        return_value=httpx.Response(429, headers={"Retry-After": "60"})
+    )
+
+    with pytest.raises(SynthesisError) as excinfo:
+        await synthesize_with_model("Hmm", "token_v1", "Yoda (Version 1.0)")
+
+    assert excinfo.value.reason == "rate_limited"
+    assert post.call_count == 1
+    assert get_rate_limiter("post").stats()["blocked_for"] > 50
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_download_retries_after_429():
+    url = "https://cdn.example.com/a.wav"
+    respx.get(url).mock(
+        side_effect=[
+            httpx.Response(429, headers={"Retry-After": "0"}),
+            httpx.Response(200, content=AUDIO),
+        ]
+    )
+    sink = io.BytesIO()
+
+    assert await stream_download(url, sink) == len(AUDIO)
+    assert sink.getvalue() == AUDIO
+    assert get_rate_limiter("download").stats()["rate_limited"] == 1
+
+
+def test_server_stats_reports_limiters():
+    get_rate_limiter("post").penalize(2.0)
+
+    stats = json.loads(server_stats()["content"][0]["text"])
+
+    assert stats["rate_limits"]["post"]["rate_limited"] == 1
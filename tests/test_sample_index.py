@@ -0,0 +1,76 @@
+import os
+import sys
+import threading
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from sample_index import SampleIndex, open_sample_index
+
+
+def make_samples_dir(path, clips):
+    path.mkdir()
+    lines = []
+    for number, text in clips.items():
+        (path / f"{number}.wav").write_bytes(b"not really a wav")
+        lines.append(f"samples/{number}.wav|{text}\n")
+    (path / "transcript.txt").write_text("".join(lines))
+
+
+def test_reserve_and_find(tmp_path):
+    index = SampleIndex(str(tmp_path / "index.sqlite3"))
+    first = index.reserve("Do or do not.", "weight_1", "Yoda")
+    second = index.reserve("There is no try.")
+    assert (first, second) == (1, 2)
+
+    # Unfinished clips are not found
+    assert index.find("Do or do not.") is None
+    index.complete(first, 1.5)
+    sample = index.find("Do or do not.")
+    assert (sample.id, sample.model_name, sample.duration) == (1, "Yoda", 1.5)
+    assert sample.name == "1.wav"
+
+    # A discarded number is never handed out again
+    index.discard(second)
+    assert index.reserve("There is no try.") == 3
+    assert index.count() == 1
+
+
+def test_concurrent_writers_get_distinct_numbers(tmp_path):
+    path = str(tmp_path / "index.sqlite3")
+    # Two connections stand in for two sampler processes
+    indexes = [SampleIndex(path), SampleIndex(path)]
+    numbers = []
+
+    def reserve(index):
+        for i in range(50):
+            numbers.append(index.reserve(f"line {i}"))
+
+    threads = [
+        threading.Thread(target=reserve, args=(index,))
+        for index in indexes
+        for _ in range(2)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(numbers) == list(range(1, 201))
+
+
+def test_imports_existing_transcript(tmp_path):
+    samples = tmp_path / "samples"
+    make_samples_dir(samples, {1: "Do or do not.", 2: "There is no try."})
+    # A clip on disk but missing from the transcript
+    (samples / "7.wav").write_bytes(b"orphan")
+
+    index = open_sample_index(str(samples))
+    assert index.count() == 2
+    assert index.find("There is no try.").id == 2
+    assert index.reserve("Hmm.") == 8
+    index.close()
+
+    # Only imported once
+    index = open_sample_index(str(samples))
+    assert index.count() == 2
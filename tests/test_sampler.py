@@ -0,0 +1,225 @@
+import io
+import json
+import os
+import struct
+import sys
+import threading
+import time
+import wave
+
+import httpx
+import pytest
+import respx
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from audio_stream import parse_wav_header
+from fakeyou import GET_URL, POST_URL
+from clip_archive import ClipArchive
+from sampler import (
+    SampleWriter,
+    build_dataset,
+    pack_samples,
+    SAMPLE_MODEL,
+    read_lines,
+    to_sample_format,
+    unpack_samples,
+)
+
+
+def make_wav(samples, frame_rate=16000):
+    """Build an in-memory mono 16-bit wav of the given samples"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(frame_rate)
+        wav.writeframes(struct.pack(f"<{len(samples)}h", *samples))
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def fake_api(monkeypatch):
+    """Serve every job straight away; POSTs of "Fail." are rejected"""
+    monkeypatch.setenv("YODA_POLL_MIN_INTERVAL", "0")
+    monkeypatch.setenv("YODA_POLL_MAX_INTERVAL", "0")
+    with respx.mock:
+        jobs = iter(range(1000))
+
+        def submit(request):
+            if json.loads(request.content)["inference_text"] == "Fail.":
+                return httpx.Response(500)
+            job = f"job{next(jobs)}"
+            return httpx.Response(
+                200, json={"success": True, "inference_job_token": job}
+            )
+
+        def status(request, job):
+            done = {"status": {"status": "complete_success"}}
+            done["maybe_result"] = {
+                "media_links": {"cdn_url": f"https://cdn.example.com/{job}.wav"}
+            }
+            return httpx.Response(200, json={"success": True, "state": done})
+
+        post = respx.post(POST_URL).mock(side_effect=submit)
+        respx.get(url__regex=rf"{GET_URL}(?P<job>\w+)").mock(side_effect=status)
+        respx.get(url__startswith="https://cdn.example.com/").mock(
+            return_value=httpx.Response(200, content=make_wav([1] * 160))
+        )
+        yield post
+
+
+def read_transcript(samples_dir):
+    return (samples_dir / "transcript.txt").read_text().splitlines()
+
+
+def test_only_non_pcm_audio_goes_to_ffmpeg(monkeypatch):
+    converted = []
+    monkeypatch.setattr(
+        "sampler._ffmpeg_to_sample_format",
+        lambda audio: converted.append(audio) or b"ffmpeg",
+    )
+
+    # Resampling 16 kHz up is done in-process
+    sample = to_sample_format(make_wav([1] * 160))
+    assert parse_wav_header(sample).frame_rate == 22050
+    assert not converted
+    assert to_sample_format(b"ID3 an mp3 clip") == b"ffmpeg"
+
+
+def test_read_lines(tmp_path):
+    text = tmp_path / "lines.txt"
+    text.write_text("# Quotes\nDo or do not.\n\n  There  is no try. \nDo or do not.\n")
+    assert read_lines(str(text)) == ["Do or do not.", "There is no try."]
+
+    jsonl = tmp_path / "lines.jsonl"
+    jsonl.write_text('{"text": "Do or do not.", "id": 1}\n\n"Hmm.\\nYes."\n')
+    assert read_lines(str(jsonl)) == ["Do or do not.", "Hmm. Yes."]
+
+    jsonl.write_text('{"id": 1}\n')
+    with pytest.raises(ValueError):
+        read_lines(str(jsonl))
+
+
+def test_writer_resumes_numbering(tmp_path):
+    samples = tmp_path / "samples"
+    writer = SampleWriter(str(samples))
+    writer.add("Do or do not.", make_wav([1] * 10))
+    # A run that crashed after taking a number
+    writer.index.reserve("Lost, this clip is.")
+    writer.close()
+
+    writer = SampleWriter(str(samples))
+    assert writer.has("Do or do not.")
+    assert not writer.has("Lost, this clip is.")
+    assert writer.add("There is no try.", make_wav([2] * 10)).endswith("3.wav")
+    assert read_transcript(samples) == [
+        "samples/1.wav|Do or do not.",
+        "samples/3.wav|There is no try.",
+    ]
+
+
+def test_writer_repairs_short_transcript(tmp_path):
+    samples = tmp_path / "samples"
+    writer = SampleWriter(str(samples))
+    writer.add("Do or do not.", make_wav([1] * 10))
+    writer.add("There is no try.", make_wav([2] * 10))
+    # As if a crash came between indexing a clip and listing it
+    (samples / "transcript.txt").write_text("samples/1.wav|Do or do not.\n")
+
+    assert writer.sync_transcript()
+    assert len(read_transcript(samples)) == 2
+    assert not writer.sync_transcript()
+
+
+def test_repair_waits_for_a_clip_being_listed(tmp_path):
+    samples = tmp_path / "samples"
+    adder, repairer = SampleWriter(str(samples)), SampleWriter(str(samples))
+    repairs = []
+    complete = adder.index.complete
+
+    def complete_then_repair(sample_id, duration=None):
+        complete(sample_id, duration)
+        # Another run repairs the transcript before this clip's line is in
+        repair = threading.Thread(
+            target=lambda: repairs.append(repairer.sync_transcript())
+        )
+        repair.start()
+        repair.join(timeout=0.2)
+
+    adder.index.complete = complete_then_repair
+    adder.add("Do or do not.", make_wav([1] * 10))
+    while not repairs:
+        time.sleep(0.01)
+
+    assert repairs == [False]
+    assert read_transcript(samples) == ["samples/1.wav|Do or do not."]
+
+
+@pytest.mark.asyncio
+async def test_build_dataset(tmp_path, fake_api):
+    samples = tmp_path / "samples"
+    lines = ["Do or do not.", "Fail.", "There is no try.", "Hmm."]
+
+    summary = await build_dataset(lines, str(samples), workers=2)
+
+    assert summary == {"total": 4, "skipped": 0, "written": 3, "failed": 1}
+    # Every clip is in the sampler's one voice, with no fallback to another
+    tokens = {
+        json.loads(call.request.content)["tts_model_token"] for call in fake_api.calls
+    }
+    assert tokens == {SAMPLE_MODEL[0]}
+    transcript = read_transcript(samples)
+    assert sorted(line.split("|")[1] for line in transcript) == sorted(
+        ["Do or do not.", "There is no try.", "Hmm."]
+    )
+    with wave.open(str(samples / "1.wav"), "rb") as wav:
+        assert (wav.getnchannels(), wav.getsampwidth(), wav.getframerate()) == (
+            1,
+            2,
+            22050,
+        )
+
+    # A second run only retries the line that failed
+    fake_api.reset()
+    summary = await build_dataset(lines, str(samples))
+    assert summary == {"total": 4, "skipped": 3, "written": 0, "failed": 1}
+    assert fake_api.call_count == 1
+
+
+def test_pack_and_unpack_samples(tmp_path):
+    samples = tmp_path / "samples"
+    writer = SampleWriter(str(samples))
+    writer.add("Do or do not.", make_wav([1] * 100))
+    writer.add("There is no try.", make_wav([2] * 200))
+    writer.close()
+
+    assert pack_samples(str(samples), "lzma") == {
+        "packed": 2,
+        "already": 0,
+        "missing": 0,
+    }
+    assert not (samples / "1.wav").exists()
+    # Packed clips still count as written
+    writer = SampleWriter(str(samples))
+    assert writer.has("There is no try.")
+    writer.close()
+
+    assert unpack_samples(str(samples)) == 2
+    assert (samples / "2.wav").read_bytes() == make_wav([2] * 200)
+
+
+@pytest.mark.asyncio
+async def test_build_into_archive(tmp_path, fake_api):
+    samples = tmp_path / "samples"
+
+    summary = await build_dataset(
+        ["Do or do not.", "Hmm."], str(samples), archive_codec="adpcm"
+    )
+
+    assert summary["written"] == 2
+    assert not (samples / "1.wav").exists()
+    archive = ClipArchive(str(samples / "archive"))
+    assert parse_wav_header(archive.read_text("Hmm.")).frame_rate == 22050
+    assert len((samples / "transcript.txt").read_text().splitlines()) == 2
@@ -0,0 +1,135 @@
+import asyncio
+import os
+import sys
+
+import httpx
+import pytest
+import respx
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from audio_stream import wav_header
+from fakeyou import GET_URL, POST_URL
+from metrics import get_metrics
+from single_flight import SingleFlight
+from tools.quote_play import quote_play
+
+# A tiny but valid wav clip
+AUDIO = wav_header(1, 2, 16000, 4) + b"\x00" * 4
+
+
+class TestSingleFlight:
+    """Test coalescing of concurrent calls"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_calls_share_one_run(self):
+        flights = SingleFlight("test")
+        calls = 0
+
+        async def work():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "done"
+
+        results = await asyncio.gather(*(flights.do("key", work) for _ in range(3)))
+
+        assert results == ["done"] * 3
+        assert calls == 1
+        assert flights.in_flight() == 0
+        assert (
+            get_metrics().counter("yoda_single_flight_joined_total", kind="test") == 2
+        )
+
+    @pytest.mark.asyncio
+    async def test_errors_are_shared_and_not_cached(self):
+        flights = SingleFlight("test")
+        calls = 0
+
+        async def work():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0)
+            raise ValueError("no")
+
+        results = await asyncio.gather(
+            flights.do("key", work), flights.do("key", work), return_exceptions=True
+        )
+        assert [type(result) for result in results] == [ValueError, ValueError]
+        with pytest.raises(ValueError):
+            await flights.do("key", work)
+        assert calls == 2
+
+    @pytest.mark.asyncio
+    async def test_one_caller_cancelling_leaves_the_others(self):
+        flights = SingleFlight("test")
+        release = asyncio.Event()
+
+        async def work():
+            await release.wait()
+            return "done"
+
+        first = asyncio.create_task(flights.do("key", work))
+        second = asyncio.create_task(flights.do("key", work))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+
+        assert await second == "done"
+        assert first.cancelled()
+
+    @pytest.mark.asyncio
+    async def test_cancelled_when_every_caller_gives_up(self):
+        flights = SingleFlight("test")
+        cancelled = asyncio.Event()
+
+        async def work():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        callers = [asyncio.create_task(flights.do("key", work)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+
+        await asyncio.wait_for(cancelled.wait(), 1)
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_identical_quotes_share_job_and_download(monkeypatch):
+    monkeypatch.setenv("YODA_POLL_MIN_INTERVAL", "0")
+    monkeypatch.setenv("YODA_POLL_MAX_INTERVAL", "0")
+    audio_url = "https://example.com/audio.wav"
+    post = respx.post(POST_URL).mock(
+        return_value=httpx.Response(
+            200, json={"success": True, "inference_job_token": "job"}
+        )
+    )
+    done = {"status": {"status": "complete_success"}}
+    done["maybe_result"] = {"media_links": {"cdn_url": audio_url}}
+    respx.get(f"{GET_URL}job").mock(
+        return_value=httpx.Response(200, json={"success": True, "state": done})
+    )
+    download = respx.get(audio_url).mock(
+        return_value=httpx.Response(200, content=AUDIO)
+    )
+
+    results = await asyncio.gather(
+        quote_play("Do or do not."),
+        quote_play("  Do or do not. "),
+    )
+
+    assert all(not result.get("isError") for result in results)
+    # The same quote, give or take whitespace, is one job and one download
+    assert post.call_count == 1
+    assert download.call_count == 1
+    metrics = get_metrics()
+    assert metrics.counter("yoda_single_flight_joined_total", kind="job") == 1
+    assert metrics.counter("yoda_single_flight_joined_total", kind="download") == 1
@@ -0,0 +1,48 @@
+import json
+import os
+import subprocess
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(__file__), "..", "src")
+
+# Seconds allowed for importing and registering every tool, on top of the mcp
+# package itself. Measured at ~0.1 s; see "Startup time" in the README.
+STARTUP_BUDGET = float(os.environ.get("YODA_STARTUP_BUDGET", "0.15"))
+
+MEASURE = """
+import json, sys, time
+from mcp.server.fastmcp import FastMCP
+started = time.perf_counter()
+from registry import register_all_tools
+register_all_tools(FastMCP("startup"))
+print(json.dumps({
+    "seconds": time.perf_counter() - started,
+    "audio_modules": sorted({"pygame", "simpleaudio"} & set(sys.modules)),
+}))
+"""
+
+
+def measure_registration():
+    """Import and register the tools in a fresh interpreter"""
+    result = subprocess.run(
+        [sys.executable, "-c", MEASURE],
+        cwd=SRC_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # Anything else on stdout would corrupt the stdio transport
+    (line,) = result.stdout.splitlines()
+    return json.loads(line)
+
+
+def test_registration_does_not_load_audio():
+    assert measure_registration()["audio_modules"] == []
+
+
+def test_registration_within_budget():
+    # Best of three, to ride out a busy machine
+    seconds = min(measure_registration()["seconds"] for _ in range(3))
+    assert seconds < STARTUP_BUDGET, (
+        f"Registering tools took {seconds:.3f}s, over the {STARTUP_BUDGET}s budget"
+    )
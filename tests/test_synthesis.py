@@ -0,0 +1,162 @@
+import asyncio
+import math
+import os
+import sys
+from unittest.mock import patch
+
+import httpx
+import pytest
+import respx
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from fakeyou import GET_URL, POST_URL
+from synthesis import (
+    Synthesis,
+    SynthesisError,
+    hedge_delay_from_env,
+    synthesize,
+    synthesize_with_model,
+)
+
+MODELS = [("token_v1", "Yoda (Version 1.0)"), ("token_v2", "Yoda (Version 2.0)")]
+
+
+def fake_models(behaviour):
+    """Replace synthesize_with_model with per-model (delay, url-or-error) fakes"""
+    started = []
+    cancelled = []
+
+    async def fake(quote, model_token, model_name):
+        started.append(model_token)
+        delay, outcome = behaviour[model_token]
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            cancelled.append(model_token)
+            raise
+        if isinstance(outcome, Exception):
+            raise outcome
+        return Synthesis(model_token, model_name, outcome)
+
+    return patch("synthesis.synthesize_with_model", fake), started, cancelled
+
+
+class TestSynthesize:
+    """Test sequential and hedged model selection"""
+
+    @pytest.mark.asyncio
+    async def test_sequential_falls_back_after_failure(self):
+        patcher, started, _ = fake_models(
+            {
+                "token_v1": (0, SynthesisError("v1 down")),
+                "token_v2": (0, "https://cdn/v2.wav"),
+            }
+        )
+        with patcher:
+            result = await synthesize("Hmm", MODELS, hedge_delay=math.inf)
+
+        assert result.model_token == "token_v2"
+        assert result.audio_url == "https://cdn/v2.wav"
+        assert started == ["token_v1", "token_v2"]
+
+    @pytest.mark.asyncio
+    async def test_sequential_never_submits_second_on_success(self):
+        patcher, started, _ = fake_models(
+            {"token_v1": (0.05, "https://cdn/v1.wav"), "token_v2": (0, "unused")}
+        )
+        with patcher:
+            result = await synthesize("Hmm", MODELS, hedge_delay=math.inf)
+
+        assert result.model_name == "Yoda (Version 1.0)"
+        assert started == ["token_v1"]
+
+    @pytest.mark.asyncio
+    async def test_parallel_fastest_wins_and_loser_is_cancelled(self):
+        patcher, started, cancelled = fake_models(
+            {
+                "token_v1": (5, "https://cdn/v1.wav"),
+                "token_v2": (0.01, "https://cdn/v2.wav"),
+            }
+        )
+        with patcher:
+            result = await synthesize("Hmm", MODELS, hedge_delay=0)
+
+        assert result.model_token == "token_v2"
+        assert started == ["token_v1", "token_v2"]
+        assert cancelled == ["token_v1"]
+
+    @pytest.mark.asyncio
+    async def test_hedge_delay_submits_second_model_late(self):
+        patcher, started, cancelled = fake_models(
+            {
+                "token_v1": (5, "https://cdn/v1.wav"),
+                "token_v2": (0, "https://cdn/v2.wav"),
+            }
+        )
+        loop = asyncio.get_running_loop()
+        begin = loop.time()
+        with patcher:
+            result = await synthesize("Hmm", MODELS, hedge_delay=0.05)
+
+        assert result.model_token == "token_v2"
+        assert loop.time() - begin >= 0.05
+        assert cancelled == ["token_v1"]
+
+    @pytest.mark.asyncio
+    async def test_hedge_not_needed_when_first_model_is_fast(self):
+        patcher, started, _ = fake_models(
+            {"token_v1": (0, "https://cdn/v1.wav"), "token_v2": (0, "unused")}
+        )
+        with patcher:
+            result = await synthesize("Hmm", MODELS, hedge_delay=1)
+
+        assert result.model_token == "token_v1"
+        assert started == ["token_v1"]
+
+    @pytest.mark.asyncio
+    async def test_all_models_fail(self):
+        patcher, _, _ = fake_models(
+            {
+                "token_v1": (0, SynthesisError("v1 down")),
+                "token_v2": (0.01, SynthesisError("v2 down")),
+            }
+        )
+        with patcher:
+            with pytest.raises(SynthesisError, match="v2 down"):
+                await synthesize("Hmm", MODELS, hedge_delay=0)
+
+
+def test_hedge_delay_defaults_to_sequential(monkeypatch):
+    monkeypatch.delenv("YODA_HEDGE_DELAY", raising=False)
+    assert math.isinf(hedge_delay_from_env())
+    monkeypatch.setenv("YODA_HEDGE_DELAY", "1.5")
+    assert hedge_delay_from_env() == 1.5
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_status_poll_honours_retry_after(monkeypatch):
+    monkeypatch.setenv("YODA_POLL_MIN_INTERVAL", "0")
+    monkeypatch.setenv("YODA_POLL_MAX_INTERVAL", "0")
+    respx.post(POST_URL).mock(
+        return_value=httpx.Response(
+            200, json={"success": True, "inference_job_token": "job"}
+        )
+    )
+    done = {"status": {"status": "complete_success"}}
+    done["maybe_result"] = {"media_links": {"cdn_url": "https://cdn/a.wav"}}
+    status = respx.get(f"{GET_URL}job").mock(
+        side_effect=[
+            httpx.Response(429, headers={"Retry-After": "0"}),
+            httpx.Response(200, json={"success": True, "state": done}),
+        ]
+    )
+
+    result = await synthesize_with_model("Hmm", "token_v1", "Yoda (Version 1.0)")
+
+    assert status.call_count == 2
+    assert result.audio_url == "https://cdn/a.wav"
+    assert result.polls == 1
+    assert "total" in result.timings
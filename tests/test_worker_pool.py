@@ -0,0 +1,156 @@
+import asyncio
+import json
+import os
+import sys
+from contextlib import asynccontextmanager
+
+import pytest
+
+# Add the src and benchmarks directories to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+from audio_cache import get_audio_cache
+from clips import fetch_clip, lookup_clip
+from fakeyou_stub import FakeYouStub, StubConfig
+from synthesis import SynthesisError
+from tools.quote_play import quote_play
+from tools.server_stats import server_stats
+from worker_pool import (
+    WorkerError,
+    get_worker_pool,
+    start_worker_pool,
+    stop_worker_pool,
+    worker_env,
+)
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    """Run the FakeYou stand-in; worker processes inherit its URL"""
+    monkeypatch.setenv("YODA_POLL_MIN_INTERVAL", "0.01")
+    monkeypatch.setenv("YODA_POLL_FAST_INTERVAL", "0.01")
+    with FakeYouStub(StubConfig(queue_delay=0.2, synth_delay=0.1, seed=1)) as stub:
+        monkeypatch.setenv("YODA_FAKEYOU_API_URL", stub.url)
+        yield stub
+
+
+@asynccontextmanager
+async def worker_pool(monkeypatch, workers=2):
+    monkeypatch.setenv("YODA_WORKERS", str(workers))
+    pool = await start_worker_pool()
+    try:
+        yield pool
+    finally:
+        await stop_worker_pool()
+
+
+def test_worker_env_splits_rate_limits(monkeypatch, tmp_path):
+    monkeypatch.setenv("YODA_RATE_POST", "3")
+    monkeypatch.setenv("YODA_JOB_JOURNAL", str(tmp_path / "jobs.json"))
+
+    env = worker_env(1, 2)
+
+    assert float(env["YODA_RATE_POST"]) == 1.5
+    assert float(env["YODA_RATE_POLL"]) == 2.5
+    assert env["YODA_RATE_BURST_POST"] == "2"
+    # Journals are kept per process anyway
+    assert "YODA_JOB_JOURNAL" not in env
+
+
+@pytest.mark.asyncio
+async def test_no_pool_unless_configured():
+    assert await start_worker_pool() is None
+    assert get_worker_pool() is None
+
+
+@pytest.mark.asyncio
+async def test_workers_share_the_cache(stub, monkeypatch):
+    async with worker_pool(monkeypatch):
+        quotes = [f"Quote number {i}, this is." for i in range(4)]
+
+        clips = await asyncio.gather(*(fetch_clip(quote) for quote in quotes))
+
+        assert all(clip.path and os.path.exists(clip.path) for clip in clips)
+        assert {clip.quote for clip in clips} == set(quotes)
+        # Cached by the workers, found by the front process
+        assert lookup_clip(quotes[0]).path == clips[0].path
+        assert get_audio_cache().get(quotes[1], clips[1].model_token) is not None
+        assert stub.stats.posts == 4
+
+        # The jobs were spread over both workers
+        workers = json.loads(server_stats()["content"][0]["text"])["workers"]
+        assert [worker["completed"] for worker in workers.values()] == [2, 2]
+        assert all(worker["peak_in_flight"] == 2 for worker in workers.values())
+        assert all(worker["in_flight"] == 0 for worker in workers.values())
+
+
+@pytest.mark.asyncio
+async def test_identical_quotes_share_one_job(stub, monkeypatch):
+    async with worker_pool(monkeypatch) as pool:
+        clips = await asyncio.gather(
+            *(fetch_clip("Hmm.  Patience.") for _ in range(3)),
+            fetch_clip("Hmm. Patience."),
+        )
+
+        assert stub.stats.posts == 1
+        assert len({clip.path for clip in clips}) == 1
+        assert sum(w["completed"] for w in pool.stats().values()) == 1
+
+
+@pytest.mark.asyncio
+async def test_quote_play_on_a_worker(stub, monkeypatch):
+    async with worker_pool(monkeypatch) as pool:
+        result = await quote_play("Do or do not.")
+
+        assert not result.get("isError")
+        assert "Queued with" in result["content"][0]["text"]
+        assert sum(w["completed"] for w in pool.stats().values()) == 1
+
+
+@pytest.mark.asyncio
+async def test_workers_pass_on_progress(stub, monkeypatch, make_context):
+    async with worker_pool(monkeypatch):
+        ctx = make_context()
+        await quote_play("Patience, you must have.", ctx)
+
+    stages = [message["stage"] for message in ctx.messages]
+    assert stages[0] == "queued"
+    assert stages[-3:] == ["started", "downloading", "playing"]
+    assert ctx.progress == [(1, 4), (2, 4), (3, 4), (4, 4)]
+
+
+@pytest.mark.asyncio
+async def test_failed_jobs_are_reported(stub, monkeypatch):
+    async with worker_pool(monkeypatch) as pool:
+        stub.config.fail_rate = 1.0
+
+        with pytest.raises(SynthesisError):
+            await fetch_clip("Fail, this will.")
+
+        assert sum(w["failed"] for w in pool.stats().values()) == 1
+
+
+async def kill(worker):
+    worker.process.kill()
+    await asyncio.to_thread(worker.process.join)
+    # The front process notices once the pipe closes
+    for _ in range(100):
+        if not worker.alive:
+            return
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_dead_worker_gets_no_jobs(stub, monkeypatch):
+    async with worker_pool(monkeypatch) as pool:
+        await kill(pool.workers[0])
+
+        clip = await fetch_clip("Still here, I am.")
+        assert clip.path is not None
+        assert pool.stats()["0"]["alive"] is False
+        assert pool.stats()["1"]["completed"] == 1
+
+        await kill(pool.workers[1])
+        with pytest.raises(WorkerError):
+            await fetch_clip("Nobody left, there is.")